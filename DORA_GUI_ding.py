@@ -1,6 +1,9 @@
 
 
 # imports.
+import os, sys
+import cPickle
+import numpy as np
 import pygame
 import dataTypes_DING
 import basicRunDORA_DING
@@ -39,6 +42,8 @@ class Node(object):
         self.name = mynode.name
         self.type = mynode.my_type
         self.act = 0.0
+        self.drawn_width = 0 # the width in pixels of my activation bar as last drawn (see update_node_acts()).
+        self.on_screen = True # whether I am drawn (see cull_GUI_Nodes()).
         self.rect = (x_location, y_location, width, height) # where I will be drawn on the screen.
         self.text_rect = (x_location, y_location, width, self.rect[3]/3) # where my text is drawn.
         # different act_rect for tokens and semantics.
@@ -80,6 +85,7 @@ class GUI_information_class(object):
         self.last_newSet_P = None
         self.last_newSet_RB = None
         self.last_newSet_PO = None
+        self.dirty_rects = [] # the rects drawn to since the screen was last updated (see flush_dirty_rects()).
 
 # function to make a basic screen.
 def make_screen(screen_width, screen_height):
@@ -132,8 +138,8 @@ def setup_screen(screen, screen_width, screen_height):
     # return the screen and the GUI_Nodes array.
     return screen
 
-# create all the driver, recipient, newSet, and semantic nodes for the GUI.
-def make_GUI_information(screen_width, screen_height, memory):
+# create all the driver, recipient, newSet, and semantic nodes for the GUI. If min_node_width > 0, rows of tokens with too many units to show each at least min_node_width pixels wide are shown as summary Nodes (see make_row_Nodes()).
+def make_GUI_information(screen_width, screen_height, memory, min_node_width=0):
     # initialize measures.
     quadrant_width = (3*screen_width)/4
     quadrant_height = screen_height/3
@@ -154,140 +160,22 @@ def make_GUI_information(screen_width, screen_height, memory):
     # put all the nodes in a long array called GUI_Nodes.
     # initialize GUI_information.
     GUI_information = GUI_information_class()
-    # iterate through all units in driver, recipient, semantics, and newSet, and create a Node for each unit.
-    for group in memory.driver.Groups:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 P units, in which case it should be quadrant_width/num_Groups.
-        if len(memory.driver.Groups) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.driver.Groups)
-        # location depends on how many Groups you've already made. The first group starts at (0,driver_groups_rect[2]), the second group at (width, driver_groups_rect[2]), and so forth.
-        x_location = width*memory.driver.Groups.index(group)
-        y_location = driver_groups_rect[1]
-        new_Node = Node(group, width, screen_height/12, x_location, y_location)
-        # now update group's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        group.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_driver_group field.
-        GUI_information.last_driver_group = new_Node
-    for myP in memory.driver.Ps:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 P units, in which case it should be quadrant_width/num_Ps.
-        if len(memory.driver.Ps) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.driver.Ps)
-        # location depends on how many Ps you've already made. The first P starts at (0,driver_Ps_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.driver.Ps.index(myP)
-        y_location = driver_Ps_rect[1]
-        new_Node = Node(myP, width, screen_height/12, x_location, y_location)
-        # now update P's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myP.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_driver_P field.
-        GUI_information.last_driver_P = new_Node
-    for myRB in memory.driver.RBs:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 RB units, in which case it should be quadrant_width/num_RBs.
-        if len(memory.driver.RBs) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.driver.RBs)
-        # location depends on how many Ps you've already made. The first P starts at (0,driver_Ps_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.driver.RBs.index(myRB)
-        y_location = driver_RBs_rect[1]
-        new_Node = Node(myRB, width, screen_height/12, x_location, y_location)
-        # now update PO's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myRB.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_driver_RB field.
-        GUI_information.last_driver_RB = new_Node
-    for myPO in memory.driver.POs:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 PO units, in which case it should be quadrant_width/num_POs.
-        if len(memory.driver.POs) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.driver.POs)
-        # location depends on how many Ps you've already made. The first P starts at (0,driver_Ps_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.driver.POs.index(myPO)
-        y_location = driver_POs_rect[1]
-        new_Node = Node(myPO, width, screen_height/12, x_location, y_location)
-        # now update PO's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myPO.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_driver_PO field.
-        GUI_information.last_driver_PO = new_Node
-    for group in memory.recipient.Groups:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 P units, in which case it should be quadrant_width/num_Groups.
-        if len(memory.recipient.Groups) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.recipient.Groups)
-        # location depends on how many Groups you've already made. The first group starts at (0,driver_groups_rect[2]), the second group at (width, driver_groups_rect[2]), and so forth.
-        x_location = width*memory.recipient.Groups.index(group)
-        y_location = recipient_groups_rect[1]
-        new_Node = Node(group, width, screen_height/12, x_location, y_location)
-        # now update group's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        group.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_driver_group field.
-        GUI_information.last_recipient_group = new_Node
-    for myP in memory.recipient.Ps:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 P units, in which case it should be quadrant_width/num_Ps.
-        if len(memory.recipient.Ps) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.recipient.Ps)
-        # location depends on how many Ps you've already made. The first P starts at (0,driver_Ps_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.recipient.Ps.index(myP)
-        y_location = recipient_Ps_rect[1]
-        new_Node = Node(myP, width, screen_height/12, x_location, y_location)
-        # now update P's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myP.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_recipient_P field.
-        GUI_information.last_recipient_P = new_Node
-    for myRB in memory.recipient.RBs:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 RB units, in which case it should be quadrant_width/num_RBs.
-        if len(memory.recipient.RBs) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.recipient.RBs)
-        # location depends on how many Ps you've already made. The first RB starts at (0,driver_RBs_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.recipient.RBs.index(myRB)
-        y_location = recipient_RBs_rect[1]
-        new_Node = Node(myRB, width, screen_height/12, x_location, y_location)
-        # now update RB's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myRB.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_recipient_RB field.
-        GUI_information.last_recipient_RB = new_Node
-    for myPO in memory.recipient.POs:
-        # figure out the width and origin location (x_ and y_location).
-        # the width should be default 1/10th of quadrant_width, unless there are more than 10 PO units, in which case it should be quadrant_width/num_POs.
-        if len(memory.recipient.POs) <= 10:
-            width = quadrant_width/10
-        else:
-            width = quadrant_width/len(memory.recipient.POs)
-        # location depends on how many Ps you've already made. The first PO starts at (0,driver_POs_rect[2]), the second P at (width, driver_Ps_rect[2]), and so forth.
-        x_location = width*memory.recipient.POs.index(myPO)
-        y_location = recipient_POs_rect[1]
-        new_Node = Node(myPO, width, screen_height/12, x_location, y_location)
-        # now update PO's .GUI_unit field (i.e., keep a record of the GUI element it corresponds to) and add the new_Node to GUI_Nodes.
-        myPO.GUI_unit = new_Node
-        GUI_information.GUI_Nodes.append(new_Node)
-        # and update the .last_recipient_PO field.
-        GUI_information.last_recipient_PO = new_Node
+    # iterate through all units in driver, recipient, semantics, and newSet, and create a Node for each unit (each row of tokens is laid out by make_row_Nodes(), which also records the last Node in the row in GUI_information, e.g., .last_driver_P).
+    # get the position of each analog (to label summary Nodes).
+    analog_positions = dict((id(analog), position) for position, analog in enumerate(memory.analogs))
+    GUI_information.last_driver_group = make_row_Nodes(GUI_information, memory.driver.Groups, driver_groups_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_driver_P = make_row_Nodes(GUI_information, memory.driver.Ps, driver_Ps_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_driver_RB = make_row_Nodes(GUI_information, memory.driver.RBs, driver_RBs_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_driver_PO = make_row_Nodes(GUI_information, memory.driver.POs, driver_POs_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_recipient_group = make_row_Nodes(GUI_information, memory.recipient.Groups, recipient_groups_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_recipient_P = make_row_Nodes(GUI_information, memory.recipient.Ps, recipient_Ps_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_recipient_RB = make_row_Nodes(GUI_information, memory.recipient.RBs, recipient_RBs_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
+    GUI_information.last_recipient_PO = make_row_Nodes(GUI_information, memory.recipient.POs, recipient_POs_rect[1], quadrant_width, screen_height/12, min_node_width, analog_positions)
     # there is nothing in newSet now, so nothing to do yet.
     # NOTE: FOR THE SEMANTICS, YOU CAN ONLY DISPLAY THE FIRST 100.
     # semantics are displayed in 50 rows and 2 columns of units.
     semantic_counter = 0
-    semantic_names = []
+    semantic_names = set()
     # create all semantics in driver.
     for myPO in memory.driver.POs:
         for Link in myPO.mySemantics:
@@ -315,7 +203,7 @@ def make_GUI_information(screen_width, screen_height, memory):
                 # update semantic_counter.
                 semantic_counter += 1
                 # update semantic_names
-                semantic_names.append(Link.mySemantic.name)
+                semantic_names.add(Link.mySemantic.name)
     # create all semantics in recipient.
     for myPO in memory.recipient.POs:
         for Link in myPO.mySemantics:
@@ -343,18 +231,95 @@ def make_GUI_information(screen_width, screen_height, memory):
                 # update semantic_counter.
                 semantic_counter += 1
                 # update semantic_names
-                semantic_names.append(Link.mySemantic.name)
+                semantic_names.add(Link.mySemantic.name)
     # also add screen_width and screen_height to GUI_information.
     GUI_information.screen_width = screen_width
     GUI_information.screen_height = screen_height
+    # mark the Nodes that fall outside the screen (e.g., semantics past the first 100), so they are not drawn.
+    cull_GUI_Nodes(GUI_information)
     # done.
     # return GUI_information and memory.
     return GUI_information, memory
 
+# stands in for a group of units in the same row of the GUI (see make_row_Nodes()), so they can be shown as one summary Node. Its act is the act of the most active of its units (so a firing unit is not averaged away).
+class unitSummary(object):
+    def __init__(self, units, name):
+        self.units = units
+        self.name = name
+        self.my_type = units[0].my_type
+
+    @property
+    def act(self):
+        return max(unit.act for unit in self.units)
+
+# function to make the Nodes for a row of tokens (e.g., the Ps in the driver) at y_location, and return the last Node made (None if the row is empty). The units are placed left to right in order, in linear time. If min_node_width > 0 and there are too many units to give each at least min_node_width pixels, the units are shown as summary Nodes instead (see summarize_row(); analog_positions maps the id of each analog to its position in memory.analogs, for labelling them).
+def make_row_Nodes(GUI_information, units, y_location, quadrant_width, height, min_node_width=0, analog_positions=None):
+    # the width should be default 1/10th of quadrant_width, unless there are more than 10 units, in which case it should be quadrant_width/num_units.
+    if len(units) <= 10:
+        width = quadrant_width/10
+    else:
+        width = quadrant_width/len(units)
+    if min_node_width > 0 and width < min_node_width:
+        units = summarize_row(units, max(int(quadrant_width/min_node_width), 1), analog_positions)
+        if len(units) <= 10:
+            width = quadrant_width/10
+        else:
+            width = quadrant_width/len(units)
+    new_Node = None
+    for position, unit in enumerate(units):
+        # location depends on how many units you've already made. The first unit starts at (0,y_location), the second at (width,y_location), and so forth.
+        new_Node = Node(unit, width, height, width*position, y_location)
+        # now update the unit's .GUI_unit field (for a summary, the .GUI_unit field of each of its units) and add the new_Node to GUI_Nodes.
+        if isinstance(unit, unitSummary):
+            for member in unit.units:
+                member.GUI_unit = new_Node
+        else:
+            unit.GUI_unit = new_Node
+        GUI_information.GUI_Nodes.append(new_Node)
+    # done.
+    return new_Node
+
+# function to summarize a row of tokens with at most max_nodes summary units: one per analog (in the order the analogs first appear in the row), or, if there are more analogs than that, one per run of neighbouring analogs.
+def summarize_row(units, max_nodes, analog_positions=None):
+    if analog_positions is None:
+        analog_positions = {}
+    analog_units = []
+    analog_rows = {}
+    for unit in units:
+        analog_key = id(unit.myanalog)
+        if analog_key not in analog_rows:
+            analog_rows[analog_key] = len(analog_units)
+            analog_units.append([])
+        analog_units[analog_rows[analog_key]].append(unit)
+    analogs_per_summary = (len(analog_units) + max_nodes - 1)/max_nodes
+    summaries = []
+    for start in range(0, len(analog_units), analogs_per_summary):
+        block = analog_units[start:start+analogs_per_summary]
+        members = [unit for block_units in block for unit in block_units]
+        first_analog = analog_positions.get(id(block[0][0].myanalog), '?')
+        last_analog = analog_positions.get(id(block[-1][0].myanalog), '?')
+        if len(block) == 1:
+            name = 'analog %s: %d %ss' % (first_analog, len(members), members[0].my_type)
+        else:
+            name = 'analogs %s-%s: %d %ss' % (first_analog, last_analog, len(members), members[0].my_type)
+        summaries.append(unitSummary(members, name))
+    # done.
+    return summaries
+
+# function to mark which Nodes are on the screen (i.e., inside the viewport, which is the whole screen by default, and at least a pixel wide). Nodes that are not on the screen are not drawn.
+def cull_GUI_Nodes(GUI_information, viewport=None):
+    if viewport is None:
+        viewport = (0, 0, GUI_information.screen_width, GUI_information.screen_height)
+    for Node in GUI_information.GUI_Nodes:
+        x_location, y_location, width, height = Node.rect
+        Node.on_screen = width >= 1 and x_location < viewport[0]+viewport[2] and x_location+width > viewport[0] and y_location < viewport[1]+viewport[3] and y_location+height > viewport[1]
+
 # draw the nodes to the screen for the first time (i.e., initialize Nodes to screen).
 def initialize_screen_nodes(screen, GUI_information):
-    # draw each Node in GUI_Nodes, including border, name, and activation.
+    # draw each Node in GUI_Nodes that is on the screen, including border, name, and activation.
     for Node in GUI_information.GUI_Nodes:
+        if not Node.on_screen:
+            continue
         # draw the border.
         pygame.draw.rect(screen, Node.border_color, Node.rect, 1)
         # position the name text.
@@ -371,34 +336,52 @@ def initialize_screen_nodes(screen, GUI_information):
     # done.
     return screen
 
-# update the activation rectangles for each Node in GUI_Nodes.
-def update_node_acts(screen, GUI_information):
+# update the activation rectangles for each Node in GUI_Nodes. Only the Nodes on the screen whose activation bar has changed by at least a pixel since it was last drawn are redrawn, and only their rects are updated on the screen. If redraw_all is True, every Node on the screen is redrawn and the whole screen is updated.
+def update_node_acts(screen, GUI_information, redraw_all=False):
     # update the activation rectangles for each Node in GUI_Nodes.
     for Node in GUI_information.GUI_Nodes:
+        if not Node.on_screen:
+            continue
         # update the Node's act.
         Node.act = Node.mynode.act
-        # draw the rect for that nodes activation.
-        # erase the current activation rect.
+        # work out the width of the Node's activation bar in pixels, and skip the Node if that has not changed.
         if Node.type == 'semantic':
-            pygame.draw.rect(screen, BLACK, (Node.act_rect[0], Node.act_rect[1], (Node.rect[2]/2)/1.05 , Node.act_rect[3]), 0)
+            full_width = (Node.rect[2]/2)/1.05
+            bar_height = Node.act_rect[3]
         else:
-            pygame.draw.rect(screen, BLACK, (Node.act_rect[0], Node.act_rect[1], Node.rect[2]/1.05 , Node.act_rect[3]/1.05 ), 0)
+            full_width = Node.rect[2]/1.05
+            bar_height = Node.act_rect[3]/1.05
+        drawn_width = int(max(Node.act, 0.0)*full_width)
+        if drawn_width == Node.drawn_width and not redraw_all:
+            continue
+        Node.drawn_width = drawn_width
+        # draw the rect for that nodes activation.
+        # erase the current activation rect.
+        erase_rect = pygame.draw.rect(screen, BLACK, (Node.act_rect[0], Node.act_rect[1], full_width, bar_height), 0)
         if Node.act > 0:
-            if Node.type == 'semantic':
-                pygame.draw.rect(screen, Node.act_color, (Node.act_rect[0], Node.act_rect[1], (Node.act*Node.rect[2]/2)/1.05 , Node.act_rect[3]), 0)
-            else:
-                pygame.draw.rect(screen, Node.act_color, (Node.act_rect[0], Node.act_rect[1], Node.act*Node.rect[2]/1.05 , Node.act_rect[3]/1.05 ), 0)
+            pygame.draw.rect(screen, Node.act_color, (Node.act_rect[0], Node.act_rect[1], Node.act*full_width, bar_height), 0)
+        GUI_information.dirty_rects.append(erase_rect)
     # update the screen.
-    pygame.display.update()
+    if redraw_all:
+        GUI_information.dirty_rects = []
+        pygame.display.update()
+    else:
+        flush_dirty_rects(GUI_information)
     # done.
     return screen
 
-# initialize GUI
-def initialize_GUI(screen_width, screen_height, memory):
+# function to update the parts of the screen that have been drawn to since it was last updated.
+def flush_dirty_rects(GUI_information):
+    if len(GUI_information.dirty_rects) > 0:
+        pygame.display.update(GUI_information.dirty_rects)
+        GUI_information.dirty_rects = []
+
+# initialize GUI (min_node_width is passed on to make_GUI_information()).
+def initialize_GUI(screen_width, screen_height, memory, min_node_width=0):
     # draw a screen.
     screen = make_screen(screen_width, screen_height)
     screen = setup_screen(screen, screen_width, screen_height)
-    GUI_information, memory = make_GUI_information(screen_width, screen_height, memory)
+    GUI_information, memory = make_GUI_information(screen_width, screen_height, memory, min_node_width)
     screen = initialize_screen_nodes(screen, GUI_information)
     # done.
     return screen, GUI_information
@@ -419,20 +402,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
     new_RBs_rect = (0,10*unit_quadrant_height,quadrant_width, quadrant_height/4)
     new_POs_rect = (0,11*unit_quadrant_height,quadrant_width, quadrant_height/4)
     # look for any new nodes and draw them. Add newly drawn nodes as the last_type in GUI_information.
-    for myP in memory.driver.Ps:
+    for position, myP in enumerate(memory.driver.Ps):
         # if the unit has not GUI_unit, make one.
         if myP.GUI_unit is None:
             # the new P should be drawn next to the last P already drawn.
             # if the space for Ps is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.driver.Ps.index(myP)
+            x_location = width*position
             y_location = recipient_Ps_rect[1]
             new_node = Node(myP, width, height, x_location, y_location)           
             # add new_node to myP.
             myP.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -445,20 +429,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myRB in memory.driver.RBs:
+    for position, myRB in enumerate(memory.driver.RBs):
         # if the unit has not GUI_unit, make one.
         if myRB.GUI_unit is None:
             # the new P should be drawn next to the last P already drawn.
             # if the space for RBs is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.driver.RBs.index(myRB)
+            x_location = width*position
             y_location = recipient_RBs_rect[1]
             new_node = Node(myRB, width, height, x_location, y_location)
             # add new_node to myRB.
             myRB.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -471,7 +456,7 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myPO in memory.driver.POs:
+    for position, myPO in enumerate(memory.driver.POs):
         # if the unit has not GUI_unit, make one.
         # Alternately, if the number of POs is beyond the range displayable in the current GUI, erase and re-display the entire row of PO units.
         if myPO.GUI_unit is None:
@@ -479,13 +464,14 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
             # if the space for POs is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.driver.POs.index(myPO)
+            x_location = width*position
             y_location = recipient_POs_rect[1]
             new_node = Node(myPO, width, height, x_location, y_location)
             # add new_node to myPO.
             myPO.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -498,20 +484,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myP in memory.recipient.Ps:
+    for position, myP in enumerate(memory.recipient.Ps):
         # if the unit has no GUI_unit, make one.
         if myP.GUI_unit is None:
             # the new P should be drawn next to the last P already drawn.
             # if the space for Ps is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.recipient.Ps.index(myP)
+            x_location = width*position
             y_location = recipient_Ps_rect[1]
             new_node = Node(myP, width, height, x_location, y_location)
             # add new_node to myP.
             myP.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -524,20 +511,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myRB in memory.recipient.RBs:
+    for position, myRB in enumerate(memory.recipient.RBs):
         # if the unit has no GUI_unit, make one.
         if myRB.GUI_unit is None:
             # the new RB should be drawn next to the last RB already drawn.
             # if the space for RBs is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.recipient.RBs.index(myRB)
+            x_location = width*position
             y_location = recipient_RBs_rect[1]
             new_node = Node(myRB, width, height, x_location, y_location)
             # add new_node to myRB.
             myRB.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -550,20 +538,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myPO in memory.recipient.POs:
+    for position, myPO in enumerate(memory.recipient.POs):
         # if the unit has no GUI_unit, make one.
         if myPO.GUI_unit is None:
             # the new PO should be drawn next to the last PO already drawn.
             # if the space for POs is empty, start in the first available space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.recipient.POs.index(myPO)
+            x_location = width*position
             y_location = recipient_POs_rect[1]
             new_node = Node(myPO, width, height, x_location, y_location)      
             # add new_node to myPO.
             myPO.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -576,20 +565,21 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myP in memory.newSet.Ps:
+    for position, myP in enumerate(memory.newSet.Ps):
         # if the unit has not GUI_unit, make one.
         if myP.GUI_unit is None:
             # the new P should be drawn next to the last P already drawn.
             # if the newSet is empty, start in the first newSet space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.newSet.Ps.index(myP)
+            x_location = width*position
             y_location = new_Ps_rect[1]
             new_node = Node(myP, width, height, x_location, y_location)
             # add new_node to myP.
             myP.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -602,19 +592,20 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myRB in memory.newSet.RBs:
+    for position, myRB in enumerate(memory.newSet.RBs):
         # if the unit has not GUI_unit, make one.
         if myRB.GUI_unit is None:
             # if the newSet is empty, start in the first newSet space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.newSet.RBs.index(myRB)
+            x_location = width*position
             y_location = new_RBs_rect[1]
             new_node = Node(myRB, width, height, x_location, y_location)
             # add new_node to myRB.
             myRB.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -627,19 +618,20 @@ def draw_new_GUI_Nodes(screen, GUI_information, memory, debug):
                 pygame.draw.rect(screen, new_node.act_color, new_node.act_rect, 0)
             else:
                 pygame.draw.rect(screen, WHITE, new_node.act_rect, 0)
-    for myPO in memory.newSet.POs:
+    for position, myPO in enumerate(memory.newSet.POs):
         # if the unit has not GUI_unit, make one.
         if myPO.GUI_unit is None:
             # if the newSet is empty, start in the first newSet space.
             width = quadrant_width/10
             height = GUI_information.screen_height/12
-            x_location = width*memory.newSet.POs.index(myPO)
+            x_location = width*position
             y_location = new_POs_rect[1]
             new_node = Node(myPO, width, height, x_location, y_location)
             # add new_node to myPO.
             myPO.GUI_unit = new_node
             # add the node to GUI_information.GUI_Nodes.
             GUI_information.GUI_Nodes.append(new_node)
+            GUI_information.dirty_rects.append(new_node.rect)
             # draw the new_node.
             # draw the border.
             pygame.draw.rect(screen, new_node.border_color, new_node.rect, 1)
@@ -663,12 +655,39 @@ def run_GUI(screen, GUI_information, memory, debug):
         node.update_act(memory)
     # now draw the updated activations to the screen.
     screen = update_node_acts(screen, GUI_information)
-    # draw any newly added nodes to recipient or to newSet.
+    # draw any newly added nodes to recipient or to newSet (and mark which of them are on the screen).
+    num_Nodes = len(GUI_information.GUI_Nodes)
     GUI_information, memory = draw_new_GUI_Nodes(screen, GUI_information, memory, debug)
-    # update the screen.
-    pygame.display.update()
+    if len(GUI_information.GUI_Nodes) > num_Nodes:
+        cull_GUI_Nodes(GUI_information)
+    # update the parts of the screen the new nodes were drawn to.
+    flush_dirty_rects(GUI_information)
     return screen, memory
 
+# function to report the frames per second the GUI can draw. Takes a function that returns a freshly built memory, and the run parameters (screen_width and screen_height are used). The network is set up as for a run, drawn, and then drawn num_frames times with the activations of active_fraction of the nodes changing on every frame (as when a few units are firing in a large network), once redrawing every node (as before dirty-rectangle updates) and once redrawing only the nodes that changed. Prints the frames per second for each, and returns them in a dict.
+def measure_GUI_fps(make_memory, parameters, num_frames=200, active_fraction=0.1):
+    import math, time
+    network_parameters = dict(parameters)
+    network_parameters['doGUI'] = False
+    network = basicRunDORA_DING.runDORA(make_memory(), network_parameters)
+    network.initialize_run(mapping=False)
+    screen, GUI_information = initialize_GUI(parameters['screen_width'], parameters['screen_height'], network.memory)
+    nodes = GUI_information.GUI_Nodes
+    active = nodes[::max(int(round(1/max(active_fraction, 1e-9))), 1)]
+    report = {'nodes': len(nodes), 'active_nodes': len(active)}
+    for mode, redraw_all in (('full_fps', True), ('dirty_fps', False)):
+        start = time.time()
+        for frame in range(num_frames):
+            for position, Node in enumerate(active):
+                Node.mynode.act = 0.5 + 0.5*math.sin(0.1*frame + position)
+            update_node_acts(screen, GUI_information, redraw_all)
+        report[mode] = num_frames/max(time.time() - start, 1e-9)
+    for Node in active:
+        Node.mynode.act = 0.0
+    print '%d nodes (%d changing): %.1f frames per second redrawing every node, %.1f redrawing changed nodes (%.1fx)' % (report['nodes'], report['active_nodes'], report['full_fps'], report['dirty_fps'], report['dirty_fps']/max(report['full_fps'], 1e-9))
+    # done.
+    return report
+
 # function that runs at the end of a DORA run and keeps the GUI window open until the user manually closes it.
 # NOTE: I see this function as useful as an option before run, that will keep run window open until user manually quits the window.
 def manually_close_window(screen):
@@ -680,135 +699,366 @@ def manually_close_window(screen):
             # close the window with pygame.display.quit().
             pygame.display.quit()
 
+###################################################
+######### GUI TRACES (RECORD AND REPLAY) ##########
+###################################################
+# A GUI trace is a recording of what the GUI would have shown during a run: the layout of the screen (the name, type, and rect of each Node, as made by make_GUI_information()), and a frame of the activations of the Nodes' units for each GUI update. A run can be recorded headless at full speed (see the GUI_trace parameter of basicRunDORA_DING.runDORA), played back with replay_trace() as often as needed, and rendered to PNGs or a video with export_trace().
+# The trace file is a sequence of pickled records: ('screen', screen_width, screen_height), then ('layout', layout) whenever the layout changes (i.e., units are added to the driver, recipient, or newSet), and ('frame', time_step, acts) for each frame (under the last layout before it). The records are written as they are made, so a trace of a run that stops part way through can still be played back.
+
+# stands in for a unit in a layout drawn from a trace or sent from another process (so Node and update_node_acts() can be used as they are).
+class unitView(object):
+    def __init__(self, name, my_type):
+        self.name = name
+        self.my_type = my_type
+        self.act = 0.0
+
+# class to record a GUI trace of a run to a file.
+class traceRecorder(object):
+    def __init__(self, path, screen_width, screen_height, min_node_width=0):
+        self.path = path
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.min_node_width = min_node_width # see make_GUI_information().
+        self.trace_file = open(path, 'wb')
+        self.units = [] # the units in the current layout, in frame order.
+        self.layout_key = None
+        self.num_frames = 0
+        cPickle.dump(('screen', screen_width, screen_height), self.trace_file, 2)
+
+    # function to record a frame of the current activations (recording the layout first if it has changed).
+    def record_frame(self, memory, time_step):
+        if get_layout_key(memory) != self.layout_key:
+            self.layout_key = get_layout_key(memory)
+            self.units, layout = get_GUI_layout(self.screen_width, self.screen_height, memory, self.min_node_width)
+            cPickle.dump(('layout', layout), self.trace_file, 2)
+        cPickle.dump(('frame', time_step, np.array([unit.act for unit in self.units], dtype=np.float32)), self.trace_file, 2)
+        self.num_frames += 1
+
+    # function to close the trace file.
+    def close(self):
+        self.trace_file.close()
+
+# function to get a key for the makeup of the driver, recipient, newSet, and semantics (when it changes, the layout of the GUI changes).
+def get_layout_key(memory):
+    layout_key = []
+    for mySet in (memory.driver, memory.recipient, memory.newSet):
+        layout_key.extend([len(mySet.Groups), len(mySet.Ps), len(mySet.RBs), len(mySet.POs)])
+    layout_key.append(len(memory.semantics))
+    # done.
+    return tuple(layout_key)
+
+# function to get the layout of the GUI for the current network (min_node_width is passed on to make_GUI_information()). Returns the units shown on the screen, and the layout (a list of the name, type, and rect of the Node for each of those units, in the same order). The units' .GUI_unit fields are left as they were (make_GUI_information() sets them, and the inline GUI uses them to find the tokens it has not drawn yet).
+def get_GUI_layout(screen_width, screen_height, memory, min_node_width=0):
+    # save the .GUI_unit fields of the units make_GUI_information() sets them on: the tokens in the driver and recipient, and the semantics of their POs.
+    saved_GUI_units = []
+    for mySet in (memory.driver, memory.recipient):
+        for unit in mySet.Groups + mySet.Ps + mySet.RBs + mySet.POs:
+            saved_GUI_units.append((unit, unit.__dict__.get('GUI_unit', saved_GUI_units)))
+        for myPO in mySet.POs:
+            for Link in myPO.mySemantics:
+                saved_GUI_units.append((Link.mySemantic, Link.mySemantic.__dict__.get('GUI_unit', saved_GUI_units)))
+    GUI_information, memory = make_GUI_information(screen_width, screen_height, memory, min_node_width)
+    # put them back (in reverse, so a unit saved twice gets its first saved value; saved_GUI_units itself marks a unit that had no .GUI_unit field).
+    for unit, GUI_unit in reversed(saved_GUI_units):
+        if GUI_unit is saved_GUI_units:
+            unit.__dict__.pop('GUI_unit', None)
+        else:
+            unit.GUI_unit = GUI_unit
+    units = [Node.mynode for Node in GUI_information.GUI_Nodes]
+    layout = [(Node.name, Node.type, Node.rect) for Node in GUI_information.GUI_Nodes]
+    # done.
+    return units, layout
+
+# function to draw the template screen and the Nodes of a layout (from get_GUI_layout()). Returns the GUI_information and the unitViews standing in for the units of the layout (set their .act and call update_node_acts() to draw a frame).
+def draw_layout(screen, screen_width, screen_height, layout):
+    units = [unitView(name, my_type) for name, my_type, rect in layout]
+    GUI_information = GUI_information_class()
+    GUI_information.GUI_Nodes = [Node(unit, rect[2], rect[3], rect[0], rect[1]) for unit, (name, my_type, rect) in zip(units, layout)]
+    GUI_information.screen_width = screen_width
+    GUI_information.screen_height = screen_height
+    cull_GUI_Nodes(GUI_information)
+    screen.fill(BLACK)
+    setup_screen(screen, screen_width, screen_height)
+    initialize_screen_nodes(screen, GUI_information)
+    # done.
+    return GUI_information, units
+
+# function to read a GUI trace. Returns a dict with the screen_width and screen_height, the layouts, and for each frame, its layout (an index into layouts), time-step, and acts.
+def load_trace(path):
+    trace = {'screen_width': basicRunDORA_DING.screen_width, 'screen_height': basicRunDORA_DING.screen_height, 'layouts': [], 'frame_layouts': [], 'time_steps': [], 'acts': []}
+    with open(path, 'rb') as trace_file:
+        while True:
+            try:
+                record = cPickle.load(trace_file)
+            except EOFError:
+                break
+            if record[0] == 'screen':
+                trace['screen_width'], trace['screen_height'] = record[1], record[2]
+            elif record[0] == 'layout':
+                trace['layouts'].append(record[1])
+            elif record[0] == 'frame':
+                trace['frame_layouts'].append(len(trace['layouts'])-1)
+                trace['time_steps'].append(record[1])
+                trace['acts'].append(record[2])
+    # done.
+    return trace
+
+# function to play back a GUI trace. speed is how many times faster than frames_per_second frames are played (e.g., 0.25 for slow motion), and playing starts at start_frame (paused if paused is True). Keys: space pauses and unpauses, right and left arrows step a frame forward and back (pausing), up and down arrows double and halve the speed, home and end seek to the first and last frames, page up and page down seek back and forward a tenth of the trace, and 0-9 seek to that tenth of the trace. The frame, time-step, and speed are shown in the window caption. Plays until the window is closed (or escape is pressed), or, if quit_at_end is True, until the last frame has been shown. Returns the number of frames drawn.
+def replay_trace(path, speed=1.0, frames_per_second=30, start_frame=0, paused=False, quit_at_end=False):
+    trace = load_trace(path)
+    num_frames = len(trace['acts'])
+    if num_frames == 0:
+        print 'The trace ' + path + ' has no frames.'
+        return 0
+    trace_screen_width, trace_screen_height = trace['screen_width'], trace['screen_height']
+    screen = make_screen(trace_screen_width, trace_screen_height)
+    GUI_information, units = None, []
+    current_layout = None
+    position = float(min(max(start_frame, 0), num_frames-1))
+    shown_frame = None
+    caption = None
+    drawn = 0
+    keep_going = True
+    while keep_going:
+        # keypresses.
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                keep_going = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_RIGHT:
+                    paused = True
+                    position = int(position) + 1
+                elif event.key == pygame.K_LEFT:
+                    paused = True
+                    position = int(position) - 1
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed /= 2
+                elif event.key == pygame.K_HOME:
+                    position = 0
+                elif event.key == pygame.K_END:
+                    position = num_frames-1
+                elif event.key == pygame.K_PAGEUP:
+                    position -= num_frames/10.0
+                elif event.key == pygame.K_PAGEDOWN:
+                    position += num_frames/10.0
+                elif pygame.K_0 <= event.key <= pygame.K_9:
+                    position = ((event.key - pygame.K_0)*num_frames)/10
+                position = min(max(position, 0), num_frames-1)
+        if not keep_going:
+            break
+        # draw the frame at position (drawing its layout first if it is not the one on the screen).
+        frame = int(position)
+        if frame != shown_frame:
+            if trace['frame_layouts'][frame] != current_layout:
+                current_layout = trace['frame_layouts'][frame]
+                GUI_information, units = draw_layout(screen, trace_screen_width, trace_screen_height, trace['layouts'][current_layout])
+            for unit, act in zip(units, trace['acts'][frame]):
+                unit.act = float(act)
+            update_node_acts(screen, GUI_information)
+            shown_frame = frame
+            drawn += 1
+        new_caption = 'frame %d/%d  time-step %d  speed %gx%s' % (frame+1, num_frames, trace['time_steps'][frame], speed, '  (paused)' if paused else '')
+        if new_caption != caption:
+            caption = new_caption
+            pygame.display.set_caption(caption)
+        if quit_at_end and frame == num_frames-1:
+            break
+        # move on.
+        if not paused:
+            position = min(position + speed, num_frames-1)
+        clock.tick(frames_per_second)
+    pygame.display.quit()
+    # done.
+    return drawn
+
+# the state of rendering a GUI trace in an export process (see export_trace()).
+export_state = None
+
+# function to get the command to pipe frames of a width x height GUI trace to ffmpeg, to encode them to a video at output_path.
+def ffmpeg_command(output_path, width, height, frames_per_second=30):
+    # done.
+    return ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % (width, height), '-r', str(frames_per_second), '-i', '-', '-pix_fmt', 'yuv420p', output_path]
+
+# function (run in each export process) to set up rendering the GUI trace at path.
+def start_frame_export(path):
+    global export_state
+    export_state = {'trace': load_trace(path), 'screen': None, 'layout': None, 'GUI_information': None, 'units': []}
+
+# function to render a chunk of frames of the GUI trace being exported. task is the frames to render (in order) and the output pattern: each frame is saved as a PNG to output_pattern % frame, or, if output_pattern is None, its pixels are returned (as RGB strings). Every activation bar is redrawn on every frame (erasing a bar can draw over a border, so with only changed bars redrawn, a frame would depend on the frames drawn before it on the same screen, and so on how the frames were split between processes).
+def export_frames(task):
+    frames, output_pattern = task
+    state = export_state
+    trace = state['trace']
+    if state['screen'] is None:
+        # no window is needed, so draw to the dummy video driver unless a display is already open.
+        if not pygame.display.get_init():
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        state['screen'] = make_screen(int(trace['screen_width']), int(trace['screen_height']))
+    screen = state['screen']
+    pixels = []
+    for frame in frames:
+        if trace['frame_layouts'][frame] != state['layout']:
+            state['layout'] = trace['frame_layouts'][frame]
+            state['GUI_information'], state['units'] = draw_layout(screen, trace['screen_width'], trace['screen_height'], trace['layouts'][state['layout']])
+        for unit, act in zip(state['units'], trace['acts'][frame]):
+            unit.act = float(act)
+        update_node_acts(screen, state['GUI_information'], redraw_all=True)
+        if output_pattern is not None:
+            pygame.image.save(screen, output_pattern % frame)
+        else:
+            pixels.append(pygame.image.tostring(screen, 'RGB'))
+    # done.
+    if output_pattern is not None:
+        return len(frames)
+    return pixels
+
+# function to render the frames of a GUI trace (see traceRecorder) without a window, for making animations of runs on headless machines. Each frame is saved as a numbered PNG (frame_000000.png, ...) in output_dir, or, if encoder_command is given, the frames are piped in order (as raw RGB, screen_width x screen_height) to the standard input of that command (e.g., ffmpeg_command('run.mp4', 1200, 700)). Frames first_frame up to (not including) last_frame are rendered (all frames by default), in chunks of frames_per_chunk frames spread over num_processes processes (0 to render them in this process). Must be run from a process without a GUI window open. Prints the number of frames and frames per second, and returns the number of frames written.
+def export_trace(path, output_dir=None, encoder_command=None, num_processes=0, frames_per_chunk=16, first_frame=0, last_frame=None):
+    import time, subprocess
+    from multiprocessing import Pool
+    if (output_dir is None) == (encoder_command is None):
+        print 'export_trace() needs one of output_dir or encoder_command.'
+        return 0
+    start = time.time()
+    start_frame_export(path)
+    num_frames = len(export_state['trace']['acts'])
+    if last_frame is None or last_frame > num_frames:
+        last_frame = num_frames
+    output_pattern = None
+    if output_dir is not None:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        output_pattern = os.path.join(output_dir, 'frame_%06d.png')
+    tasks = [(range(chunk_start, min(chunk_start+frames_per_chunk, last_frame)), output_pattern) for chunk_start in range(first_frame, last_frame, frames_per_chunk)]
+    # render the chunks (the chunks come back in order, so the frames can go straight to the encoder).
+    pool = None
+    if num_processes > 0:
+        pool = Pool(num_processes, start_frame_export, (path,))
+        results = pool.imap(export_frames, tasks)
+    else:
+        results = (export_frames(task) for task in tasks)
+    encoder = None
+    if encoder_command is not None:
+        encoder = subprocess.Popen(encoder_command, stdin=subprocess.PIPE)
+    num_written = 0
+    for result in results:
+        if encoder is not None:
+            for frame_pixels in result:
+                encoder.stdin.write(frame_pixels)
+            num_written += len(result)
+        else:
+            num_written += result
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    elapsed = max(time.time() - start, 1e-9)
+    print 'exported %d frames in %.1f seconds (%.1f frames per second)' % (num_written, elapsed, num_written/elapsed)
+    # done.
+    return num_written
+
 ###################################################
 ############ GUIs FOR TERMINAL DISPLAY ############
 ###################################################
+# a columnar snapshot of the state of a list of units. For each unit (in order), the arrays hold its name, type ('Group', 'P', 'RB', 'PO', or 'semantic'), set ('driver', 'recipient', 'newSet', or 'memory'; '' for semantics), act, net_input (for semantics, their .myinput), mode (for Ps and RBs; nan for other units), and analog (the position of its analog in memory.analogs; -1 if it has none). As the columns are arrays, the state can be worked with directly (e.g., table.names[table.act > 0.5]), or formatted with format_state_table().
+class stateTable(object):
+    def __init__(self, units, analog_positions):
+        rows = []
+        for unit in units:
+            if unit.my_type == 'semantic':
+                rows.append((unit.name, unit.my_type, '', unit.act, unit.myinput, np.nan, -1))
+            else:
+                mode = np.nan
+                if unit.my_type in ('P', 'RB'):
+                    mode = unit.mode
+                rows.append((unit.name, unit.my_type, unit.set, unit.act, unit.net_input, mode, analog_positions.get(id(unit.myanalog), -1)))
+        columns = zip(*rows)
+        if len(rows) == 0:
+            columns = [[]]*7
+        self.names = np.array(columns[0], dtype=object)
+        self.types = np.array(columns[1], dtype=object)
+        self.sets = np.array(columns[2], dtype=object)
+        self.act = np.array(columns[3], dtype=float)
+        self.net_input = np.array(columns[4], dtype=float)
+        self.mode = np.array(columns[5], dtype=float)
+        self.analog = np.array(columns[6], dtype=int)
+
+    def __len__(self):
+        return len(self.names)
+
+# function to get a stateTable of units (by default, all the tokens in memory followed by the semantics).
+def get_state_table(memory, units=None):
+    if units is None:
+        units = memory.Groups + memory.Ps + memory.RBs + memory.POs + memory.semantics
+    analog_positions = dict((id(analog), position) for position, analog in enumerate(memory.analogs))
+    # done.
+    return stateTable(units, analog_positions)
+
+# function to format a stateTable as a text table (one row per unit, under title if one is given). Returns a string.
+def format_state_table(table, title=None):
+    lines = []
+    if title is not None:
+        lines.append(title)
+    name_width = max([len('name')] + [len(str(name)) for name in table.names])
+    row_format = '%-' + str(name_width) + 's  %-8s  %-9s  %10s  %10s  %4s  %6s'
+    lines.append(row_format % ('name', 'type', 'set', 'act', 'net_input', 'mode', 'analog'))
+    for name, my_type, my_set, act, net_input, mode, analog in zip(table.names, table.types, table.sets, table.act, table.net_input, table.mode, table.analog):
+        if np.isnan(mode):
+            mode = '-'
+        else:
+            mode = '%d' % mode
+        if analog < 0:
+            analog = '-'
+        lines.append(row_format % (name, my_type, my_set, '%.6f' % act, '%.6f' % net_input, mode, analog))
+    lines.append('')
+    # done.
+    return '\n'.join(lines) + '\n'
+
+# function to get the tokens of a set (driver, recipient, or newSet) in order: Groups, Ps, RBs, then POs.
+def get_set_tokens(mySet):
+    # done.
+    return mySet.Groups + mySet.Ps + mySet.RBs + mySet.POs
+
 # super simple GUI: Display inputs and activations of driver and recipient units in the shell.
 def simple_term_state_display(memory):
-    # display driver state.
-    print('DRVER STATE')
-    print('GROUP units:')
-    for group in memory.driver.Groups:
-        printstring = str(group.name) + ': ACT=' + str(group.act) + ' and INPUT=' + str(group.net_input)
-        print(printstring)
-    print('P units:')
-    for myP in memory.driver.Ps:
-        printstring = str(myP.name) + ': ACT=' + str(P.act) + ' and INPUT=' + str(myP.net_input)
-        print(printstring)
-    print('RB units:')
-    for myRB in memory.driver.RBs:
-        printstring = str(myRB.name) + ': ACT=' + str(RB.act) + ' and INPUT=' + str(myRB.net_input)
-        print(printstring)
-    print('PO units:')
-    for myPO in memory.driver.POs:
-        printstring = str(myPO.name) + ': ACT=' + str(PO.act) + ' and INPUT=' + str(myPO.net_input)
-        print(printstring)
-    print('')
-    # display recipient state.
-    print('RECIPIENT STATE')
-    print('GROUP units:')
-    for group in memory.recipient.Groups:
-        printstring = str(group.name) + ': ACT=' + str(group.act) + ' and INPUT=' + str(group.net_input)
-        print(printstring)
-    print('P units:')
-    for myP in memory.recipient.Ps:
-        printstring = str(myP.name) + ': ACT=' + str(P.act) + ' and INPUT=' + str(myP.net_input)
-        print(printstring)
-    print('RB units:')
-    for myRB in memory.recipient.RBs:
-        printstring = str(myRB.name) + ': ACT=' + str(RB.act) + ' and INPUT=' + str(myRB.net_input)
-        print(printstring)
-    print('PO units:')
-    for myPO in memory.recipient.POs:
-        printstring = str(myPO.name) + ': ACT=' + str(PO.act) + ' and INPUT=' + str(myPO.net_input)
-        print(printstring)
-    print('')
+    driver_table = get_state_table(memory, get_set_tokens(memory.driver))
+    recipient_table = get_state_table(memory, get_set_tokens(memory.recipient))
+    sys.stdout.write(format_state_table(driver_table, 'DRIVER STATE') + format_state_table(recipient_table, 'RECIPIENT STATE'))
 
 # super simple GUI II: display inputs and activations of all semantics in the shell.
 def term_semantic_state_display(memory):
-    print('SEMANTICS')
-    for semantic in memory.semantics:
-        printstrng = printstring = str(semantic.name) + ': ACT=' + str(semantic.act) + ' and INPUT=' + str(semantic.myinput)
-        print(printstring)
-    print('')
+    sys.stdout.write(format_state_table(get_state_table(memory, memory.semantics), 'SEMANTICS'))
 
 # simple GUI: Display inputs and activations of driver, recipient, AND MEMORY units in the shell.
 def full_term_state_display(memory):
-    # display driver state.
-    print('DRVER STATE')
-    print('GROUP units:')
-    for group in memory.driver.Groups:
-        printstring = str(group.name) + ': ACT=' + str(group.act) + ' and INPUT=' + str(group.net_input)
-        print(printstring)
-    print('P units:')
-    for myP in memory.driver.Ps:
-        printstring = str(myP.name) + ': ACT=' + str(myP.act) + ' and INPUT=' + str(myP.net_input)
-        print(printstring)
-    print('RB units:')
-    for myRB in memory.driver.RBs:
-        printstring = str(myRB.name) + ': ACT=' + str(myRB.act) + ' and INPUT=' + str(myRB.net_input)
-        print(printstring)
-    print('PO units:')
-    for myPO in memory.driver.POs:
-        printstring = str(myPO.name) + ': ACT=' + str(myPO.act) + ' and INPUT=' + str(myPO.net_input)
-        print(printstring)
-    print('')
-    # display recipient state.
-    print('RECIPIENT STATE')
-    print('GROUP units:')
-    for group in memory.recipient.Groups:
-        printstring = str(group.name) + ': ACT=' + str(group.act) + ' and INPUT=' + str(group.net_input)
-        print(printstring)
-    print('P units:')
-    for myP in memory.recipient.Ps:
-        printstring = str(P.name) + ': ACT=' + str(myP.act) + ' and INPUT=' + str(myP.net_input)
-        print(printstring)
-    print('RB units:')
-    for myRB in memory.recipient.RBs:
-        printstring = str(RB.name) + ': ACT=' + str(myRB.act) + ' and INPUT=' + str(myRB.net_input)
-        print(printstring)
-    print('PO units:')
-    for myPO in memory.recipient.POs:
-        printstring = str(PO.name) + ': ACT=' + str(myPO.act) + ' and INPUT=' + str(myPO.net_input)
-        print(printstring)
-    print('')
-    # display memory state.
+    driver_table = get_state_table(memory, get_set_tokens(memory.driver))
+    recipient_table = get_state_table(memory, get_set_tokens(memory.recipient))
     # display all units neither in driver or recipient.
-    print('MEMORY STATE')
-    print('GROUP units:')
-    for group in memory.Groups:
-        printstring = str(group.name) + ': ACT=' + str(group.act) + ' and INPUT=' + str(group.net_input)
-        print(printstring)
-    print('P units:')
-    for myP in memory.Ps:
-        if myP.set != 'driver' and myP.set != 'recipient':
-            printstring = str(P.name) + ': ACT=' + str(myP.act) + ' and INPUT=' + str(myP.net_input)
-            print(printstring)
-    print('RB units:')
-    for myRB in memory.RBs:
-        if myRB.set != 'driver' and myRB.set != 'recipient':
-            printstring = str(RB.name) + ': ACT=' + str(myRB.act) + ' and INPUT=' + str(myRB.net_input)
-            print(printstring)
-    print('PO units:')
-    for myPO in memory.POs:
-        if myPO.set != 'driver' and myPO.set != 'recipient':
-            printstring = str(PO.name) + ': ACT=' + str(myPO.act) + ' and INPUT=' + str(myPO.net_input)
-            print(printstring)
-    print('')
+    memory_tokens = [token for token in memory.Groups + memory.Ps + memory.RBs + memory.POs if token.set != 'driver' and token.set != 'recipient']
+    memory_table = get_state_table(memory, memory_tokens)
+    sys.stdout.write(format_state_table(driver_table, 'DRIVER STATE') + format_state_table(recipient_table, 'RECIPIENT STATE') + format_state_table(memory_table, 'MEMORY STATE'))
 
 # super simple GUI to display the structure of items in driver, recipient, or memory.
 def term_network_display(memory, set_to_display):
     # this function takes as input the memory data, and a set_to_display string specifying, 'driver', 'recipient', or 'memory', and then prints the elements in that set to the screen and to a text file.
+    # the lines are collected and written to the screen at once at the end.
+    lines = []
     # structure of a printed analog is myP.name /n myRB.name-PO_pred.name(PO.semantics)-PO_obj.name(PO.semantics), for each RB, for each analog topping out at a P unit, then myRB.name-PO_pred.name(PO.semantics)-PO_obj.name(PO>semantics), for each analog toppig out at a RB, then myPO.name(semantics), for each analog topping out with a PO unit.
     if set_to_display == 'driver':
-        print ''
-        print 'DRIVER:'
+        lines.append('')
+        lines.append('DRIVER:')
         group_counter = 0
         for group in memory.driver.Groups:
             group_counter += 1
             # print my name and info for all my tokens.
-            print ''
-            term_display_group(group, group_counter)
+            lines.append('')
+            term_display_group(group, group_counter, lines)
         # now draw the Ps.
         P_counter = 0
         for myP in memory.driver.Ps:
@@ -817,11 +1067,11 @@ def term_network_display(memory, set_to_display):
             # NOTE: you might eventually want code here to only print P units with no groups (which is added below, but commented out).
             #if len(myP.myGroups) < 1:
             #   # print my name, then info for each of my RBs.
-            #   print ''
-            #   term_display_P(myP, P_counter)
+            #   lines.append('')
+            #   term_display_P(myP, P_counter, lines)
             # print my name, then info for each of my RBs.
-            print ''
-            term_display_P(myP, P_counter)
+            lines.append('')
+            term_display_P(myP, P_counter, lines)
         # draw each RB that has no Ps above it.
         RB_counter = 0
         for myRB in memory.driver.RBs:
@@ -829,7 +1079,7 @@ def term_network_display(memory, set_to_display):
             RB_counter += 1
             # if that RB has no Ps above it (i.e., myRB.myParentPs is empty), then draw it.
             # NOTE: term_display_RB function takes care of not drawing RBs without P parents.
-            term_display_RB(myRB, RB_counter)
+            term_display_RB(myRB, RB_counter, lines)
         # for draw each PO that has no RBs.
         PO_counter = 0
         for myPO in memory.driver.POs:
@@ -837,16 +1087,16 @@ def term_network_display(memory, set_to_display):
             PO_counter += 1
             # if that PO has no RBs (i.e., myPO.myRBs is empty), then draw it.
             # NOTE: term_display_PO function takes care of not drawing POs with no RBs.
-            term_display_PO(myPO, PO_counter)
+            term_display_PO(myPO, PO_counter, lines)
     elif set_to_display == 'recipient':
-        print ''
-        print 'RECIPIENT:'
+        lines.append('')
+        lines.append('RECIPIENT:')
         group_counter = 0
         for group in memory.recipient.Groups:
             group_counter += 1
             # print my name and info for all my tokens.
-            print ''
-            term_display_group(group, group_counter)
+            lines.append('')
+            term_display_group(group, group_counter, lines)
         # now draw the Ps.
         P_counter = 0
         for myP in memory.recipient.Ps:
@@ -855,11 +1105,11 @@ def term_network_display(memory, set_to_display):
             # NOTE: you might eventually want code here to only print P units with no groups (which is added below, but commented out).
             #if len(myP.myGroups) < 1:
             #   # print my name, then info for each of my RBs.
-            #   print ''
-            #   term_display_P(myP, P_counter)
+            #   lines.append('')
+            #   term_display_P(myP, P_counter, lines)
             # print my name, then info for each of my RBs.
-            print ''
-            term_display_P(myP, P_counter)
+            lines.append('')
+            term_display_P(myP, P_counter, lines)
         # draw each RB that has no Ps above it.
         RB_counter = 0
         for myRB in memory.recipient.RBs:
@@ -867,7 +1117,7 @@ def term_network_display(memory, set_to_display):
             RB_counter += 1
             # if that RB has no Ps above it (i.e., myRB.myParentPs is empty), then draw it.
             # NOTE: term_display_RB function takes care of not drawing RBs without P parents.
-            term_display_RB(myRB, RB_counter)
+            term_display_RB(myRB, RB_counter, lines)
         # for draw each PO that has no RBs.
         PO_counter = 0
         for myPO in memory.recipient.POs:
@@ -875,16 +1125,16 @@ def term_network_display(memory, set_to_display):
             PO_counter += 1
             # if that PO has no RBs (i.e., myPO.myRBs is empty), then draw it.
             # NOTE: term_display_PO function takes care of not drawing POs with no RBs.
-            term_display_PO(myPO, PO_counter)
+            term_display_PO(myPO, PO_counter, lines)
     else:
-        print ''
-        print 'MEMORY:'
+        lines.append('')
+        lines.append('MEMORY:')
         group_counter = 0
         for group in memory.Groups:
             group_counter += 1
             # print my name and info for all my tokens.
-            print ''
-            term_display_group(group, group_counter)
+            lines.append('')
+            term_display_group(group, group_counter, lines)
         # now draw the Ps.
         P_counter = 0
         for myP in memory.Ps:
@@ -893,11 +1143,11 @@ def term_network_display(memory, set_to_display):
             # NOTE: you might eventually want code here to only print P units with no groups (which is added below, but commented out).
             #if len(myP.myGroups) < 1:
             #   # print my name, then info for each of my RBs.
-            #   print ''
-            #   term_display_P(myP, P_counter)
+            #   lines.append('')
+            #   term_display_P(myP, P_counter, lines)
             # print my name, then info for each of my RBs.
-            print ''
-            term_display_P(myP, P_counter)
+            lines.append('')
+            term_display_P(myP, P_counter, lines)
         # draw each RB that has no Ps above it.
         RB_counter = 0
         for myRB in memory.RBs:
@@ -905,7 +1155,7 @@ def term_network_display(memory, set_to_display):
             RB_counter += 1
             # if that RB has no Ps above it (i.e., myRB.myParentPs is empty), then draw it.
             # NOTE: term_display_RB function takes care of not drawing RBs without P parents.
-            term_display_RB(myRB, RB_counter)
+            term_display_RB(myRB, RB_counter, lines)
         # for draw each PO that has no RBs.
         PO_counter = 0
         for myPO in memory.POs:
@@ -913,21 +1163,30 @@ def term_network_display(memory, set_to_display):
             PO_counter += 1
             # if that PO has no RBs (i.e., myPO.myRBs is empty), then draw it.
             # NOTE: term_display_PO function takes care of not drawing POs with no RBs.
-            term_display_PO(myPO, PO_counter)
+            term_display_PO(myPO, PO_counter, lines)
+    sys.stdout.write('\n'.join(lines) + '\n')
 
-# function to display a group and all its tokens (for use with .term_network_display).
-def term_display_group(group, counter):
-    print 'group', counter, '. ', group.name
+# function to display a group and all its tokens (for use with .term_network_display; if lines is given, the lines are added to it rather than written to the screen).
+def term_display_group(group, counter, lines=None):
+    write = lines is None
+    if write:
+        lines = []
+    lines.append('group ' + str(counter) + ' .  ' + group.name)
     for group2 in group.myGroups:
         myindex = group2.myindex + 1
-        term_display_group(group2, myindex)
+        term_display_group(group2, myindex, lines)
     for myP in group.myPs:
         myindex = myP.myindex + 1
-        term_display_P(myP, myindex)
+        term_display_P(myP, myindex, lines)
+    if write:
+        sys.stdout.write('\n'.join(lines) + '\n')
 
-# function to display a P and all its tokens (for use with .term_network_display).
-def term_display_P(myP, counter):
-    print 'P ', counter, '. ', myP.name
+# function to display a P and all its tokens (for use with .term_network_display; if lines is given, the lines are added to it rather than written to the screen).
+def term_display_P(myP, counter, lines=None):
+    write = lines is None
+    if write:
+        lines = []
+    lines.append('P  ' + str(counter) + ' .  ' + myP.name)
     for myRB in myP.myRBs:
         RB_string = myRB.name + '-- Pred_name: ' + myRB.myPred[0].name + ' ('
         for link in myRB.myPred[0].mySemantics:
@@ -940,12 +1199,17 @@ def term_display_P(myP, counter):
             RB_string += ')'
         elif len(myRB.myChildP) > 0:
             RB_string = RB_string + ') -- PROP_name:' + myRB.myChildP[0].name + ' '
-        print RB_string
+        lines.append(RB_string)
+    if write:
+        sys.stdout.write('\n'.join(lines) + '\n')
 
-# function to display RB and all its tokens (for use with .term_network_display).
-def term_display_RB(myRB, counter):
+# function to display RB and all its tokens (for use with .term_network_display; if lines is given, the lines are added to it rather than written to the screen).
+def term_display_RB(myRB, counter, lines=None):
+    write = lines is None
+    if write:
+        lines = []
     if len(myRB.myParentPs) == 0:
-        print ''
+        lines.append('')
         RB_string = 'RB ' + str(counter) + '.' + myRB.name + '-- Pred_name: ' + myRB.myPred[0].name + ' ('
         for link in myRB.myPred[0].mySemantics:
             RB_string = RB_string + link.mySemantic.name + '-' + str(link.weight) + ', '
@@ -953,52 +1217,43 @@ def term_display_RB(myRB, counter):
         for link in myRB.myObj[0].mySemantics:
             RB_string = RB_string + link.mySemantic.name + '-' + str(link.weight) + ', '
         RB_string += ')'
-        print RB_string
+        lines.append(RB_string)
+    if write:
+        sys.stdout.write('\n'.join(lines) + '\n')
 
-# function to display PO (for use with .term_network_display).
-def term_display_PO(myPO, counter):
+# function to display PO (for use with .term_network_display; if lines is given, the lines are added to it rather than written to the screen).
+def term_display_PO(myPO, counter, lines=None):
+    write = lines is None
+    if write:
+        lines = []
     if len(myPO.myRBs) == 0:
-        print ''
+        lines.append('')
         PO_string = 'PO ' + str(counter) + '. -- Obj_name: ' + myPO.name + ' ('
         for link in myPO.mySemantics:
             PO_string = PO_string + link.mySemantic.name + '-' + str(link.weight) + ', '
         PO_string += ')'
-        print PO_string
+        lines.append(PO_string)
+    if write:
+        sys.stdout.write('\n'.join(lines) + '\n')
 
-# function to display the mapping state of the network (i.e., how driver and recipient map).
+# function to display the mapping state of the network (i.e., how driver and recipient map), from the .max_map_unit and .max_map fields of the driver tokens.
 def term_map_display(memory):
     # for each item in the driver, write its name and show the unit in the recipient it most maps to and the mapping weight.
-    memory = basicRunDORA.get_max_map_units(memory)
-    for group in memory.driver.Groups:
-        if group.max_map_unit:
-            group_string = 'GROUP: ' + group.name + ' -- ' + group.max_map_unit.name + ' -- mapping_weight=', group.max_map
-        else:
-            group_string = 'GROUP: ' + group.name + ' -- ' + 'NONE' + ' -- mapping_weight=', group.max_map
-        print group_string
-    for myP in memory.driver.Ps:
-        if myP.max_map_unit:
-            P_string = 'P: ' + myP.name + ' -- ' + myP.max_map_unit.name + ' -- mapping_weight=', myP.max_map
-        else:
-            P_string = 'P: ' + myP.name + ' -- ' + 'NONE' + ' -- mapping_weight=', myP.max_map
-        print P_string
-    for myRB in memory.driver.RBs:
-        if myRB.max_map_unit:
-            RB_string = 'RB: ' + myRB.name + ' -- ' + myRB.max_map_unit.name + ' -- mapping_weight=', myRB.max_map
-        else:
-            RB_string = 'RB: ' + myRB.name + ' -- ' + 'NONE' + ' -- mapping_weight=', myRB.max_map
-        print RB_string
-    for myPO in memory.driver.POs:
-        if myPO.max_map_unit:
-            PO_string = 'PO: ' + myPO.name + ' -- ' + myPO.max_map_unit.name + ' -- mapping_weignt=', myPO.max_map
-        else:
-            PO_string = 'PO: ' + myPO.name + ' -- ' +'NONE' + ' -- mapping_weignt=', myPO.max_map
-        print PO_string
+    lines = []
+    for label, tokens in (('GROUP', memory.driver.Groups), ('P', memory.driver.Ps), ('RB', memory.driver.RBs), ('PO', memory.driver.POs)):
+        for token in tokens:
+            if token.max_map_unit:
+                map_name = token.max_map_unit.name
+            else:
+                map_name = 'NONE'
+            lines.append(label + ': ' + token.name + ' -- ' + map_name + ' -- mapping_weight= ' + str(token.max_map))
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 # function to display names of all tokens of a particular type and their place in memory.
 def display_token_names(memory, token):
     if token == 'GROUP':
         group_counter = 0
-        for group in memory.groups:
+        for group in memory.Groups:
             group_counter += 1
             print group_counter, ' -- ', group.name
     if token == 'P':
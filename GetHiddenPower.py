@@ -6,26 +6,23 @@ import time
 import cPickle
 from datetime import datetime
 from utils import *
-from rnn_theano import RNNTheano
+from rnn_numpy import RNNNumpy
 
 # Create the training data
 x, y = cPickle.load(open('OnlyNPs_codeonly.cPickle', 'rb'))
 X_train = np.array(x, dtype='float32')
 y_train = np.array(y, dtype='float32')
 
-# Specify model
-model = RNNTheano(10, 333, hidden_dim = 30)
+# Specify model (forward passes only, so the NumPy model: no Theano compilation)
+model = RNNNumpy(10, 333, hidden_dim = 30)
 
 # Load previously saved model
 load_model_parameters_theano('model_parameters_OnlyNPs.npz', model)
 
-#itearte over the full dataset to get the array of hidden states
+#get the array of hidden states for the full dataset (all sentences at once)
 def get_hidden_states(input_array):
-    emptylist = []
-    for i in range(len(input_array)):
-        _, s = model.forward_propagation(X_train[i])
-        emptylist.append(s)
-    return np.array(emptylist)
+    _, s = model.forward_propagation(input_array)
+    return s
 hidden_states = get_hidden_states(X_train)
 print hidden_states.shape
     
@@ -0,0 +1,128 @@
+# LTMstore_DING.py
+
+# disk-backed long-term memory for DORA. Analogs are kept in a local SQLite file as the sym props that describe them (so each stored analog carries its tokens, its semantics, and the weights of the links between them), along with an index from each semantic to the analogs that use it. Analogs are only built into memory (i.e., hydrated with buildNetwork_DING.makeAnalog()) when retrieval or a query needs them, and at most max_resident hydrated analogs are kept in memory at a time (the least recently used analog that is not in the driver or recipient is removed from memory to make room).
+# NOTE: changes made to a hydrated analog while it is in memory (e.g., by learning) are not written back to the store. To keep such an analog, add it to the store again with add_analog().
+
+# imports.
+import json, sqlite3
+from collections import OrderedDict
+import buildNetwork_DING
+
+class LTMstore(object):
+    def __init__(self, path, max_resident=1000):
+        self.path = path
+        self.max_resident = max_resident
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS analogs (id INTEGER PRIMARY KEY, props TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS analog_semantics (semantic TEXT, analog_id INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS semantic_index ON analog_semantics (semantic)')
+        self.connection.commit()
+        self.resident = OrderedDict() # stored analog id -> Analog in memory, least recently used first.
+
+    # function to add an analog (a list of sym props, all with the same 'analog' number) to the store. The props are stored with their set as 'memory'. Returns the stored analog's id.
+    def add_analog(self, props):
+        props = [dict(prop, set='memory') for prop in props]
+        cursor = self.connection.execute('INSERT INTO analogs (props) VALUES (?)', (json.dumps(props),))
+        analog_id = cursor.lastrowid
+        self.connection.executemany('INSERT INTO analog_semantics (semantic, analog_id) VALUES (?, ?)', [(semantic, analog_id) for semantic in get_prop_semantics(props)])
+        self.connection.commit()
+        return analog_id
+
+    # function to add all the memory analogs of a sym file (a list of sym props) to the store. Returns the stored analog ids.
+    def add_symfile(self, symProps):
+        analogs = OrderedDict()
+        for prop in symProps:
+            if prop['set'] == 'memory':
+                analogs.setdefault(prop['analog'], []).append(prop)
+        return [self.add_analog(props) for props in analogs.values()]
+
+    # function to return the number of analogs in the store.
+    def num_analogs(self):
+        return self.connection.execute('SELECT COUNT(*) FROM analogs').fetchone()[0]
+
+    # function to return the ids of the stored analogs with a PO connected to any of the named semantics.
+    def find_analogs(self, semantic_names):
+        analog_ids = set()
+        semantic_names = list(set(semantic_names))
+        # query in chunks to stay under SQLite's limit on the number of parameters.
+        for start in range(0, len(semantic_names), 500):
+            chunk = semantic_names[start:start+500]
+            rows = self.connection.execute('SELECT DISTINCT analog_id FROM analog_semantics WHERE semantic IN (%s)' % ','.join('?'*len(chunk)), chunk)
+            analog_ids.update(row[0] for row in rows)
+        return sorted(analog_ids)
+
+    # function to make sure the stored analogs with the given ids are in memory, building any that are not, and marking them all as recently used. Evicts least recently used analogs if there are more than max_resident in memory.
+    def hydrate(self, memory, analog_ids):
+        for analog_id in analog_ids:
+            if analog_id in self.resident:
+                # mark as most recently used.
+                self.resident[analog_id] = self.resident.pop(analog_id)
+            else:
+                row = self.connection.execute('SELECT props FROM analogs WHERE id = ?', (analog_id,)).fetchone()
+                if row is None:
+                    print 'LTMstore: there is no analog', analog_id, 'in', self.path
+                    continue
+                num_analogs = len(memory.analogs)
+                memory = buildNetwork_DING.makeAnalog(json.loads(row[0]), memory)
+                if len(memory.analogs) > num_analogs:
+                    self.resident[analog_id] = memory.analogs[-1]
+        memory = self.evict(memory)
+        # done.
+        return memory
+
+    # function to hydrate every stored analog with a PO connected to any of the named semantics.
+    def hydrate_matching(self, memory, semantic_names):
+        return self.hydrate(memory, self.find_analogs(semantic_names))
+
+    # function to hydrate the stored analogs that share semantics with the driver (i.e., POs whose .set is 'driver'), so they can be retrieved.
+    def hydrate_for_driver(self, memory):
+        semantic_names = set()
+        for myPO in memory.POs:
+            if myPO.set == 'driver':
+                for link in myPO.mySemantics:
+                    semantic_names.add(link.mySemantic.name)
+        return self.hydrate_matching(memory, semantic_names)
+
+    # function to remove least recently used analogs from memory until at most max_resident are in memory. Analogs with tokens in the driver, recipient, or newSet are kept.
+    def evict(self, memory):
+        to_evict = []
+        num_resident = len(self.resident)
+        for analog_id, analog in self.resident.items():
+            if num_resident - len(to_evict) <= self.max_resident:
+                break
+            if all(token.set == 'memory' for token in analog.myPs + analog.myRBs + analog.myPOs):
+                to_evict.append(analog_id)
+        if len(to_evict) > 0:
+            memory = remove_analogs(memory, [self.resident.pop(analog_id) for analog_id in to_evict])
+        # done.
+        return memory
+
+# function to get the names of all the semantics used in a list of sym props.
+def get_prop_semantics(props):
+    names = set()
+    for prop in props:
+        for myRB in prop['RBs']:
+            for semantic in myRB.get('pred_sem', []) + myRB.get('object_sem', []):
+                # a semantic is either a name, or a list starting with the name.
+                if type(semantic) is list:
+                    names.add(semantic[0])
+                else:
+                    names.add(semantic)
+    return names
+
+# function to remove analogs (and their tokens and semantic links) from memory. Semantics are kept, as other analogs may use them.
+def remove_analogs(memory, analogs):
+    removed = set()
+    for analog in analogs:
+        removed.update(id(token) for token in analog.myGroups + analog.myPs + analog.myRBs + analog.myPOs)
+    memory.Groups = [Group for Group in memory.Groups if id(Group) not in removed]
+    memory.Ps = [myP for myP in memory.Ps if id(myP) not in removed]
+    memory.RBs = [myRB for myRB in memory.RBs if id(myRB) not in removed]
+    memory.POs = [myPO for myPO in memory.POs if id(myPO) not in removed]
+    memory.Links = [link for link in memory.Links if id(link.myPO) not in removed]
+    for semantic in memory.semantics:
+        semantic.myPOs = [link for link in semantic.myPOs if id(link.myPO) not in removed]
+    removed_analogs = set(id(analog) for analog in analogs)
+    memory.analogs = [analog for analog in memory.analogs if id(analog) not in removed_analogs]
+    # done.
+    return memory
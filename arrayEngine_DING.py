@@ -0,0 +1,557 @@
+# arrayEngine_DING.py
+
+# array engine for DORA's time-steps. A plan is compiled for the current network (the driver, recipient, and newSet tokens, the other tokens they read from, and the semantics) and settings (asDORA, phase_set >= 1, lateral_input_level, and the ignore_object_semantics and ignore_memory_semantics flags). The plan holds the state of the network in numpy arrays, along with static index arrays over them, and time_step() reproduces basicRunDORA_DING.runDORA.time_step_activations() with whole-array operations. The branches on the settings, on predOrObj, and on which set a token is in are worked out once, when the plan is compiled. The branches on P and RB modes are worked out when the plan is specialized for the current modes (see specialize_plan()), which happens again only when a mode flips.
+# NOTE: networks with Groups are not supported (the Groups constructor is broken anyway). Neither are the configurations where the object engine stops with an error: a recipient P in child mode that shares no RB with a recipient PO when asDORA, ignore_object_semantics with recipient POs in different RBs (see dataTypes_DING.POUnit.update_input_recipient()), a recipient PO with no semantic weight, and a newSet P with no maker unit. plan.supported is False for these, and basicRunDORA_DING falls back to the object engine.
+
+# imports.
+import numpy as np
+
+# the components of a token's input (the rows of executionPlan.inputs).
+TD, BU, LATERAL, MAP = 0, 1, 2, 3
+
+# class to hold a compiled plan and the array-backed state of the network it runs.
+class executionPlan(object):
+    def __init__(self):
+        self.settings = None # (asDORA, phase_set >= 1, lateral_input_level, ignore_object_semantics for recipient POs, ignore_object_semantics for semantics, ignore_memory_semantics).
+        self.structure_key = None # the network the plan was compiled for (see get_structure_key()).
+        self.tokens = [] # the driver, recipient, and newSet tokens (the tokens the plan updates), followed by the other tokens they read from (whose state is held fixed).
+        self.positions = {} # id(token) -> position in tokens.
+        self.num_updated = 0
+        self.dtype = np.dtype(np.float64) # the dtype of the acts, inputs, and weights.
+        self.semantics = [] # memory.semantics.
+        self.semantic_positions = {} # id(semantic) -> position in semantics.
+        self.driver_Ps, self.driver_RBs, self.driver_POs = None, None, None # numpy arrays of positions in tokens.
+        self.recipient_Ps, self.recipient_RBs, self.recipient_POs = None, None, None
+        self.driver_objects, self.recipient_objects = None, None
+        self.moded_units = None # positions of the Ps and RBs the plan updates.
+        self.static_edges = [] # list of (source position, target position, component, weight): the target gets weight*(act of the source) added to that component of its input. For the terms that do not depend on modes.
+        self.static_groups = [] # list of (member positions, target positions, component, weight): every target gets weight*(sum of the acts of the members) added to that component of its input.
+        self.P_edges = {} # position of a driver or recipient P -> {mode: list of edges for the terms of its input in that mode}.
+        self.P_inhibits_POs = {} # position of a recipient P -> whether it shares no parent RB with some recipient PO.
+        self.RB_parent_RBs = {} # position of a recipient RB -> positions of its distinct parent RBs in the recipient.
+        self.mapping_connections = [] # the mapping connections the recipient tokens read.
+        self.mapping_sources, self.mapping_targets, self.mapping_flat_targets = None, None, None
+        self.semantic_links = [] # the links the semantics read.
+        self.semantic_link_POs, self.semantic_link_semantics = None, None
+        self.bu_links = [] # the links the recipient POs read their bu input through.
+        self.bu_link_POs, self.bu_link_semantics = None, None
+        self.mode_Ps = None # positions of the driver and recipient Ps (the Ps get_Pmode() is run on).
+        self.P_down_sources, self.P_down_targets, self.P_up_sources, self.P_up_targets = None, None, None, None
+        self.mode_RBs = None # positions of the driver and recipient RBs (the RBs get_RBmode() is run on).
+        self.RB_down_sources, self.RB_down_targets, self.RB_up_sources, self.RB_up_targets = None, None, None, None
+        self.RB_has_parent = None
+        self.inhibitor_units, self.inhibitor_thresholds, self.inhibitor_is_PO = None, None, None
+        self.newSet_units, self.newSet_makers = None, None
+        self.compile_problem = None # why the plan can not run the network (None if it can).
+        # specialization for the current modes (see specialize_plan()).
+        self.mode_units = None # positions of the driver and recipient Ps and the recipient RBs (the units whose modes the plan is specialized for).
+        self.modes = None
+        self.specialized_modes = None
+        self.mode_problem = None
+        self.edge_sources, self.edge_targets, self.edge_weights = None, None, None
+        self.groups = []
+        self.old_inhibitor_terms, self.new_inhibitor_terms = None, None
+        # state.
+        self.act = None # over all the tokens.
+        self.max_map = None # over all the tokens.
+        self.inputs = None # numpy array (4 x num_updated) of td, bu, lateral, and map inputs.
+        self.net_input = None
+        self.inhibitor_input, self.inhibitor_act = None, None
+        self.mode = None
+        self.inferred = None
+        self.semNormalization = None
+        self.mapping_weights = None
+        self.semantic_link_weights, self.bu_link_weights = None, None
+        self.semantic_act, self.semantic_input = None, None
+        self.max_sem_input = 0.0
+        self.local_inhibitor_act, self.global_inhibitor_act = 0.0, 0.0
+        self.local_inhibitor_fired = False
+        self.gather_problem = None
+        self.supported = True
+
+# function to get the key of the network a plan is compiled for: the lists of units in each set, and the number of units, links, and mapping connections in memory.
+def get_structure_key(memory):
+    unit_lists = [memory.driver.Groups, memory.driver.Ps, memory.driver.RBs, memory.driver.POs, memory.recipient.Groups, memory.recipient.Ps, memory.recipient.RBs, memory.recipient.POs, memory.newSet.Groups, memory.newSet.Ps, memory.newSet.RBs, memory.newSet.POs, memory.semantics, memory.mappingConnections]
+    return tuple((id(units), len(units)) for units in unit_lists) + (len(memory.Groups), len(memory.Ps), len(memory.RBs), len(memory.POs), len(memory.Links))
+
+# function to return the position of a token in the plan, adding it as a fixed token if it is not there yet.
+def get_position(plan, token):
+    position = plan.positions.get(id(token))
+    if position is None:
+        position = len(plan.tokens)
+        plan.positions[id(token)] = position
+        plan.tokens.append(token)
+    return position
+
+# function to return the distinct tokens in a list (in order).
+def distinct(tokens):
+    seen, result = set(), []
+    for token in tokens:
+        if id(token) not in seen:
+            seen.add(id(token))
+            result.append(token)
+    return result
+
+# function to check whether two lists of tokens share a token.
+def share_token(tokens1, tokens2):
+    ids = set(id(token) for token in tokens1)
+    return any(id(token) in ids for token in tokens2)
+
+# function to add an edge from each of a list of tokens to a target.
+def add_edges(plan, edges, sources, target, component, weight):
+    for source in sources:
+        edges.append((get_position(plan, source), target, component, weight))
+    return edges
+
+# function to make (source, target) index arrays from a list of pairs.
+def pair_arrays(pairs):
+    if len(pairs) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    pairs = np.array(pairs, dtype=int)
+    return pairs[:, 0], pairs[:, 1]
+
+# function to compile a plan for the network in memory and the given settings (see executionPlan.settings), holding its acts, inputs, and weights as dtype (e.g., 'float32' to halve the memory they take). The plan still has to be loaded with the state of the network (see gather_state()) before it can run, and is specialized for the current modes when it runs.
+def compile_plan(memory, settings, dtype=np.float64):
+    asDORA, after_first_phase_set, lateral_input_level, ignore_object_semantics, semantic_ignore_objects, ignore_memory_semantics = settings
+    plan = executionPlan()
+    plan.settings = settings
+    plan.dtype = np.dtype(dtype)
+    plan.structure_key = get_structure_key(memory)
+    if len(memory.Groups) > 0 or len(memory.newSet.Groups) > 0:
+        plan.compile_problem = 'the network has Groups'
+    # lay out the tokens the plan updates.
+    layout = []
+    for tokens in [memory.driver.Ps, memory.driver.RBs, memory.driver.POs, memory.recipient.Ps, memory.recipient.RBs, memory.recipient.POs, memory.newSet.Ps, memory.newSet.RBs, memory.newSet.POs]:
+        start = len(plan.tokens)
+        for token in tokens:
+            plan.positions[id(token)] = len(plan.tokens)
+            plan.tokens.append(token)
+        layout.append(np.arange(start, len(plan.tokens)))
+    plan.num_updated = len(plan.tokens)
+    plan.driver_Ps, plan.driver_RBs, plan.driver_POs, plan.recipient_Ps, plan.recipient_RBs, plan.recipient_POs = layout[:6]
+    plan.driver_objects = np.array([plan.positions[id(myPO)] for myPO in memory.driver.POs if myPO.predOrObj == 0], dtype=int)
+    plan.recipient_objects = np.array([plan.positions[id(myPO)] for myPO in memory.recipient.POs if myPO.predOrObj == 0], dtype=int)
+    plan.moded_units = np.concatenate((layout[0], layout[1], layout[3], layout[4], layout[6], layout[7]))
+    plan.semantics = memory.semantics
+    for position, semantic in enumerate(memory.semantics):
+        plan.semantic_positions[id(semantic)] = position
+    edges, groups = [], []
+    # driver RBs: td from their Ps, bu from their pred, object, and child P, lateral from the other driver RBs*10 (all the driver RBs, and back out of itself).
+    for myRB in memory.driver.RBs:
+        target = plan.positions[id(myRB)]
+        edges = add_edges(plan, edges, myRB.myParentPs, target, TD, 1.0)
+        edges = add_edges(plan, edges, myRB.myPred[:1] + myRB.myObj[:1] + myRB.myChildP[:1], target, BU, 1.0)
+        edges.append((target, target, LATERAL, 10.0))
+    groups.append((plan.driver_RBs, plan.driver_RBs, LATERAL, -10.0))
+    # driver POs: td from their RBs (*2 for preds), lateral from the other driver POs*3 (only from those not in the same RB, if not asDORA).
+    for myPO in memory.driver.POs:
+        target = plan.positions[id(myPO)]
+        edges = add_edges(plan, edges, myPO.myRBs, target, TD, 2.0 if myPO.predOrObj == 1 else 1.0)
+        edges.append((target, target, LATERAL, 3.0))
+        if not asDORA:
+            edges = add_edges(plan, edges, [PO for PO in distinct(myPO.same_RB_POs) if PO.set == 'driver' and PO is not myPO], target, LATERAL, 3.0)
+    groups.append((plan.driver_POs, plan.driver_POs, LATERAL, -3.0))
+    # recipient RBs: td from their Ps (after the first phase set), bu from their pred, object, child P, and child RB. (Mapping input is below, and lateral input depends on the modes of the other recipient RBs; see specialize_plan().)
+    for myRB in memory.recipient.RBs:
+        target = plan.positions[id(myRB)]
+        if after_first_phase_set:
+            edges = add_edges(plan, edges, myRB.myParentPs, target, TD, 1.0)
+        edges = add_edges(plan, edges, myRB.myPred[:1] + myRB.myObj[:1] + myRB.myChildP[:1] + myRB.myChildRB[:1], target, BU, 1.0)
+        plan.RB_parent_RBs[target] = np.array([plan.positions[id(RB)] for RB in distinct(myRB.myParentRB) if RB.set == 'recipient' and RB is not myRB], dtype=int)
+    # recipient POs: td from their RBs (*2 for preds, after the first phase set), lateral from the other recipient POs (*lateral_input_level, and from those in the same RB *2*lateral_input_level if asDORA, and not at all if not asDORA), and, if asDORA and after the first phase set, td inhibition from the recipient RBs they are not connected to. (bu input from semantics and mapping input are below.)
+    for myPO in memory.recipient.POs:
+        target = plan.positions[id(myPO)]
+        if after_first_phase_set:
+            edges = add_edges(plan, edges, myPO.myRBs, target, TD, 2.0 if myPO.predOrObj == 1 else 1.0)
+            if asDORA:
+                edges = add_edges(plan, edges, [RB for RB in distinct(myPO.myRBs) if RB.set == 'recipient'], target, TD, 1.0)
+        same_RB_POs = [PO for PO in distinct(myPO.same_RB_POs) if PO.set == 'recipient' and PO is not myPO]
+        edges.append((target, target, LATERAL, lateral_input_level))
+        edges = add_edges(plan, edges, same_RB_POs, target, LATERAL, -lateral_input_level if asDORA else lateral_input_level)
+        if ignore_object_semantics and len(memory.recipient.POs) - 1 > len(same_RB_POs):
+            plan.compile_problem = 'ignore_object_semantics with recipient POs in different RBs'
+    groups.append((plan.recipient_POs, plan.recipient_POs, LATERAL, -lateral_input_level))
+    if asDORA and after_first_phase_set:
+        groups.append((plan.recipient_RBs, plan.recipient_POs, TD, -1.0))
+    plan.static_edges, plan.static_groups = edges, groups
+    # Ps: the terms of their input in each mode (the lateral input from other Ps in the same mode is set when the plan is specialized).
+    for myP in memory.driver.Ps:
+        target = plan.positions[id(myP)]
+        parent_edges = add_edges(plan, [], myP.myRBs, target, BU, 1.0)
+        child_edges = add_edges(plan, [], myP.myParentRBs, target, TD, 1.0)
+        if not asDORA:
+            child_edges = add_edges(plan, child_edges, [myPO for myPO in memory.driver.POs if myPO.predOrObj == 0 and not share_token(myP.myRBs, myPO.myRBs)], target, LATERAL, -1.0)
+        plan.P_edges[target] = {1: parent_edges, -1: child_edges}
+    for myP in memory.recipient.Ps:
+        target = plan.positions[id(myP)]
+        parent_edges = add_edges(plan, [], myP.myRBs, target, BU, 1.0)
+        child_edges = []
+        if after_first_phase_set:
+            child_edges = add_edges(plan, child_edges, myP.myParentRBs, target, TD, 1.0)
+        if asDORA:
+            # (in child mode, a P gets inhibition from all the recipient POs, and back out of the POs that share an RB with it.)
+            child_edges = add_edges(plan, child_edges, [myPO for myPO in memory.recipient.POs if share_token(myP.myRBs, myPO.myRBs)], target, LATERAL, 1.0)
+        plan.P_edges[target] = {1: parent_edges, -1: child_edges}
+        plan.P_inhibits_POs[target] = any(not share_token(myPO.myRBs, myP.myParentRBs) for myPO in memory.recipient.POs)
+    # mapping connections of the recipient tokens (POs only read mapping connections from driver POs of the same type).
+    sources, targets = [], []
+    for token in memory.recipient.Ps + memory.recipient.RBs + memory.recipient.POs:
+        for mappingConnection in token.mappingConnections:
+            if token.my_type == 'PO' and mappingConnection.driverToken.predOrObj != token.predOrObj:
+                continue
+            plan.mapping_connections.append(mappingConnection)
+            sources.append(get_position(plan, mappingConnection.driverToken))
+            targets.append(plan.positions[id(token)])
+    plan.mapping_sources, plan.mapping_targets = np.array(sources, dtype=int), np.array(targets, dtype=int)
+    # links the semantics read (never from newSet POs, from memory POs only if not ignore_memory_semantics, and only from preds if ignore_object_semantics).
+    pairs = []
+    for position, semantic in enumerate(memory.semantics):
+        for link in semantic.myPOs:
+            myPO = link.myPO
+            if myPO.set == 'newSet' or (ignore_memory_semantics and myPO.set == 'memory') or (semantic_ignore_objects and myPO.predOrObj != 1):
+                continue
+            plan.semantic_links.append(link)
+            pairs.append((get_position(plan, myPO), position))
+    plan.semantic_link_POs, plan.semantic_link_semantics = pair_arrays(pairs)
+    # links the recipient POs read.
+    pairs = []
+    for myPO in memory.recipient.POs:
+        for link in myPO.mySemantics:
+            plan.bu_links.append(link)
+            pairs.append((plan.positions[id(myPO)], plan.semantic_positions[id(link.mySemantic)]))
+    plan.bu_link_POs, plan.bu_link_semantics = pair_arrays(pairs)
+    # modes: Ps compare the acts of their RBs with those of their parent RBs, RBs the acts of their child RBs with those of their parent RBs.
+    plan.mode_Ps = np.concatenate((plan.driver_Ps, plan.recipient_Ps))
+    down, up = [], []
+    for index, position in enumerate(plan.mode_Ps):
+        myP = plan.tokens[position]
+        down.extend((get_position(plan, myRB), index) for myRB in myP.myRBs)
+        up.extend((get_position(plan, myRB), index) for myRB in myP.myParentRBs)
+    plan.P_down_sources, plan.P_down_targets = pair_arrays(down)
+    plan.P_up_sources, plan.P_up_targets = pair_arrays(up)
+    plan.mode_RBs = np.concatenate((plan.driver_RBs, plan.recipient_RBs))
+    down, up = [], []
+    for index, position in enumerate(plan.mode_RBs):
+        myRB = plan.tokens[position]
+        down.extend((get_position(plan, childRB), index) for childRB in myRB.myChildRB)
+        up.extend((get_position(plan, parentRB), index) for parentRB in myRB.myParentRB)
+    plan.RB_down_sources, plan.RB_down_targets = pair_arrays(down)
+    plan.RB_up_sources, plan.RB_up_targets = pair_arrays(up)
+    plan.RB_has_parent = np.array([len(plan.tokens[position].myParentRB) > 0 for position in plan.mode_RBs], dtype=bool)
+    plan.mode_units = np.concatenate((plan.mode_Ps, plan.recipient_RBs))
+    # inhibitors of the driver and recipient RBs and POs.
+    plan.inhibitor_units = np.concatenate((plan.driver_RBs, plan.driver_POs, plan.recipient_RBs, plan.recipient_POs))
+    plan.inhibitor_thresholds = np.array([plan.tokens[position].inhibitorThreshold for position in plan.inhibitor_units], dtype=float)
+    plan.inhibitor_is_PO = np.array([plan.tokens[position].my_type == 'PO' for position in plan.inhibitor_units], dtype=bool)
+    # newSet tokens take their act from the tokens that made them.
+    pairs = []
+    for position in np.concatenate(layout[6:]):
+        token = plan.tokens[position]
+        if token.my_maker_unit:
+            pairs.append((position, get_position(plan, token.my_maker_unit)))
+        elif token.my_type == 'P':
+            plan.compile_problem = 'a newSet P has no maker unit'
+    plan.newSet_units, plan.newSet_makers = pair_arrays(pairs)
+    # index arrays that need the final number of tokens.
+    N = plan.num_updated
+    plan.mapping_flat_targets = MAP*N + plan.mapping_targets
+    plan.supported = plan.compile_problem is None
+    # done.
+    return plan
+
+# function to turn a list of edges into (source, flat target, weight) arrays, where the flat target is component*num_updated + target position (i.e., the position in plan.inputs.ravel()).
+def edge_arrays(plan, edges):
+    if len(edges) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=plan.dtype)
+    sources, targets, components, weights = zip(*edges)
+    return np.array(sources, dtype=int), np.array(components, dtype=int)*plan.num_updated + np.array(targets, dtype=int), np.array(weights, dtype=plan.dtype)
+
+# function to specialize the plan for the current modes of the driver and recipient Ps and recipient RBs. Does nothing if the modes are the ones the plan is already specialized for. Returns True if the plan can run the network in these modes.
+def specialize_plan(plan):
+    specialized_modes = plan.mode[plan.mode_units]
+    modes = specialized_modes.tostring()
+    if modes == plan.modes:
+        return plan.mode_problem is None
+    plan.modes = modes
+    plan.specialized_modes = specialized_modes
+    plan.mode_problem = None
+    asDORA, after_first_phase_set, lateral_input_level = plan.settings[:3]
+    mode = plan.mode
+    edges = list(plan.static_edges)
+    groups = list(plan.static_groups)
+    # Ps only get input in parent or child mode, and Ps in parent mode get lateral inhibition from the other Ps in parent mode (*3 in the driver, *lateral_input_level in the recipient), and driver Ps in child mode from the other driver Ps in child mode.
+    driver_parents = plan.driver_Ps[mode[plan.driver_Ps] == 1]
+    driver_children = plan.driver_Ps[mode[plan.driver_Ps] == -1]
+    recipient_parents = plan.recipient_Ps[mode[plan.recipient_Ps] == 1]
+    recipient_children = plan.recipient_Ps[mode[plan.recipient_Ps] == -1]
+    for position in plan.mode_Ps:
+        if mode[position] != 0:
+            edges.extend(plan.P_edges[position][mode[position]])
+    groups.append((driver_parents, driver_parents, LATERAL, -3.0))
+    edges.extend((position, position, LATERAL, 3.0) for position in driver_parents)
+    groups.append((driver_children, driver_children, LATERAL, -1.0))
+    edges.extend((position, position, LATERAL, 1.0) for position in driver_children)
+    groups.append((recipient_parents, recipient_parents, LATERAL, -lateral_input_level))
+    edges.extend((position, position, LATERAL, lateral_input_level) for position in recipient_parents)
+    # Ps in child mode get lateral inhibition from POs (in the driver, all objects if asDORA; in the recipient, all POs if asDORA and objects if not), and recipient objects get lateral inhibition from recipient Ps in child mode if not asDORA.
+    if asDORA:
+        groups.append((plan.driver_objects, driver_children, LATERAL, -1.0))
+        groups.append((plan.recipient_POs, recipient_children, LATERAL, -1.0))
+        if any(plan.P_inhibits_POs[position] for position in recipient_children):
+            plan.mode_problem = 'a recipient P in child mode shares no RB with a recipient PO'
+    else:
+        groups.append((plan.recipient_objects, recipient_children, LATERAL, -1.0))
+        groups.append((recipient_children, plan.recipient_objects, LATERAL, -lateral_input_level))
+    # recipient RBs get lateral inhibition from the other recipient RBs that are not in child mode and are not their parent RBs.
+    active_RBs = plan.recipient_RBs[mode[plan.recipient_RBs] != -1]
+    groups.append((active_RBs, plan.recipient_RBs, LATERAL, -lateral_input_level))
+    edges.extend((position, position, LATERAL, lateral_input_level) for position in active_RBs)
+    for position in plan.recipient_RBs:
+        edges.extend((parent, position, LATERAL, lateral_input_level) for parent in plan.RB_parent_RBs[position] if mode[parent] != -1)
+    plan.edge_sources, plan.edge_targets, plan.edge_weights = edge_arrays(plan, edges)
+    plan.groups = [(members, component*plan.num_updated + targets, weight) for members, targets, component, weight in groups if len(members) > 0 and len(targets) > 0]
+    # driver RBs and POs read their inhibitors before the inhibitors are updated on a time-step, and recipient RBs, POs, and Ps in parent mode after.
+    plan.old_inhibitor_terms = np.concatenate((plan.driver_RBs, plan.driver_POs))
+    plan.new_inhibitor_terms = np.concatenate((plan.recipient_RBs, plan.recipient_POs, recipient_parents))
+    # done.
+    return plan.mode_problem is None
+
+# function to load the state of the network into the plan (the acts, inputs, inhibitors, and modes of the tokens, the acts and inputs of the semantics, the weights of links and mapping connections, and the local and global inhibitors). local_inhibitor_fired is whether the local inhibitor has fired in the current phase set.
+def gather_state(plan, memory, local_inhibitor_fired=False):
+    N = plan.num_updated
+    dtype = plan.dtype
+    updated = plan.tokens[:N]
+    plan.act = np.array([token.act for token in plan.tokens], dtype=dtype)
+    plan.max_map = np.array([token.max_map for token in plan.tokens], dtype=dtype)
+    plan.inputs = np.array([[token.td_input for token in updated], [token.bu_input for token in updated], [token.lateral_input for token in updated], [token.map_input for token in updated]], dtype=dtype).reshape(4, N)
+    plan.net_input = np.array([token.net_input for token in updated], dtype=dtype)
+    plan.inhibitor_input = np.array([token.inhibitor_input for token in updated], dtype=dtype)
+    plan.inhibitor_act = np.array([token.inhibitor_act for token in updated], dtype=dtype)
+    plan.mode = np.array([getattr(token, 'mode', 0) for token in updated], dtype=int)
+    plan.inferred = np.array([bool(token.inferred) for token in updated], dtype=bool)
+    plan.semNormalization = np.ones(N, dtype=dtype)
+    plan.gather_problem = None
+    for position in plan.recipient_POs:
+        myPO = plan.tokens[position]
+        if not myPO.inferred:
+            if not myPO.semNormalization:
+                plan.gather_problem = 'recipient PO ' + str(myPO.name) + ' has no semantic weight'
+            else:
+                plan.semNormalization[position] = myPO.semNormalization
+    plan.mapping_weights = np.array([mappingConnection.weight for mappingConnection in plan.mapping_connections], dtype=dtype)
+    plan.semantic_link_weights = np.array([link.weight for link in plan.semantic_links], dtype=dtype)
+    plan.bu_link_weights = np.array([link.weight for link in plan.bu_links], dtype=dtype)
+    plan.semantic_act = np.array([semantic.act for semantic in plan.semantics], dtype=dtype)
+    plan.semantic_input = np.array([semantic.myinput for semantic in plan.semantics], dtype=dtype)
+    if len(plan.semantics) > 0:
+        plan.max_sem_input = plan.semantics[0].max_sem_input
+    plan.local_inhibitor_act = memory.localInhibitor.act
+    plan.global_inhibitor_act = memory.globalInhibitor.act
+    plan.local_inhibitor_fired = local_inhibitor_fired
+    plan.supported = plan.compile_problem is None and plan.gather_problem is None
+    # done.
+    return plan
+
+# function to write the state of the plan back to the network.
+def scatter_state(plan, memory):
+    N = plan.num_updated
+    acts, net_inputs = plan.act[:N].tolist(), plan.net_input.tolist()
+    td_inputs, bu_inputs, lateral_inputs, map_inputs = plan.inputs.tolist()
+    inhibitor_inputs, inhibitor_acts = plan.inhibitor_input.tolist(), plan.inhibitor_act.tolist()
+    for position in range(N):
+        token = plan.tokens[position]
+        token.act = acts[position]
+        token.td_input, token.bu_input, token.lateral_input, token.map_input = td_inputs[position], bu_inputs[position], lateral_inputs[position], map_inputs[position]
+        token.net_input = net_inputs[position]
+        token.inhibitor_input, token.inhibitor_act = inhibitor_inputs[position], inhibitor_acts[position]
+    modes = plan.mode.tolist()
+    for position in plan.moded_units:
+        plan.tokens[position].mode = modes[position]
+    semantic_acts, semantic_inputs = plan.semantic_act.tolist(), plan.semantic_input.tolist()
+    for position, semantic in enumerate(plan.semantics):
+        semantic.act = semantic_acts[position]
+        semantic.myinput = semantic_inputs[position]
+        semantic.max_sem_input = plan.max_sem_input
+    memory.localInhibitor.act = plan.local_inhibitor_act
+    memory.globalInhibitor.act = plan.global_inhibitor_act
+    # done.
+    return memory
+
+# function to set the modes of the driver and recipient Ps (as PUnit.get_Pmode()).
+def update_P_modes(plan):
+    act = plan.act
+    num_Ps = len(plan.mode_Ps)
+    parent_input = np.bincount(plan.P_down_targets, weights=act[plan.P_down_sources], minlength=num_Ps)
+    child_input = np.bincount(plan.P_up_targets, weights=act[plan.P_up_sources], minlength=num_Ps)
+    plan.mode[plan.mode_Ps] = np.where(parent_input > child_input, 1, np.where(parent_input < child_input, -1, 0))
+    # done.
+    return plan
+
+# function to set the modes of the driver and recipient RBs (as RBUnit.get_RBmode()).
+def update_RB_modes(plan):
+    act = plan.act
+    num_RBs = len(plan.mode_RBs)
+    parent_input = np.bincount(plan.RB_down_targets, weights=act[plan.RB_down_sources], minlength=num_RBs)
+    child_input = np.bincount(plan.RB_up_targets, weights=act[plan.RB_up_sources], minlength=num_RBs)
+    plan.mode[plan.mode_RBs] = np.where(parent_input > child_input, 1, np.where((act[plan.mode_RBs] > 0.0) & plan.RB_has_parent, -1, 0))
+    # done.
+    return plan
+
+# function to run a time-step (as basicRunDORA_DING.runDORA.time_step_activations()) on the plan's state. count_by_RBs is whether to update P modes, do_ding whether to leave the acts of the semantics alone. Returns False (having changed nothing but the modes) if the plan can not run the network as it is, in which case the time-step must be run by the object engine.
+def time_step(plan, gamma, delta, HebbBias, count_by_RBs, do_ding=False):
+    if not plan.supported:
+        return False
+    # 4.3.2) update the modes of the driver and recipient Ps, and specialize the plan for the modes.
+    if count_by_RBs:
+        plan = update_P_modes(plan)
+    if not specialize_plan(plan):
+        return False
+    N = plan.num_updated
+    act = plan.act
+    # 4.3.3, 4.3.9) all the inputs that are sums over the acts of other tokens (every token input reads the acts from before this time-step's update, so both passes are done at once).
+    inputs = np.bincount(plan.edge_targets, weights=plan.edge_weights*act[plan.edge_sources], minlength=4*N).astype(plan.dtype)
+    for members, targets, weight in plan.groups:
+        inputs[targets] += weight*act[members].sum()
+    if len(plan.mapping_connections) > 0:
+        driver_acts = act[plan.mapping_sources]
+        inputs += np.bincount(plan.mapping_flat_targets, weights=(3*plan.mapping_weights*driver_acts) - (plan.max_map[plan.mapping_targets]*driver_acts) - (plan.max_map[plan.mapping_sources]*driver_acts), minlength=4*N)
+    inputs = inputs.reshape(4, N)
+    inputs[LATERAL, plan.old_inhibitor_terms] -= plan.inhibitor_act[plan.old_inhibitor_terms]*10
+    # 4.3.4-5) update the RB and PO inhibitors (PO inhibitors only if asDORA).
+    units = plan.inhibitor_units
+    plan.inhibitor_input[units] += act[units]
+    fired = plan.inhibitor_input[units] >= plan.inhibitor_thresholds
+    if not plan.settings[0]:
+        fired &= ~plan.inhibitor_is_PO
+    plan.inhibitor_act[units[fired]] = 1.0
+    # 4.3.6-7) update the local and global inhibitors.
+    if (plan.inhibitor_act[plan.driver_POs] == 1.0).any():
+        plan.local_inhibitor_act = 1.0
+    if (plan.inhibitor_act[plan.driver_RBs] == 1.0).any():
+        plan.global_inhibitor_act = 1.0
+    # 4.3.8) input to the semantics.
+    plan.semantic_input = np.bincount(plan.semantic_link_semantics, weights=act[plan.semantic_link_POs]*plan.semantic_link_weights, minlength=len(plan.semantics)).astype(plan.dtype)
+    # 4.3.9) the rest of the recipient inputs: inhibitors, and bu input to POs from their semantics (normalized by the POs' semantic weight). Inferred POs get no input.
+    inputs[LATERAL, plan.new_inhibitor_terms] -= plan.inhibitor_act[plan.new_inhibitor_terms]*10
+    semantic_input = np.bincount(plan.bu_link_POs, weights=plan.semantic_act[plan.bu_link_semantics]*plan.bu_link_weights, minlength=N)
+    inputs[BU, plan.recipient_POs] = semantic_input[plan.recipient_POs]/plan.semNormalization[plan.recipient_POs]
+    inputs[:, plan.recipient_POs[plan.inferred[plan.recipient_POs]]] = 0.0
+    # newSet tokens take their act from the tokens that made them.
+    if len(plan.newSet_units) > 0:
+        act[plan.newSet_units] = np.where(act[plan.newSet_makers] > .75, 1.0, 0.0)
+    # 4.3.10) update the acts of the tokens, and, unless you are running a Ding sim, the semantics.
+    net_input = inputs[TD] + inputs[BU] + inputs[LATERAL] + (inputs[MAP]*HebbBias)
+    updated = act[:N]
+    updated += gamma*net_input*(1.1 - updated) - (delta*updated)
+    np.clip(updated, 0.0, 1.0, out=updated)
+    plan.inputs, plan.net_input = inputs, net_input
+    if not do_ding:
+        plan.max_sem_input = max(0.0, plan.semantic_input.max()) if len(plan.semantics) > 0 else 0.0
+        if plan.max_sem_input > 0:
+            plan.semantic_act = plan.semantic_input/plan.max_sem_input
+        else:
+            plan.semantic_act = np.zeros(len(plan.semantics), dtype=plan.dtype)
+    # done.
+    return True
+
+# function to run a time-step of a Ding sim (see basicRunDORA_DING.runDORA.do_ding_ops()) on the plan's state: set the act of the semantics of the current pattern (positions in plan.semantics) to 1.0, update the RB modes, run the time-step, and fire the local inhibitor if necessary. Returns False (as time_step()) if the time-step must be run by the object engine.
+def ding_time_step(plan, pattern_positions, gamma, delta, HebbBias):
+    plan = clamp_semantics(plan, pattern_positions)
+    plan = update_RB_modes(plan)
+    if not time_step(plan, gamma, delta, HebbBias, True, True):
+        return False
+    plan = fire_local_inhibitor(plan)
+    # done.
+    return True
+
+# function to set the act of the given semantics (positions in plan.semantics) to 1.0.
+def clamp_semantics(plan, positions):
+    plan.semantic_act[positions] = 1.0
+    # done.
+    return plan
+
+# function to fire the local inhibitor if it is active and has not fired yet in this phase set (as basicRunDORA_DING.runDORA.time_step_fire_local_inhibitor()): clears the driver and recipient POs and the semantics.
+def fire_local_inhibitor(plan):
+    if plan.settings[0] and plan.local_inhibitor_act >= 0.99 and not plan.local_inhibitor_fired:
+        POs = np.concatenate((plan.driver_POs, plan.recipient_POs))
+        plan.act[POs] = 0.0
+        plan.inputs[:, POs] = 0.0
+        plan.net_input[POs] = 0.0
+        plan.semantic_act[:] = 0.0
+        plan.semantic_input[:] = 0.0
+        plan.local_inhibitor_fired = True
+    # done.
+    return plan
+
+# function to get the positions of a list of units (tokens or semantics) in the plan's state, for reading their acts with get_acts(). The acts of units not in the plan are read now, and held fixed.
+def get_act_positions(plan, units):
+    positions, fixed = [], []
+    num_tokens = len(plan.tokens)
+    for unit in units:
+        if unit.my_type == 'semantic' and id(unit) in plan.semantic_positions:
+            positions.append(num_tokens + plan.semantic_positions[id(unit)])
+        elif id(unit) in plan.positions:
+            positions.append(plan.positions[id(unit)])
+        else:
+            positions.append(num_tokens + len(plan.semantics) + len(fixed))
+            fixed.append(unit.act)
+    # done.
+    return np.array(positions, dtype=int), np.array(fixed, dtype=float)
+
+# function to get the current acts of units (see get_act_positions()) as a list.
+def get_acts(plan, act_positions):
+    positions, fixed = act_positions
+    return np.concatenate((plan.act, plan.semantic_act, fixed))[positions].tolist()
+
+# function to get the peaks of the power spectrum of a trace: the frequencies (in cycles per time-step) of the num_peaks largest local maxima of the power of the trace (less its mean), largest first, and their powers.
+def get_spectral_peaks(trace, num_peaks=3):
+    trace = np.asarray(trace, dtype=np.float64)
+    power = np.abs(np.fft.rfft(trace - trace.mean()))**2
+    frequencies = np.fft.rfftfreq(len(trace))
+    peaks = [index for index in range(1, len(power)-1) if power[index] > 0 and power[index] >= power[index-1] and power[index] >= power[index+1]]
+    peaks = sorted(peaks, key=lambda index: -power[index])[:num_peaks]
+    # done.
+    return [frequencies[index] for index in peaks], [power[index] for index in peaks]
+
+# function to check whether a Ding sim is safe to run in float32. Takes a function that returns a freshly built memory (the same network each call), the run parameters, and the firing order as a list of lists of semantic names, and runs do_ding_ops() with the given engine ('array' or 'jit') in float64 and in float32. Reports the largest and mean difference between the traces of the two runs, and compares the spectral peaks (see get_spectral_peaks()) of the summed token activity (the signal analysed in Ding et al., 2016) and of each unit's trace. Returns a dict of the results.
+def compare_precisions(make_memory, parameters, firing_order_names, engine='array', num_peaks=3):
+    import basicRunDORA_DING
+    units_dicts = {}
+    token_names = None
+    for dtype in ['float64', 'float32']:
+        run_parameters = dict(parameters)
+        run_parameters['engine'], run_parameters['engine_dtype'], run_parameters['doGUI'] = engine, dtype, False
+        network = basicRunDORA_DING.runDORA(make_memory(), run_parameters)
+        firing_order = [[semantic for semantic in network.memory.semantics if semantic.name in names] for names in firing_order_names]
+        network.initialize_run(mapping=False)
+        network.initialize_network_state()
+        units_dicts[dtype] = network.do_ding_ops(firing_order)
+        token_names = set(token.name for token in network.memory.Ps + network.memory.RBs + network.memory.POs)
+    traces64, traces32 = units_dicts['float64'], units_dicts['float32']
+    # trace divergence.
+    differences = np.concatenate([np.abs(np.array(traces64[name]) - np.array(traces32[name])) for name in sorted(traces64)] + [np.zeros(0)])
+    max_divergence = differences.max() if len(differences) > 0 else 0.0
+    mean_divergence = differences.mean() if len(differences) > 0 else 0.0
+    # spectral peaks of the summed token activity (leaving out names shared by several units, whose traces are interleaved in units_dict).
+    num_steps = 110*len(firing_order_names)
+    token_names = [name for name in sorted(token_names) if len(traces64[name]) == num_steps]
+    summed64 = np.sum([traces64[name] for name in token_names] + [np.zeros(num_steps)], axis=0)
+    summed32 = np.sum([traces32[name] for name in token_names] + [np.zeros(num_steps)], axis=0)
+    frequencies64, powers64 = get_spectral_peaks(summed64, num_peaks)
+    frequencies32, powers32 = get_spectral_peaks(summed32, num_peaks)
+    # spectral peaks of each unit (the units whose largest peak is at a different frequency, and the largest relative change in the power of a unit's largest peak).
+    moved_peaks = []
+    max_power_change = 0.0
+    for name in sorted(traces64):
+        unit_frequencies64, unit_powers64 = get_spectral_peaks(traces64[name], 1)
+        unit_frequencies32, unit_powers32 = get_spectral_peaks(traces32[name], 1)
+        if unit_frequencies64 != unit_frequencies32:
+            moved_peaks.append(name)
+        elif len(unit_powers64) > 0:
+            max_power_change = max(max_power_change, abs(unit_powers64[0] - unit_powers32[0])/unit_powers64[0])
+    report = {'max_divergence': max_divergence, 'mean_divergence': mean_divergence, 'summed_peaks_float64': zip(frequencies64, powers64), 'summed_peaks_float32': zip(frequencies32, powers32), 'summed_peaks_match': frequencies64 == frequencies32, 'units_with_moved_peaks': moved_peaks, 'max_peak_power_change': max_power_change}
+    print 'float32 vs float64: largest trace difference %.3g, mean trace difference %.3g' % (max_divergence, mean_divergence)
+    print 'summed token activity peaks (cycles per time-step): float64', ['%.4f' % frequency for frequency in frequencies64], 'float32', ['%.4f' % frequency for frequency in frequencies32], '(match)' if report['summed_peaks_match'] else '(DIFFERENT)'
+    print 'units whose spectral peak moved:', len(moved_peaks), moved_peaks[:10], '; largest change in the power of a unit\'s peak: %.3g' % max_power_change
+    # done.
+    return report
@@ -10,7 +10,13 @@ import random, numbers, math, operator
 import numpy as np
 import dataTypes_DING
 import buildNetwork_DING
+import retrievalPrefilter_DING
+import retrievalShards_DING
+import resultCache_DING
+import arrayEngine_DING
+import jitEngine_DING
 import DORA_GUI_ding
+import remoteGUI_DING
 if not run_on_iphone:
     import pygame
     from pygame.locals import *
@@ -42,11 +48,33 @@ class runDORA(object):
         self.screen_width = parameters['screen_width']
         self.screen_height = parameters['screen_height']
         self.GUI_update_rate = parameters['GUI_update_rate']
+        self.GUI_min_node_width = parameters.get('GUI_min_node_width', 0) # if > 0, rows of tokens too big to show each token at least this many pixels wide are shown as one summary bar per analog (see DORA_GUI_ding.make_GUI_information()).
+        self.GUI_process = parameters.get('GUI_process', False) # if True (and doGUI), the GUI runs in its own process, fed the activations through a ring buffer in shared memory (see remoteGUI_DING; call remoteGUI_DING.close_remote_GUI(network.remote_GUI) to close it).
+        self.remote_GUI = None
+        self.GUI_trace = parameters.get('GUI_trace', None) # path to record a GUI trace of the run to (every GUI_update_rate time-steps, whether or not doGUI is on), to play back with DORA_GUI_ding.replay_trace() (None for no trace; call network.trace_recorder.close() at the end of the run).
+        self.trace_recorder = None
         self.ignore_object_semantics = parameters['ignore_object_semantics']
         self.ignore_memory_semantics = parameters['ignore_memory_semantics']
         self.exemplar_memory = parameters['exemplar_memory']
         self.recent_analog_bias = parameters['recent_analog_bias']
         self.lateral_input_level = parameters['lateral_input_level']
+        self.restrict_retrieval = parameters.get('restrict_retrieval', False) # only run retrieval dynamics for memory analogs reachable from active semantics.
+        self.retrieval_shortlist = parameters.get('retrieval_shortlist', 0) # if > 0, only the this many analogs most similar to the driver (by semantic LSH) go through retrieval, i.e., are updated and can be retrieved (see retrievalPrefilter_DING). Independent of restrict_retrieval: with both, the candidates are drawn from the shortlist.
+        self.LSH_tables = parameters.get('LSH_tables', 8)
+        self.LSH_bits = parameters.get('LSH_bits', 12)
+        self.LSH_seed = parameters.get('LSH_seed', 0)
+        self.retrieval_threads = parameters.get('retrieval_threads', 0) # if > 0, the memory tokens are updated during retrieval in shards of whole analogs on this many threads (see retrievalShards_DING; not used when retrieval is restricted to candidate analogs or to a shortlist).
+        self.retrieval_shards = parameters.get('retrieval_shards', 0) # number of shards for threaded retrieval (0 for one per thread).
+        self.retrieval_processes = parameters.get('retrieval_processes', 0) # if > 0, the memory tokens are updated during retrieval on this many worker processes, each owning a shard of the analogs (see retrievalShards_DING; only used when ignore_memory_semantics is True, as the acts of memory tokens are not sent back to this process on each step).
+        self.LTM_store = parameters.get('LTM_store', None) # LTMstore_DING.LTMstore holding analogs that are only brought into memory when retrieval needs them (None if all of LTM is in memory).
+        self.result_cache = parameters.get('result_cache', None) # resultCache_DING.resultCache to look up and store the results of do_ding_ops() and do_retrieval() runs in (None to always run them).
+        self.incremental_inputs = parameters.get('incremental_inputs', False) # only recompute the inputs of units whose inputs can have changed on each time-step (see update_inputs_incremental()).
+        self.incremental_epsilon = parameters.get('incremental_epsilon', 1e-6) # in incremental mode, changes in activation smaller than this are not passed on.
+        self.incremental_refresh = parameters.get('incremental_refresh', 10) # in incremental mode, recompute all inputs every this many time-steps.
+        self.dirty_tracker = None
+        self.engine = parameters.get('engine', 'object') # 'object' to run time-steps on the token objects, 'array' to run them on a compiled plan over numpy arrays (see arrayEngine_DING), 'jit' to run them on the plan with a Numba-compiled kernel (see jitEngine_DING; runs as 'array' if Numba is not installed).
+        self.engine_dtype = parameters.get('engine_dtype', 'float64') # dtype of the acts, inputs, and weights in the array and jit engines ('float32' halves the memory they take; see arrayEngine_DING.compare_precisions() to check it is safe for a sim).
+        self.execution_plan = None
         self.num_phase_sets_to_run = None
         self.count_by_RBs = None # initialize to None.
         self.local_inhibitor_fired = False # initialize to False.
@@ -75,11 +103,20 @@ class runDORA(object):
         # initialize .same_RB_POs field for POs.
         self.memory = update_same_RB_POs(self.memory)
         # initialize GUI if necessary.
-        if self.doGUI:
-            self.screen, self.GUI_information = DORA_GUI_ding.initialize_GUI(self.screen_width, self.screen_height, self.memory)
+        if self.doGUI and self.GUI_process:
+            if self.remote_GUI is None:
+                self.remote_GUI = remoteGUI_DING.start_remote_GUI(self.screen_width, self.screen_height, min_node_width=self.GUI_min_node_width)
+            self.memory = remoteGUI_DING.set_remote_layout(self.remote_GUI, self.memory)
+        elif self.doGUI:
+            self.screen, self.GUI_information = DORA_GUI_ding.initialize_GUI(self.screen_width, self.screen_height, self.memory, self.GUI_min_node_width)
+        if self.GUI_trace is not None and self.trace_recorder is None:
+            self.trace_recorder = DORA_GUI_ding.traceRecorder(self.GUI_trace, self.screen_width, self.screen_height, self.GUI_min_node_width)
         # get PO SemNormalizations.
         for myPO in self.memory.POs:
             myPO.get_weight_length()
+        # the network has changed, so the array engine compiles a new plan on the next time-step, and the incremental input tracker is rebuilt.
+        self.execution_plan = None
+        self.dirty_tracker = None
     
     # 2) Initialize activations and inputs of all units to 0.
     def initialize_network_state(self):
@@ -108,8 +145,27 @@ class runDORA(object):
     
     # 4) Enter the phase set. A phase set is each RB firing at least once (i.e., all RBs in firingOrder firing). It is in phase_sets you will do all of DORA's interesting operations (retrieval, mapping, learning, etc.). There is a function for each interesting operation.
     def do_retrieval(self):
+        # if there is a result cache, and this exact run is in it, put the network in the state the run leaves it in. (Not when LTM is kept on disk, as the analogs brought into memory change the network.)
+        cache_key = None
+        if self.result_cache is not None and self.LTM_store is None:
+            cache_key = resultCache_DING.get_cache_key(self, 'do_retrieval')
+            if self.result_cache.load(self, cache_key)[0]:
+                return
+        # if LTM is kept on disk, bring the stored analogs that share semantics with the driver into memory.
+        if self.LTM_store is not None:
+            self.memory = self.LTM_store.hydrate_for_driver(self.memory)
         # do initialize network operations (steps 1-3 above). 
         self.do_1_to_3(mapping=False)
+        # shortlist the analogs most similar to the driver, if using the retrieval prefilter.
+        allowed = None
+        if self.retrieval_shortlist > 0:
+            allowed = retrievalPrefilter_DING.prefilter_analogs(self.memory, self.retrieval_shortlist, self.LSH_tables, self.LSH_bits, self.LSH_seed)
+        # build the retrieval index over the tokens in memory.
+        self.memory = make_retrieval_index(self.memory, self.restrict_retrieval, allowed)
+        # semantics take input from memory POs unless ignore_memory_semantics, so retrieval only runs on worker processes if they do not.
+        retrieval_processes = 0
+        if self.ignore_memory_semantics:
+            retrieval_processes = self.retrieval_processes
         phase_sets = 1
         for phase_set in range(phase_sets):
             LTM_list = []
@@ -125,12 +181,12 @@ class runDORA(object):
                         currentRB.act = 1.0
                         self.time_step_activations(phase_set, self.ignore_object_semantics, self.ignore_memory_semantics)
                         # 4.3.12) Run retrieval routines.
-                        self.memory = retrieval_routine(self.memory, self.asDORA, self.gamma, self.delta, self.HebbBias, self.lateral_input_level, self.bias_retrieval_analogs)
+                        self.memory = retrieval_routine(self.memory, self.asDORA, self.gamma, self.delta, self.HebbBias, self.lateral_input_level, self.bias_retrieval_analogs, self.retrieval_threads, self.retrieval_shards, retrieval_processes)
                         # fire the local_inhibitor if necessary.
                         self.time_step_fire_local_inhibitor()
                         # update GUI.
                         phase_set_iterator += 1
-                        if self.doGUI:
+                        if self.doGUI or self.trace_recorder is not None:
                             self.time_step_doGUI(phase_set_iterator)
                         # write state of LTM to a vector.
                         LTM_vec = []
@@ -158,25 +214,34 @@ class runDORA(object):
                         currentPO.act = 1.0
                         self.time_step_activations(phase_set, self.ignore_object_semantics, self.ignore_memory_semantics)
                         # 4.3.12) Run retrieval routines.
-                        self.memory = retrieval_routine(self.memory, self.asDORA, self.gamma, self.delta, self.HebbBias, self.lateral_input_level, self.bias_retrieval_analogs)
+                        self.memory = retrieval_routine(self.memory, self.asDORA, self.gamma, self.delta, self.HebbBias, self.lateral_input_level, self.bias_retrieval_analogs, self.retrieval_threads, self.retrieval_shards, retrieval_processes)
                         # fire the local_inhibitor if necessary.
                         self.time_step_fire_local_inhibitor()
                         # update GUI.
                         phase_set_iterator += 1
-                        if self.doGUI:
+                        if self.doGUI or self.trace_recorder is not None:
                             self.time_step_doGUI(phase_set_iterator)
                     # PO firing is OVER.
                     self.post_count_by_operations()
                 # return the .asDORA setting to its previous state.
                 self.asDORA = previous_mode    
             # phase set is OVER.
-            pdb.set_trace()
+            # if the memory tokens were updated on threads, write their inputs back to them.
+            self.memory = retrievalShards_DING.finish_retrieval_shards(self.memory)
             self.post_phase_set_operations(retrieval_license=True, map_license=False)
+        if cache_key is not None:
+            self.result_cache.store(self, cache_key, None)
     
     # function to do any weird test-type operations that you want to play around with. Some might be appropriated for the model's actual operation later.
     def do_ding_ops(self, firing_order):
         # do sentence processing stuff as in the Ding et al. (2016) paper. 
         # crux is that RBs can take children, and you're firing by semantics in a specific order. 
+        # if there is a result cache, and this exact run is in it, return its units_dict (and put the network in the state the run leaves it in). The run draws no random numbers, so it is keyed without the state of the random number generators.
+        if self.result_cache is not None:
+            cache_key = resultCache_DING.get_cache_key(self, 'do_ding_ops', firing_order, random_state=False)
+            hit, units_dict = self.result_cache.load(self, cache_key)
+            if hit:
+                return units_dict
         # set .asDORA to True.
         previous_mode = self.asDORA
         self.asDORA = True
@@ -191,14 +256,51 @@ class runDORA(object):
             units_dict[myPO.name] = []
         for mysemantic in self.memory.semantics:
             units_dict[mysemantic.name] = []
+        # with the array (or jit) engine, the units' acts are recorded from the plan's arrays.
+        record_units = self.memory.Ps + self.memory.RBs + self.memory.POs + self.memory.semantics
+        record_names = [unit.name for unit in record_units]
         # fire the word list. 
         for pattern in firing_order:
-            # initialize phase_set_iterator and flags (local_inhibitor_fired).
-            phase_set_iterator = 1
-            self.local_inhibitor_fired = False
-            # 4.1-4.2) Fire the current RB in the firingOrder. Update the network in discrete time-steps until the globalInhibitor fires (i.e., the current active RB is inhibited by its inhibitor).
-            while phase_set_iterator <= 110:
-                # set activation of active semantic units to 1.
+            self.fire_ding_pattern(pattern, units_dict, record_units, record_names)
+        # return the .asDORA setting to its previous state.
+        self.asDORA = previous_mode
+        self.count_by_RBs = None
+        # phase set is OVER.
+        self.post_phase_set_operations(retrieval_license=False, map_license=False) 
+        if self.result_cache is not None:
+            self.result_cache.store(self, cache_key, units_dict, random_state=False)
+        # return the units_dict.
+        return units_dict
+    
+    # function to fire one pattern (word) of a do_ding_ops() firing order for 110 time-steps, appending each unit's activation on each time-step to units_dict (record_units are the units to record, and record_names their names), and then reset the inhibitors and semantics for the next pattern.
+    def fire_ding_pattern(self, pattern, units_dict, record_units, record_names):
+        # initialize phase_set_iterator and flags (local_inhibitor_fired).
+        phase_set_iterator = 1
+        self.local_inhibitor_fired = False
+        # with the array (or jit) engine, load the network into the plan, where it stays for the whole pattern (see arrayEngine_DING).
+        plan = None
+        if self.engine in ('array', 'jit'):
+            plan = self.get_execution_plan(1, self.ignore_object_semantics, self.ignore_memory_semantics)
+            plan = arrayEngine_DING.gather_state(plan, self.memory, self.local_inhibitor_fired)
+            if plan.supported:
+                pattern_positions = np.array([plan.semantic_positions[id(semantic)] for semantic in pattern], dtype=int)
+                record_positions = arrayEngine_DING.get_act_positions(plan, record_units)
+            else:
+                plan = None
+        # 4.1-4.2) Fire the current RB in the firingOrder. Update the network in discrete time-steps until the globalInhibitor fires (i.e., the current active RB is inhibited by its inhibitor).
+        while phase_set_iterator <= 110:
+            if plan is not None:
+                # set activation of active semantic units to 1, update the RBmodes, update network activations, and fire the local_inhibitor if necessary.
+                if self.get_engine_module().ding_time_step(plan, pattern_positions, self.gamma, self.delta, self.HebbBias):
+                    for name, act in zip(record_names, arrayEngine_DING.get_acts(plan, record_positions)):
+                        units_dict[name].append(act)
+                else:
+                    # the plan can not run the network in its current modes, so hand the network back to the objects for the rest of the pattern.
+                    self.memory = arrayEngine_DING.scatter_state(plan, self.memory)
+                    self.local_inhibitor_fired = plan.local_inhibitor_fired
+                    plan = None
+            if plan is None:
+                # set activation of active semantic units to 1.0.
                 for semantic in pattern:
                     semantic.act = 1.0
                 # update the RBmodes.
@@ -219,27 +321,84 @@ class runDORA(object):
                     units_dict[myPO.name].append(myPO.act)
                 for mysemantic in self.memory.semantics:
                     units_dict[mysemantic.name].append(mysemantic.act)
-                # update the phase_set_iterator.
-                phase_set_iterator += 1
-                # GUI.
-                self.time_step_doGUI(phase_set_iterator)
-            # pattern/word firing is OVER.
-            # fire the globalInhibitor.
-            self.memory = self.memory.globalInhibitor.fire_global_inhibitor(self.memory)
-            # reset the memory.localInhibitor.act and memory.globalInhibitor.act back to 0.0.
-            self.memory.localInhibitor.act = 0.0
-            self.memory.globalInhibitor.act = 0.0
-            for myPO in self.memory.POs:
-                myPO.reset_inhibitor()
-            for semantic in self.memory.semantics:
-                semantic.act = 0.0
+            # update the phase_set_iterator.
+            phase_set_iterator += 1
+            # GUI (with the array or jit engine, the GUI draws (and the trace records) the objects, so write the plan's state back to them first).
+            if (self.doGUI or self.trace_recorder is not None) and plan is not None:
+                self.memory = arrayEngine_DING.scatter_state(plan, self.memory)
+            self.time_step_doGUI(phase_set_iterator)
+        if plan is not None:
+            self.memory = arrayEngine_DING.scatter_state(plan, self.memory)
+            self.local_inhibitor_fired = plan.local_inhibitor_fired
+        # pattern/word firing is OVER.
+        # fire the globalInhibitor.
+        self.memory = self.memory.globalInhibitor.fire_global_inhibitor(self.memory)
+        # reset the memory.localInhibitor.act and memory.globalInhibitor.act back to 0.0.
+        self.memory.localInhibitor.act = 0.0
+        self.memory.globalInhibitor.act = 0.0
+        for myPO in self.memory.POs:
+            myPO.reset_inhibitor()
+        for semantic in self.memory.semantics:
+            semantic.act = 0.0
+
+    # function to run many do_ding_ops() firing orders from the current state of the network as a tree: firing orders that start with the same patterns (e.g., "dry fur rubs skin" and "dry fur rubs cats") share the simulation of that prefix, and the state of the network is snapshotted where they diverge (see get_state_snapshot()) and restored to run each continuation. Returns a list with, for each firing order, the units_dict that do_ding_ops() would have returned had it been run from the current state with that firing order alone. The network is left as at the end of the last branch run (after post_phase_set_operations(), as with do_ding_ops()).
+    def do_ding_tree(self, firing_orders):
+        previous_mode = self.asDORA
+        self.asDORA = True
+        self.count_by_RBs = True
+        record_units = self.memory.Ps + self.memory.RBs + self.memory.POs + self.memory.semantics
+        record_names = [unit.name for unit in record_units]
+        # build the prefix tree of the firing orders. Each node is a pattern, and holds the firing orders that end there (by position in firing_orders) and its children by pattern.
+        root = {'pattern': None, 'orders': [], 'children': {}, 'child_order': []}
+        for order_position, firing_order in enumerate(firing_orders):
+            node = root
+            for pattern in firing_order:
+                key = tuple(id(semantic) for semantic in pattern)
+                if key not in node['children']:
+                    node['children'][key] = {'pattern': pattern, 'orders': [], 'children': {}, 'child_order': []}
+                    node['child_order'].append(key)
+                node = node['children'][key]
+            node['orders'].append(order_position)
+        results = [None]*len(firing_orders)
+        for order_position in root['orders']:
+            results[order_position] = dict((name, []) for name in record_names)
+        # run the tree depth first, keeping the snapshot at each divergence point on the stack.
+        stack = [(root, self.get_state_snapshot(), [])]
+        while len(stack) > 0:
+            node, snapshot, path_traces = stack.pop()
+            for key in node['child_order']:
+                child = node['children'][key]
+                self.restore_state_snapshot(snapshot)
+                traces = dict((name, []) for name in record_names)
+                self.fire_ding_pattern(child['pattern'], traces, record_units, record_names)
+                child_path_traces = path_traces + [traces]
+                # the units_dict of each firing order that ends here is the concatenation of the traces of the patterns on the path.
+                for order_position in child['orders']:
+                    results[order_position] = dict((name, [act for traces in child_path_traces for act in traces[name]]) for name in record_names)
+                if len(child['children']) > 0:
+                    stack.append((child, self.get_state_snapshot(), child_path_traces))
         # return the .asDORA setting to its previous state.
         self.asDORA = previous_mode
         self.count_by_RBs = None
         # phase set is OVER.
-        self.post_phase_set_operations(retrieval_license=False, map_license=False) 
-        # return the units_dict.
-        return units_dict
+        self.post_phase_set_operations(retrieval_license=False, map_license=False)
+        # done.
+        return results
+    
+    # function to snapshot the full dynamic state of the network: every numeric field (activations, inputs, inhibitor inputs and activations, modes, max mapping weights, etc.) of every unit, link, and mapping connection, and of the local and global inhibitors, along with the run flags that carry across time-steps. The structure of the network (which units there are, and how they are connected) is not part of the snapshot, so it can only be restored to the same network.
+    def get_state_snapshot(self):
+        units = get_state_units(self.memory)
+        unit_states = [dict((name, value) for name, value in vars(unit).items() if isinstance(value, numbers.Number)) for unit in units]
+        # done.
+        return (units, unit_states, self.local_inhibitor_fired, self.inferred_new_P)
+    
+    # function to restore a snapshot made with get_state_snapshot().
+    def restore_state_snapshot(self, snapshot):
+        units, unit_states, self.local_inhibitor_fired, self.inferred_new_P = snapshot
+        for unit, unit_state in zip(units, unit_states):
+            unit.__dict__.update(unit_state)
+        # the incremental input tracker's record of what each unit last saw no longer holds.
+        self.dirty_tracker = None
     
     
     ######################################################################
@@ -252,8 +411,20 @@ class runDORA(object):
     # functions implementing operations performed during a single time-step in DORA.
     # function to perform basic network activation update for a time_step in the phase set.
     def time_step_activations(self, phase_set, ignore_object_semantics=False, ignore_memory_semantics=False, do_ding=False):
-        # initialize the input to all tokens and semantic units.
-        self.memory = initialize_input(self.memory)
+        # with the array (or jit) engine, run the time-step on the plan's arrays, unless the plan can not run the network as it is.
+        if self.engine in ('array', 'jit'):
+            plan = self.get_execution_plan(phase_set, ignore_object_semantics, ignore_memory_semantics)
+            plan = arrayEngine_DING.gather_state(plan, self.memory, self.local_inhibitor_fired)
+            if self.get_engine_module().time_step(plan, self.gamma, self.delta, self.HebbBias, self.count_by_RBs, do_ding):
+                self.memory = arrayEngine_DING.scatter_state(plan, self.memory)
+                return
+        # in incremental mode, work out whether all inputs must be recomputed on this time-step (see update_inputs_incremental()).
+        full_update = True
+        if self.incremental_inputs:
+            full_update = self.check_dirty_tracker(phase_set, ignore_object_semantics, ignore_memory_semantics)
+        if full_update:
+            # initialize the input to all tokens and semantic units.
+            self.memory = initialize_input(self.memory)
         # 4.3.2) Update modes of all P units in the driver and the recipient.
         if self.count_by_RBs:
             for myP in self.memory.driver.Ps:
@@ -261,7 +432,12 @@ class runDORA(object):
             for myP in self.memory.recipient.Ps:
                 myP.get_Pmode()
         # 4.3.3) Update input to driver token units.
-        self.memory = update_driver_inputs(self.memory, self.asDORA, self.lateral_input_level)
+        if full_update:
+            self.memory = update_driver_inputs(self.memory, self.asDORA, self.lateral_input_level)
+            if self.incremental_inputs:
+                self.dirty_tracker = record_input_states(self.dirty_tracker, 1)
+        else:
+            self.memory = update_inputs_incremental(self.memory, self.dirty_tracker, 1, self.asDORA, phase_set, self.lateral_input_level, ignore_object_semantics, ignore_memory_semantics, self.incremental_epsilon)
         # 4.3.4-5) Update input to and activation of PO and RB inhibitors.
         for myRB in self.memory.driver.RBs:
             myRB.update_inhibitor_input()
@@ -281,25 +457,70 @@ class runDORA(object):
         # 4.3.6-7) Update input and activation of local and global inhibitors.
         self.memory.localInhibitor.checkDriverPOs(self.memory)
         self.memory.globalInhibitor.checkDriverRBs(self.memory)
-        # 4.3.8) Update input to semantic units, unless you are running a Ding sim.
-        for semantic in self.memory.semantics:
-            # ignore input to semantic units from POs in object mode if ignore_object_semantics==True (i.e., if DORA is focusing on relational properties (from Hummel & Holyoak, 2003)).
-            semantic.update_input(self.memory, ignore_object_semantics, ignore_memory_semantics)
-        # 4.3.9) Update input to all tokens in the recipient and emerging recipient (i.e., newSet).
-        self.memory = update_recipient_inputs(self.memory, self.asDORA, phase_set, self.lateral_input_level, self.ignore_object_semantics)
+        if full_update:
+            # 4.3.8) Update input to semantic units, unless you are running a Ding sim.
+            for semantic in self.memory.semantics:
+                # ignore input to semantic units from POs in object mode if ignore_object_semantics==True (i.e., if DORA is focusing on relational properties (from Hummel & Holyoak, 2003)).
+                semantic.update_input(self.memory, ignore_object_semantics, ignore_memory_semantics)
+            # 4.3.9) Update input to all tokens in the recipient and emerging recipient (i.e., newSet).
+            self.memory = update_recipient_inputs(self.memory, self.asDORA, phase_set, self.lateral_input_level, self.ignore_object_semantics)
+            if self.incremental_inputs:
+                self.dirty_tracker = record_input_states(self.dirty_tracker, 2)
+        else:
+            # 4.3.8-9) Update input to the semantic units and recipient tokens whose inputs can have changed.
+            self.memory = update_inputs_incremental(self.memory, self.dirty_tracker, 2, self.asDORA, phase_set, self.lateral_input_level, ignore_object_semantics, ignore_memory_semantics, self.incremental_epsilon)
         self.memory = update_newSet_inputs(self.memory)
         # 4.3.10) Update activations of all units in the driver, recipient, and newSet, and all semanticss.
         self.memory = update_activations_run(self.memory, self.gamma, self.delta, self.HebbBias, phase_set, do_ding)
     
+    # function to make sure self.dirty_tracker (see dataTypes_DING.dirtyTracker) matches the current network and settings, and to decide whether all inputs must be recomputed on this time-step. All inputs are recomputed (and the tracker rebuilt) whenever the driver, recipient, semantics, or mapping connections change, or the settings that inputs depend on change, and every self.incremental_refresh time-steps (to bound the drift from ignoring changes smaller than self.incremental_epsilon). Returns True if all inputs must be recomputed.
+    def check_dirty_tracker(self, phase_set, ignore_object_semantics, ignore_memory_semantics):
+        structure_key = get_dirty_structure_key(self.memory)
+        settings_key = (phase_set, self.asDORA, self.lateral_input_level, ignore_object_semantics, ignore_memory_semantics)
+        tracker = self.dirty_tracker
+        if tracker is None or tracker.structure_key != structure_key:
+            tracker = make_dirty_tracker(self.memory, ignore_memory_semantics)
+            tracker.structure_key = structure_key
+            self.dirty_tracker = tracker
+        elif tracker.settings_key == settings_key and tracker.steps_since_refresh < self.incremental_refresh:
+            tracker.steps_since_refresh += 1
+            return False
+        tracker.settings_key = settings_key
+        tracker.steps_since_refresh = 1
+        return True
+    
+    # function to get the module that runs time-steps on a plan for the array and jit engines.
+    def get_engine_module(self):
+        if self.engine == 'jit':
+            return jitEngine_DING
+        return arrayEngine_DING
+    
+    # function to get the array engine's plan (see arrayEngine_DING) for the current network and settings, compiling a new plan if the network, the settings, or the engine dtype have changed since the last one was compiled.
+    def get_execution_plan(self, phase_set, ignore_object_semantics, ignore_memory_semantics):
+        settings = (self.asDORA, phase_set >= 1, self.lateral_input_level, self.ignore_object_semantics, ignore_object_semantics, ignore_memory_semantics)
+        plan = self.execution_plan
+        if plan is None or plan.settings != settings or plan.dtype != np.dtype(self.engine_dtype) or plan.structure_key != arrayEngine_DING.get_structure_key(self.memory):
+            plan = arrayEngine_DING.compile_plan(self.memory, settings, self.engine_dtype)
+            self.execution_plan = plan
+        return plan
+    
     # function to fire the local inhibitor if necessary.
     def time_step_fire_local_inhibitor(self):
         if self.asDORA and self.memory.localInhibitor.act >= 0.99 and not self.local_inhibitor_fired:
             self.memory = self.memory.localInhibitor.fire_local_inhibitor(self.memory)
             self.local_inhibitor_fired = True
     
-    # function to do GUI.
+    # function to do GUI (and record a frame of the GUI trace).
     def time_step_doGUI(self, phase_set_iterator):
-        if self.doGUI:
+        if self.trace_recorder is not None and phase_set_iterator % self.GUI_update_rate == 0:
+            self.trace_recorder.record_frame(self.memory, phase_set_iterator)
+        if self.doGUI and self.remote_GUI is not None:
+            # the GUI is in its own process, so just check the control channel (for pause and debug) and write the activations to the ring buffer.
+            if remoteGUI_DING.poll_control(self.remote_GUI):
+                pdb.set_trace()
+            if phase_set_iterator % self.GUI_update_rate == 0:
+                remoteGUI_DING.publish_frame(self.remote_GUI, self.memory, phase_set_iterator)
+        elif self.doGUI:
             # check for keypress for pause.
             debug = False
             pause = False
@@ -373,162 +594,124 @@ class runDORA(object):
 def make_AM(memory):
     # for each token, if it is in an AM set (driver, recipient), then make sure all sub-tokens are also in that set. Make sure that all tokens from the same analog are in the same set or in memory (i.e., tokens from the same analog CANNOT be in different AM sets). run findDriverRecipient().
     # for each token unit, make sure all subtokens are in the same set. Also, make sure that if a token is to enter recipient, that it checks to make sure none of it's subtokens are in the driver, and, if they are, that it remains in memory.
+    # make sure the sub-token closures are up to date with the structure of memory.
+    memory = update_sub_token_index(memory)
+    closures = memory.sub_token_index.closures
     for Group in memory.Groups:
         if Group.set != 'memory':
             # make sure all subtokens are in the same set.
-            Group = set_sub_tokens(Group)
+            Group = set_sub_tokens(Group, closures)
     for myP in memory.Ps:
         if myP.set != 'memory':
             # make sure all subtokens are in the same set.
-            myP = set_sub_tokens(myP)
+            myP = set_sub_tokens(myP, closures)
     for myRB in memory.RBs:
         if myRB.set != 'memory':
             # make sure all subtokens are in the same set.
-            myRB = set_sub_tokens(myRB)
+            myRB = set_sub_tokens(myRB, closures)
     for myPO in memory.POs:
         if myPO.set != 'memory':
             # make sure all subtokens are in the same set.
-            myPO = set_sub_tokens(myPO)
+            myPO = set_sub_tokens(myPO, closures)
     # and bring all the copied items from memory into AM (i.e., into driver/recipient).
     memory = findDriverRecipient(memory)
     # done.
     return memory
 
-# function to make sure all sub-tokens of a token to enter AM are in the same set. Function also checks that any item to enter the recipient, does not have driver sub-tokens.
-def set_sub_tokens(token):
-    # check what kind of token you're dealing with.
-    if token.my_type == 'Group':
-        # if you're dealing with a Group, then for each of it's sub-groups, sub-Ps, and sub-RBs, set that sub_token.set to the same set as the Group, and run set_sub_tokens on that sub-token.
-        # check to make sure that if the Group is in the recipient, none of it's subtokens are in the driver.
-        go_on = True
-        if token.set == 'recipient':
-            go_on = check_sub_tokens(token)
-        if go_on:
-            for Group_under in token.myChildGroups:
-                Group_under.set = token.set
-                Group_under = set_sub_tokens(Group_under)
-            for myP in token.myPs:
-                myP.set = token.set
-                myP = set_sub_tokens(myP)
-            for myRB in token.myRBs:
-                myRB.set = token.set
-                myRB = set_sub_tokens(myRB)
-        else:
-            # set the token.set to 'memory'.
-            token.set = 'memory'
-    elif token.my_type == 'P':
-        # if you're dealing with a P, then for each of it's RBs, set that myRB.set to the same set as the P, and run set_sub_tokens on the myRB.
-        # check to make sure that if the P is in the recipient, none of it's subtokens are in the driver.
-        go_on = True
-        if token.set == 'recipient':
-            go_on = check_sub_tokens(token)
-        if go_on:
-            for myRB in token.myRBs:
-                myRB.set = token.set
-                myRB = set_sub_tokens(myRB)
-        else:
-            # set the token.set to 'memory'.
-            token.set = 'memory'
-    elif token.my_type == 'RB':
-        # if you're dealing with a RB, then for each of it's child-Ps and POs, set that token.set to the same set as the RB, and run set_sub_tokens on the the sub-token.
-        # check to make sure that if the RB is in the recipient, none of it's subtokens are in the driver.
-        go_on = True
-        if token.set == 'recipient':
-            go_on = check_sub_tokens(token)
-        if go_on:
-            if len(token.myPred) > 0:
-                token.myPred[0].set = token.set
-                token.myPred[0] = set_sub_tokens(token.myPred[0])
-            if len(token.myObj) > 0:
-                token.myObj[0].set = token.set
-                token.myObj[0] = set_sub_tokens(token.myObj[0])
-            elif len(token.myChildP) > 0:
-                token.myChildP[0].set = token.set
-                token.myChildP[0] = set_sub_tokens(token.myChildP[0])
-        else:
-            # set the token.set to 'memory'.
-            token.set = 'memory'
+# function to make sure all sub-tokens of a token to enter AM are in the same set. Function also checks that any item to enter the recipient, does not have driver sub-tokens (if it does, it stays in memory). Takes an optional dict of sub-token closures (see get_sub_token_closure()) so closures are shared across calls.
+def set_sub_tokens(token, closures=None):
+    if closures is None:
+        closures = {}
+    # check to make sure that if the token is in the recipient, none of it's subtokens are in the driver.
+    go_on = True
+    if token.set == 'recipient':
+        go_on = check_sub_tokens(token, closures)
+    if go_on:
+        # set all the tokens below the token to the same set as the token.
+        set_token_closure(get_sub_token_closure(token, closures), token.set)
+    else:
+        # set the token.set to 'memory'.
+        token.set = 'memory'
     # done.
     return token
 
-# function to check all sub-tokens of a token bound for the recipient, to make sure that none are in the driver.
-def check_sub_tokens(token):
+# function to check all sub-tokens of a token bound for the recipient, to make sure that none are in the driver. If any are, the token.set is set to 'memory' (as it should not be retrieved into the recipient).
+def check_sub_tokens(token, closures=None):
+    if closures is None:
+        closures = {}
     # set the go_on_flag to True (indicating that that there are no driver sub-tokens of a recipient super-token).
     go_on_flag = True
     # make sure you're dealing with a recipient token (this is a redundent check, but is here for safety).
     if token.set == 'recipient':
         # make sure all sub-tokens are NOT in the driver.
-        if token.my_type == 'Group':
-            # make sure none of my sub-groups (or their sub-tokens) are in the driver.
-            for sub_group in token.myGroups:
-                if sub_group.set == 'driver':
-                    # set token.set to 'memory', go_on_flag to False, and break the loop.
-                    token.set = 'memory'
-                    go_on_flag = False
-                    break
-                else:
-                    # make sure none of the sub-token of the sub-group are in the driver.
-                    go_on_flag = check_sub_tokens(sub_group)
-                    # if go_on_flag is now False (i.e., the token has sub-tokens in the driver), token.set should be set to 'memory' (as it should not be retrieved into the recipient). 
-                    if not go_on_flag:
-                        token.set == 'memory'
-            # if go_on_flag is still True, make sure none of my Ps (or their sub-tokens) are in the driver.
-            if go_on_flag:
-                for myP in token.myPs:
-                    if myP.set == 'driver':
-                        # set token.set to 'memory', go_on_flag to False, and break the loop.
-                        token.set = 'memory'
-                        go_on_flag = False
-                        break
-                    else:
-                        # make sure none of the sub-token of the sub-group are in the driver.
-                        go_on_flag = check_sub_tokens(myP)
-                        # if go_on_flag is now False (i.e., the token has sub-tokens in the driver), token.set should be set to 'memory' (as it should not be retrieved into the recipient). 
-                        if not go_on_flag:
-                            token.set == 'memory'
-            # if go_on_flag is still True, make sure none of my RBs (or their sub-tokens) are in the driver.
-            if go_on_flag:
-                for myRB in token.myRBs:
-                    if myRB.set == 'driver':
-                        # set token.set to 'memory', go_on_flag to False, and break the loop.
-                        token.set = 'memory'
-                        go_on_flag = False
-                        break
-                    else:
-                        # make sure none of the sub-token of the sub-group are in the driver.
-                        go_on_flag = check_sub_tokens(myRB)
-                        # if go_on_flag is now False (i.e., the token has sub-tokens in the driver), token.set should be set to 'memory' (as it should not be retrieved into the recipient). 
-                        if not go_on_flag:
-                            token.set == 'memory'
-        elif token.my_type == 'P':
-            # make sure none of my RBs (or their sub-tokens) are in the driver.
-            for myRB in token.myRBs:
-                if myRB.set == 'driver':
-                    # set token.set to 'memory', go_on_flag to False, and break the loop.
-                    token.set = 'memory'
-                    go_on_flag = False
-                    break
-                else:
-                    # make sure none of the sub-token of the sub-group are in the driver.
-                    go_on_flag = check_sub_tokens(myRB)
-                    # if go_on_flag is now False (i.e., the token has sub-tokens in the driver), token.set should be set to 'memory' (as it should not be retrieved into the recipient). 
-                    if not go_on_flag:
-                        token.set == 'memory'
-        elif token.my_type == 'RB':
-            # make sure none of my POs are in the driver.
-            if token.myPred[0].set == 'driver':
-                # set token.set to 'memory' and go_on_flag to False.
-                token.set == 'memory'
+        for sub_token in get_sub_token_closure(token, closures):
+            if sub_token.set == 'driver':
+                # set token.set to 'memory', go_on_flag to False, and break the loop.
+                token.set = 'memory'
                 go_on_flag = False
-            # make sure you only check the objs of RBs not taking a child P as an argument.
-            if len(token.myObj) > 0:
-                if token.myObj[0].set == 'driver':
-                    # set token.set to 'memory' and go_on_flag to False.
-                    token.set == 'memory'
-                    go_on_flag = False
+                break
     # done.
     return go_on_flag
 
+# function to return the tokens directly below a token: for a Group its child Groups, Ps, and RBs; for a P its RBs; for an RB its pred and its object or child P. POs have no tokens below them.
+def get_child_tokens(token):
+    if token.my_type == 'Group':
+        return token.myChildGroups + token.myPs + token.myRBs
+    elif token.my_type == 'P':
+        return token.myRBs
+    elif token.my_type == 'RB':
+        if len(token.myObj) > 0:
+            return token.myPred[:1] + token.myObj[:1]
+        else:
+            return token.myPred[:1] + token.myChildP[:1]
+    else:
+        return []
+
+# function to get the closure of a token (i.e., every token below it, each listed once). Closures are memoized in the closures dict (keyed by id(token)), so shared sub-structure is only walked once, and the walk is iterative, so deeply nested propositions do not hit the recursion limit.
+def get_sub_token_closure(token, closures):
+    if id(token) in closures:
+        return closures[id(token)]
+    # post-order walk: a token's closure is made once the closures of all its children are made.
+    in_progress = set([id(token)])
+    stack = [(token, False)]
+    while len(stack) > 0:
+        current, children_done = stack.pop()
+        if id(current) in closures:
+            continue
+        children = get_child_tokens(current)
+        if not children_done:
+            stack.append((current, True))
+            for child in children:
+                if id(child) not in closures and id(child) not in in_progress:
+                    in_progress.add(id(child))
+                    stack.append((child, False))
+        else:
+            closure, seen = [], set([id(current)])
+            for child in children:
+                for sub_token in [child] + closures.get(id(child), []):
+                    if id(sub_token) not in seen:
+                        seen.add(id(sub_token))
+                        closure.append(sub_token)
+            closures[id(current)] = closure
+            in_progress.discard(id(current))
+    # done.
+    return closures[id(token)]
+
+# function to put every token in a closure into my_set (a single pass over the precomputed closure).
+def set_token_closure(closure, my_set):
+    for sub_token in closure:
+        sub_token.set = my_set
+
+# function to make sure memory.sub_token_index (see dataTypes_DING.subTokenIndex) matches the current structure of memory, clearing the memoized closures if any token, or any token's children (see get_child_tokens()), has changed since it was made.
+def update_sub_token_index(memory):
+    # the key holds the tokens themselves (not their ids), so a token cannot be freed and its id reused by a new token while the closures keyed by its id are kept.
+    structure_key = tuple((token,) + tuple(get_child_tokens(token)) for token in memory.Groups + memory.Ps + memory.RBs + memory.POs)
+    if memory.sub_token_index is None or memory.sub_token_index.structure_key != structure_key:
+        memory.sub_token_index = dataTypes_DING.subTokenIndex()
+        memory.sub_token_index.structure_key = structure_key
+    # done.
+    return memory
+
 # function to make copies of items from memory to enter AM.
 def make_AM_copy(memory):
     # go through memory and make a list of all analogs to be copied. For each item, if it is to be retrieved into AM, then check if its analog is in the list of analogs to enter AM. If not, add it.
@@ -581,201 +764,34 @@ def check_analog_for_tokens_to_copy(analog):
     # return copy_analog_flag
     return copy_analog_flag
 
-# function to copy a to be retrieved analog and it's elements into AM.
+# function to copy a to be retrieved analog and it's elements into AM. The copy is a copy-on-write copy (see dataTypes_DING.analogCopy): it shares the structure and semantic links of the original analog, and only the tokens that enter AM get their own (view) tokens.
 def copy_analog(analog, memory):
-    # make a copy of the analog. NOTE: you can't use copy here because of recursion issues, so you're rolling your own copy code. Maybe there's a package for this, but then you're you, so you're not looking it up.
-    new_analog = dataTypes.Analog()
-    # make all tokens from the to be copied analog. 
-    new_analog, memory = copy_analog_tokens(analog, new_analog, memory)
+    new_analog = dataTypes_DING.analogCopy(analog)
+    # find the tokens of the original analog that are to be retrieved, and record their set in the copy.
+    to_retrieve = [token for token in analog.myGroups + analog.myPs + analog.myRBs + analog.myPOs if token.set != 'memory']
+    for token in to_retrieve:
+        new_analog.sets[id(token)] = token.set
+    # for each token to be retrieved, make sure all tokens below it are also to be retrieved (e.g., if a P is to be retrieved into 'recipient', make sure all RBs and POs connected to those RBs are also to be retrieved into 'recipient'). Tokens that are not to be retrieved are simply left out of the copy.
+    closures = {}
+    for token in to_retrieve:
+        for sub_token in get_sub_token_closure(token, closures):
+            new_analog.sets[id(sub_token)] = new_analog.sets[id(token)]
     # in the original analog, set the .set field of each element to 'memory'. 
-    analog = clear_set(analog)
-    # for each token in the copied analog, if a token is to be retrieved, then make sure all tokens below it are also to be retrieved (e.g., if a P is to be retrieved into 'recipient', make sure all RBs and POs connected to those RBs also have their .set field set to 'recipient).
-    new_analog = retrieve_all_relevant_tokens(new_analog)
-    # for each token in the copied analog, delete any token that is not be be retrieved (i.e., the .set field is 'memory') (I don't think you need this part: AND there are no higher tokens that are to be retrieved (e.g., a PO has no RBs to be retrieved)), delete that token. Make sure all items above and below that token have that token removed from their list of connections (e.g., a to be deleted RB is removed as a connection its parent and child Ps, and its predicate and object POs). 
-    new_analog = delete_unretrieved_tokens(new_analog)
+    for token in to_retrieve:
+        token.set = 'memory'
+    # put the copied tokens into memory, and connect the copied POs to the semantics.
+    memory.Ps.extend(new_analog.myPs)
+    memory.RBs.extend(new_analog.myRBs)
+    memory.POs.extend(new_analog.myPOs)
+    for copy_PO in new_analog.myPOs:
+        for new_link in copy_PO.mySemantics:
+            memory.Links.append(new_link)
+            new_link.mySemantic.myPOs.append(new_link)
     # place copied analog into memory. 
     memory.analogs.append(new_analog)
     # all done.
     return memory
 
-# function to make all tokens from the to be copied analog.
-def copy_analog_tokens(analog, new_analog, memory):
-    # start with Ps. (1) make the P. (2) then make each RB. Connect the RB to the P. (3) For each RB's POs, (4) check if a PO by that name already exists in new_analog.myPOs, and if so, connect that PO to currentRB, otherwise, make the PO, and connect it to the RB. Then, for each RB without Ps, start with (3) above. Then, for each PO without RBs, start with (4) above.
-    for myP in analog.myPs:
-        # make a copy of the P.
-        copy_P = dataTypes.PUnit(myP.name, myP.set, new_analog, False, new_analog)
-        # put the copied P in new_analog and in memory.
-        new_analog.myPs.append(copy_P)
-        memory.Ps.append(copy_P)
-        # make copy_P's RB units.
-        for myRB in myP.myRBs:
-            # make a copy of the RB.
-            copy_RB = dataTypes.RBUnit(myRB.name, myRB.set, new_analog, False, new_analog)
-            # put the copy_RB in new_analog and in memory.
-            new_analog.myRBs.append(copy_RB)
-            memory.RBs.append(copy_RB)
-            # connect the copy_RB to copy_P and vise versa.
-            copy_RB.myParentPs.append(copy_P)
-            copy_P.myRBs.append(copy_RB)
-            # make the RBs pred (if it does not already exist). Check if a pred with the same name as myRB.myPred[0] already exists in new_analog.myPOs.
-            make_new_PO = True
-            for myPO in new_analog.myPOs:
-                if myPO.name == myRB.myPred[0].name:
-                    # the PO is already in new_analog, so just connect it to the copy_RB.
-                    myPO.myRBs.append(copy_RB)
-                    copy_RB.myPred.append(myPO)
-                    # set make_new_PO flag to False.
-                    make_new_PO = False
-                    break
-            # if the PO does not already exist in the new_analog, then make it.
-            if make_new_PO:
-                # make the RB's pred.
-                copy_pred = dataTypes.POUnit(myRB.myPred[0].name, myRB.myPred[0].set, new_analog, False, new_analog, 1)
-                # put the copy_pred in new_analog and in memory.
-                new_analog.myPOs.append(copy_pred)
-                memory.POs.append(copy_pred)
-                # connect the copy_pred to copy_RB and vise versa.
-                copy_pred.myRBs.append(copy_RB)
-                copy_RB.myPred.append(copy_pred)
-                # make all the semantic connections for copy_pred.
-                for link in myRB.myPred[0].mySemantics:
-                    # create a new link for the copy_pred.
-                    new_link = dataTypes.Link(copy_pred, None, link.mySemantic, link.weight)
-                    # add the new_link to memory.Links, new_pred.semantics, and link.mySemantic.myPOs.
-                    memory.Links.append(new_link)
-                    copy_pred.mySemantics.append(new_link)
-                    link.mySemantic.myPOs.append(new_link)
-            # make the RBs object (if it does not already exist).
-            make_new_PO = True
-            for myPO in new_analog.myPOs:
-                if myPO.name == myRB.myObj[0].name:
-                    # the PO is already in new_analog, so just connect it to the copy_RB.
-                    myPO.myRBs.append(copy_RB)
-                    copy_RB.myObj.append(myPO)
-                    # set make_new_PO flag to False.
-                    make_new_PO = False
-                    break
-            # if the PO does not already exist in the new_analog, then make it.
-            if make_new_PO:
-                # make the RB's object.
-                copy_obj = dataTypes.POUnit(myRB.myObj[0].name, myRB.myObj[0].set, new_analog, False, new_analog, 0)
-                # put the copy_obj in new_analog and in memory.
-                new_analog.myPOs.append(copy_obj)
-                memory.POs.append(copy_obj)
-                # connect the copy_obj to copy_RB and vise versa.
-                copy_obj.myRBs.append(copy_RB)
-                copy_RB.myObj.append(copy_obj)
-                # make all the semantic connections for copy_obj.
-                for link in myRB.myObj[0].mySemantics:
-                    # create a new link for the copy_obj.
-                    new_link = dataTypes.Link(copy_obj, None, link.mySemantic, link.weight)
-                    # add the new_link to memory.Links, copy_obj.semantics, and link.mySemantic.myPOs.
-                    memory.Links.append(new_link)
-                    copy_obj.mySemantics.append(new_link)
-                    link.mySemantic.myPOs.append(new_link)
-    # now make all RBs that don't have Ps.
-    for myRB in analog.myRBs:
-        if len(myRB.myParentPs) == 0:
-            # make a copy of the RB.
-            copy_RB = dataTypes.RBUnit(myRB.name, myRB.set, new_analog, False, new_analog)
-            # put the copy_RB in new_analog and in memory.
-            new_analog.myRBs.append(copy_RB)
-            memory.RBs.append(copy_RB)
-            # make the RBs pred (if it does not already exist). Check if a pred with the same name as myRB.myPred[0] already exists in new_analog.myPOs.
-            make_new_PO = True
-            for myPO in new_analog.myPOs:
-                if myPO.name == myRB.myPred[0].name:
-                    # the PO is already in new_analog, so just connect it to the copy_RB.
-                    myPO.myRBs.append(copy_RB)
-                    copy_RB.myPred.append(myPO)
-                    # set make_new_PO flag to False.
-                    make_new_PO = False
-                    break
-            # if the PO does not already exist in the new_analog, then make it.
-            if make_new_PO:
-                # make the RB's pred.
-                copy_pred = dataTypes.POUnit(myRB.myPred[0].name, myRB.myPred[0].set, new_analog, False, new_analog, 1)
-                # put the copy_pred in new_analog and memory.
-                new_analog.myPOs.append(copy_pred)
-                memory.POs.append(copy_pred)
-                # connect the copy_pred to copy_RB and vise versa.
-                copy_pred.myRBs.append(copy_RB)
-                copy_RB.myPred.append(copy_pred)
-                # make all the semantic connections for copy_pred.
-                for link in myRB.myPred[0].mySemantics:
-                    # create a new link for the copy_pred.
-                    new_link = dataTypes.Link(copy_pred, None, link.mySemantic, link.weight)
-                    # add the new_link to memory.Links, new_pred.semantics, and link.mySemantic.myPOs.
-                    memory.Links.append(new_link)
-                    copy_pred.mySemantics.append(new_link)
-                    link.mySemantic.myPOs.append(new_link)
-            # make the RBs object (if it does not already exist).
-            make_new_PO = True
-            for myPO in new_analog.myPOs:
-                if myPO.name == myRB.myObj[0].name:
-                    # the PO is already in new_analog, so just connect it to the copy_RB.
-                    myPO.myRBs.append(copy_RB)
-                    copy_RB.myObj.append(myPO)
-                    # set make_new_PO flag to False.
-                    make_new_PO = False
-                    break
-            # if the PO does not already exist in the new_analog, then make it.
-            if make_new_PO:
-                # make the RB's object.
-                copy_obj = dataTypes.POUnit(myRB.myObj[0].name, myRB.myObj[0].set, new_analog, False, new_analog, 0)
-                # put the copy_obj in new_analog and memory.
-                new_analog.myPOs.append(copy_obj)
-                memory.POs.append(copy_obj)
-                # connect the copy_obj to copy_RB and vise versa.
-                copy_obj.myRBs.append(copy_RB)
-                copy_RB.myObj.append(copy_obj)
-                # make all the semantic connections for copy_obj.
-                for link in myRB.myObj[0].mySemantics:
-                    # create a new link for the copy_obj.
-                    new_link = dataTypes.Link(copy_obj, None, link.mySemantic, link.weight)
-                    # add the new_link to memory.Links, copy_obj.semantics, and link.mySemantic.myPOs.
-                    memory.Links.append(new_link)
-                    copy_obj.mySemantics.append(new_link)
-                    link.mySemantic.myPOs.append(new_link)
-    # make all POs that don't have RBs.
-    for myPO in analog.myPOs:
-        if len(myPO.myRBs) == 0:
-            make_new_PO = True
-            for checkPO in new_analog.myPOs:
-                if checkPO.name == myPO.name:
-                    # the PO is already in new_analog, so set make_new_PO flag to False.
-                    make_new_PO = False
-                    break
-            # if the PO does not already exist in the new_analog, then make it.
-            if make_new_PO:
-                # make the RB's object.
-                copy_obj = dataTypes.POUnit(myPO.name, myPO.set, new_analog, False, new_analog, 0)
-                # put the copy_obj in new_analog and memory.
-                new_analog.myPOs.append(copy_obj)
-                memory.POs.append(copy_obj)
-                # make all the semantic connections for copy_obj.
-                for link in myPO.mySemantics:
-                    # create a new link for the copy_obj.
-                    new_link = dataTypes.Link(copy_obj, None, link.mySemantic, link.weight)
-                    # add the new_link to memory.Links, copy_obj.semantics, and link.mySemantic.myPOs.
-                    memory.Links.append(new_link)
-                    copy_obj.mySemantics.append(new_link)
-                    link.mySemantic.myPOs.append(new_link)
-    # all done.
-    return new_analog, memory
-
-# function to clear .set field for all tokens in an analog.
-def clear_set(analog):
-    for Group in analog.myGroups:
-        Group.set = 'memory'
-    for myP in analog.myPs:
-        myP.set = 'memory'
-    for myRB in analog.myRBs:
-        myRB.set = 'memory'
-    for myPO in analog.myPOs:
-        myPO.set = 'memory'
-    # done.
-    return analog
 
 # update newSet inputs.
 def update_newSet_inputs(memory):
@@ -806,143 +822,6 @@ def update_newSet_inputs(memory):
     # done.
     return memory
 
-# function to make sure all lower tokens of a to be retrieved into AM token in an analog are also set to be retrieved.
-def retrieve_all_relevant_tokens(analog):
-    # check each token, and if it is to be retrieved into AM (i.e., .set is NOT 'memory), make sure all tokens below it are also be be retrieved into AM.
-    for Group in analog.myGroups:
-        if Group.set != 'memory':
-            Group = retrieve_lower_tokens(Group)
-    for myP in analog.myPs:
-        if myP.set != 'memory':
-            myP = retrieve_lower_tokens(myP)
-    for myRB in analog.myRBs:
-        if myRB.set != 'memory':
-            myRB = retrieve_lower_tokens(myRB)
-    for myPO in analog.myPOs:
-        if myPO.set != 'memory':
-            myPO = retrieve_lower_tokens(myPO)
-    # done.
-    return analog
-
-# function to make sure all a token's sub-tokens are in the proper .set
-def retrieve_lower_tokens(token):
-    # check what kind of token you're dealing with.
-    if token.my_type == 'Group':
-        # if you're dealing with a Group, then for each of it's sub-groups, sub-Ps, and sub-RBs, set that sub_token.set to the same set as the Group, and run retrieve_lower_tokens on that sub-token.
-        for Group_under in token.myChildGroups:
-            Group_under.set = token.set
-            Group_under = retrieve_lower_tokens(Group_under)
-        for myP in token.myPs:
-            myP.set = token.set
-            myP = retrieve_lower_tokens(myP)
-        for myRB in token.myRBs:
-            myRB.set = token.set
-            myRB = retrieve_lower_tokens(myRB)
-    if token.my_type == 'P':
-        # if you're dealing with a P, then for each of it's RBs, set that myRB.set to the same set as the P, and run retrieve_lower_tokens on the myRB.
-        for myRB in token.myRBs:
-            myRB.set = token.set
-            myRB = retrieve_lower_tokens(myRB)
-    if token.my_type == 'RB':
-        # if you're dealing with a RB, then for each of it's child-Ps and POs, set that token.set to the same set as the RB, and run retrieve_lower_tokens on the the sub-token.
-        token.myPred[0].set = token.set
-        token.myPred[0] = retrieve_lower_tokens(token.myPred[0])
-        if len(token.myObj) > 0:
-            token.myObj[0].set = token.set
-            token.myObj[0] = retrieve_lower_tokens(token.myObj[0])
-        elif len(token.myChildP) > 0:
-            token.myChildP[0].set = token.set
-            token.myChildP[0] = retrieve_lower_tokens(token.myChildP[0])
-    # done.
-    return token
-
-# function to delete unretrieved tokens from a copied analog.
-def delete_unretrieved_tokens(analog):
-    # go through each token in the analog. If it is unretrieved (i.e., token.set == 'memory'), delete that token and make sure you also delete that token from any tokens to which is is connected. NOTE: You don't need to worry about connections between POs and semantics, as the semantics copied POs are connected to are themselves copied and it doesn't matter if they are deleted. You'll replace these copied semantics with the original semantics using replace_copied_semantics() later in the check_analog_for_tokens_to_copy() function. 
-    for Group in analog.myGroups:
-        if Group.set == 'memory':
-            analog = delete_token(Group, analog)
-    for myP in analog.myPs:
-        if myP.set == 'memory':
-            analog = delete_token(myP, analog)
-    for myRB in analog.myRBs:
-        if myRB.set == 'memory':
-            analog = delete_token(RB, analog)
-    for myPO in analog.myPOs:
-        if myPO.set == 'memory':
-            analog = delete_token(myPO, analog)
-    # done.
-    return analog
-
-# function to delete a token from an analog.
-def delete_token(token, analog):
-    # figure out what kind of unit token is, then delete the token and delete instances of that token from any units it is connected to.
-    if token.my_type == 'Group':
-        # delete the Group from its ParentGroups, ChildGroups, Ps, and RBs.
-        for pGroup in token.myParentGroups:
-            pGroup.myChildGroups.remove(token)
-        for cGroup in token.myChildGroups:
-            cGroup.myParentGroups.remove(token)
-        for myP in token.myPs:
-            myP.myGroups.remove(token)
-        for myRB in token.myRBs:
-            myRB.myGroups.remove(token)
-        # delete the Group iteself from analog.
-        # NOTE: You don't need to delete the analog from memory, because you haven't added the analog to memory yet. It is still just a copied analog
-        analog.myGroups.remove(token)
-    elif token.my_type == 'P':
-        # delete the P from its Groups, ParentRBs, and ChildRBs.
-        for Group in token.myGroups:
-            Group.myPs.remove(token)
-        for ParentRB in token.myParentRBs:
-            ParentRB.myChildP.remove(token)
-        for ChildRB in token.myRBs:
-            ChildRB.myParentPs.remove(token)
-        # delete the P iteself.	
-        analog.myPs.remove(token)
-    elif token.my_type == 'RB':
-        # delete the RB from its ParentPs, Pred, and either ChildP or Object.
-        for ParentP in token.myParentPs:
-            ParentP.myRBs.remove(token)
-        for pred in token.myPred:
-            # if you are removing an RB, make sure that the PO connected to that RB also has the RB's second PO removed from its .same_RB_POs field. That is, a PO knows what other POs share RBs with it (so that it does not inhibit them during LISA mode). If an RB is deleted, the two POs sharing that RB no longer do. (RECALL: in a single analog, if two instances of a role-binding occur, the same PO tokens and same RB token is used to instantiate both (e.g., if L1(x) occurs twice in the same analog, then L1, x and L1+x are used in both instances). As a consequence, if an RB is deleted, then it means that the Pred and object are not linked by an RB in the current analog, and, as such, that neither PO should appear in the other PO's .same_RB_POs field.)
-            # first, check to make sure the RB takes an object as an argument. A P as an argument will not appear in myPO.same_RB_POs as a P is NOT a myPO.
-            if len(token.myObj) > 0:
-                pred.same_RB_POs.remove(token.myObj[0])
-            pred.myRBs.remove(token)
-        for ChildP in token.myChildP:
-            ChildP.myParentRBs.remove(token)
-        for obj in token.myObj:
-            # delete the token's pred from the object's .same_RB_POs field.
-            obj.same_RB_POs.remove(token.myPred[0])
-            obj.myRBs.remove(token)
-        # delete the RB iteself.
-        analog.myRBs.remove(token)
-    elif token.my_type == 'PO':
-        # delete the PO from its RBs.
-        for myRB in token.myRBs:
-            if token.predOrObj == 1:
-                myRB.myPred.remove(token)
-            else:
-                myRB.myObj.remove(token)
-        # delete the PO iteself.
-        analog.myPOs.remove(token)
-    # done.
-    return analog
-
-# function to replace semantics in a new PO with the original memory.semantics versions.
-def replace_copied_semantics(myPO, semantics):
-    # for each Link in my .mySemantics, find the original semantic with the same name as .mySemantic.name, and replace .mySemantic with the original semantic from memory.
-    for Link in myPO.mySemantics:
-        # search each semantic in memory.semantics for the one with the same name as Link.mySemantic. Once you have found that semantic, replace Link.mySemantic with the semantic from memory, and break the for loop. 
-        for semantic in semantics:
-            if semantic.name == Link.mySemantic.name:
-                Link.mySemantic = semantic
-                semantic.myPOs.append(Link)
-                break # break the for loop.
-    # done. 
-    return PO, semantics
-
 # function to find token in memory whose set is driver or recipient in order to construct the driver and recipient sets for the run. Returns driver and recipient sets. 
 def findDriverRecipient(memory):
     # first clear out the memory.driver and memory.recipient fields.
@@ -1097,6 +976,11 @@ def update_same_RB_POs(memory):
     # done.
     return memory
 
+# function to get every unit whose state is part of a runDORA.get_state_snapshot(): all tokens and semantics, the links between POs and semantics, the mapping connections, and the local and global inhibitors.
+def get_state_units(memory):
+    # done.
+    return memory.Groups + memory.Ps + memory.RBs + memory.POs + memory.semantics + memory.Links + memory.mappingConnections + [memory.localInhibitor, memory.globalInhibitor]
+
 # a function to clear activation and input to all driver, recipient, newSet, and semantic units (i.e., everything in active memory, AM).
 def initialize_AM(memory):
     for Group in memory.driver.Groups:
@@ -1207,73 +1091,196 @@ def update_activations_run(memory, gamma, delta, HebbBias, phase_set, do_ding=Fa
     # done.
     return memory
 
-# update the activation of all units in memory that are NOT in driver, recipient, or newSet. (For use in retrieval.)
-def update_acts_memory(memory, gamma, delta, HebbBias):
-    for Group in memory.Groups:
+# update the activation of all units in memory that are NOT in driver, recipient, or newSet. (For use in retrieval.) tokens is an optional (Groups, Ps, RBs, POs) tuple of lists restricting the update to those tokens (see retrieval_routine()); by default all tokens in memory are updated.
+def update_acts_memory(memory, gamma, delta, HebbBias, tokens=None):
+    if tokens is None:
+        tokens = (memory.Groups, memory.Ps, memory.RBs, memory.POs)
+    Groups, Ps, RBs, POs = tokens
+    for Group in Groups:
         if Group.set == 'memory':
             Group.update_act(gamma, delta, HebbBias)
-    for myP in memory.Ps:
+    for myP in Ps:
         if myP.set == 'memory':
             myP.update_act(gamma, delta, HebbBias)
-    for myRB in memory.RBs:
+    for myRB in RBs:
         if myRB.set == 'memory':
             myRB.update_act(gamma, delta, HebbBias)
-    for myPO in memory.POs:
+    for myPO in POs:
         if myPO.set == 'memory':
             myPO.update_act(gamma, delta, HebbBias)
     # done.
     return memory
 
-# update inputs to driver units.
-def update_driver_inputs(memory, asDORA, lateral_input_level):
+# functions for incremental input updates (see runDORA.time_step_activations()). The input to a unit is a function of the activations (and modes, inhibitor activations, and max mapping connections) of the units it reads from, so if none of those have changed since its input was last computed, its input has not changed either. Each time-step, the units whose state has changed by more than epsilon since their readers last saw it are found, and only the inputs of their readers (the dirty frontier) are recomputed; all other units keep their inputs from the last time-step. Inputs are computed in two passes (driver units before the PO and RB inhibitors update, semantics and recipient units after), so the state each pass last saw is kept separately.
+# function to get the state of a unit that other units' inputs depend on.
+def get_input_state(unit):
+    return (unit.act, getattr(unit, 'mode', 0), getattr(unit, 'inhibitor_act', 0.0), getattr(unit, 'max_map', 0.0))
+
+# function to get a key describing the units and connections that inputs are computed over (if it changes, the dirty tracker must be rebuilt).
+def get_dirty_structure_key(memory):
+    AM_sets = [memory.driver.Groups, memory.driver.Ps, memory.driver.RBs, memory.driver.POs, memory.recipient.Groups, memory.recipient.Ps, memory.recipient.RBs, memory.recipient.POs, memory.semantics, memory.mappingConnections]
+    # the key holds the units themselves (not the ids of the lists), so lists rebuilt with other units of the same sizes (e.g., by findDriverRecipient()) never match it.
+    return tuple(tuple(units) for units in AM_sets)
+
+# function to find the units that read a unit's state when computing their input: returns a list of keys of whole groups of units that read it (e.g., all the POs in the recipient, through lateral inhibition), and a list of other units that read it (through their connections, their mapping connections, or, for a token, itself, as its input depends on its own mode and inhibitor).
+def get_input_readers(unit, mapping_readers, ignore_memory_semantics):
+    if unit.my_type == 'semantic':
+        # recipient POs read the semantics they are connected to.
+        return [], [link.myPO for link in unit.myPOs if link.myPO.set == 'recipient']
+    readers = []
+    if unit.my_type == 'PO':
+        # semantics read the POs connected to them (memory POs only if not ignoring memory semantics, and never newSet POs).
+        if unit.set != 'memory' or not ignore_memory_semantics:
+            readers.extend(link.mySemantic for link in unit.mySemantics)
+    if unit.set not in ('driver', 'recipient'):
+        return [], readers
+    readers.append(unit)
+    readers.extend(mapping_readers.get(id(unit), []))
+    if unit.my_type == 'Group':
+        groups = [(unit.set, 'Group')]
+        readers.extend(unit.myParentGroups + unit.myChildGroups + unit.myPs + unit.myRBs)
+    elif unit.my_type == 'P':
+        groups = [(unit.set, 'P'), (unit.set, 'PO')]
+        readers.extend(unit.myRBs + unit.myParentRBs + unit.myGroups)
+    elif unit.my_type == 'RB':
+        groups = [(unit.set, 'RB'), (unit.set, 'PO')]
+        readers.extend(unit.myParentPs + unit.myPred + unit.myObj + unit.myChildP + unit.myParentRB + unit.myChildRB)
+    else:
+        groups = [(unit.set, 'PO'), (unit.set, 'P')]
+        readers.extend(unit.myRBs)
+    return groups, readers
+
+# function to build the dirty tracker (see dataTypes_DING.dirtyTracker) for the current driver, recipient, and semantics.
+def make_dirty_tracker(memory, ignore_memory_semantics):
+    tracker = dataTypes_DING.dirtyTracker()
+    for my_set, AM_set in (('driver', memory.driver), ('recipient', memory.recipient)):
+        tracker.group_members[(my_set, 'Group')] = AM_set.Groups
+        tracker.group_members[(my_set, 'P')] = AM_set.Ps
+        tracker.group_members[(my_set, 'RB')] = AM_set.RBs
+        tracker.group_members[(my_set, 'PO')] = AM_set.POs
+    tracker.units = memory.driver.Groups + memory.driver.Ps + memory.driver.RBs + memory.driver.POs + memory.recipient.Groups + memory.recipient.Ps + memory.recipient.RBs + memory.recipient.POs + memory.semantics
+    if not ignore_memory_semantics:
+        tracker.units += [myPO for myPO in memory.POs if myPO.set == 'memory']
+    # recipient tokens read the driver tokens they have mapping connections to.
+    mapping_readers = {}
+    for unit in memory.recipient.Groups + memory.recipient.Ps + memory.recipient.RBs + memory.recipient.POs:
+        for mappingConnection in unit.mappingConnections:
+            mapping_readers.setdefault(id(mappingConnection.driverToken), []).append(unit)
+    # split each unit's readers by the pass their inputs are computed in.
+    for unit in tracker.units:
+        groups, readers = get_input_readers(unit, mapping_readers, ignore_memory_semantics)
+        for pass_number in (1, 2):
+            pass_set = 'driver' if pass_number == 1 else 'recipient'
+            tracker.pass_groups[pass_number].append([key for key in groups if key[0] == pass_set])
+            tracker.pass_readers[pass_number].append([reader for reader in readers if (reader.my_type == 'semantic' and pass_number == 2) or (reader.my_type != 'semantic' and reader.set == pass_set)])
+    # done.
+    return tracker
+
+# function to record the state of every tracked unit as seen by the given pass (after all its inputs have been recomputed).
+def record_input_states(tracker, pass_number):
+    tracker.seen[pass_number] = [get_input_state(unit) for unit in tracker.units]
+    # done.
+    return tracker
+
+# function to find the dirty frontier for a pass: the units (in the pass) that read any unit whose state has changed by more than epsilon since the pass last saw it.
+def get_dirty_units(tracker, pass_number, epsilon):
+    seen = tracker.seen[pass_number]
+    groups, dirty, dirty_ids = set(), [], set()
+    for position, unit in enumerate(tracker.units):
+        state = get_input_state(unit)
+        last_state = seen[position]
+        if abs(state[0] - last_state[0]) > epsilon or state[1:] != last_state[1:]:
+            seen[position] = state
+            groups.update(tracker.pass_groups[pass_number][position])
+            for reader in tracker.pass_readers[pass_number][position]:
+                if id(reader) not in dirty_ids:
+                    dirty_ids.add(id(reader))
+                    dirty.append(reader)
+    for key in groups:
+        for reader in tracker.group_members[key]:
+            if id(reader) not in dirty_ids:
+                dirty_ids.add(id(reader))
+                dirty.append(reader)
+    # done.
+    return dirty
+
+# function to recompute the inputs of the dirty units of a pass (pass 1: driver tokens; pass 2: semantics and recipient tokens).
+def update_inputs_incremental(memory, tracker, pass_number, asDORA, phase_set, lateral_input_level, ignore_object_semantics, ignore_memory_semantics, epsilon):
+    dirty = get_dirty_units(tracker, pass_number, epsilon)
+    tokens = {'Group': [], 'P': [], 'RB': [], 'PO': [], 'semantic': []}
+    for unit in dirty:
+        tokens[unit.my_type].append(unit)
+        if unit.my_type != 'semantic':
+            unit.initialize_input(0.0)
+    tokens_tuple = (tokens['Group'], tokens['P'], tokens['RB'], tokens['PO'])
+    if pass_number == 1:
+        memory = update_driver_inputs(memory, asDORA, lateral_input_level, tokens_tuple)
+    else:
+        for semantic in tokens['semantic']:
+            semantic.update_input(memory, ignore_object_semantics, ignore_memory_semantics)
+        memory = update_recipient_inputs(memory, asDORA, phase_set, lateral_input_level, ignore_object_semantics, tokens_tuple)
+    # done.
+    return memory
+
+# update inputs to driver units. tokens is an optional (Groups, Ps, RBs, POs) tuple of lists restricting the update to those driver tokens (see update_inputs_incremental()); by default all driver tokens are updated.
+def update_driver_inputs(memory, asDORA, lateral_input_level, tokens=None):
+    if tokens is None:
+        tokens = (memory.driver.Groups, memory.driver.Ps, memory.driver.RBs, memory.driver.POs)
+    Groups, Ps, RBs, POs = tokens
     # update inputs to all driver units.
-    for Group in memory.driver.Groups:
+    for Group in Groups:
         Group.update_input_driver(memory, asDORA)
-    for myP in memory.driver.Ps:
+    for myP in Ps:
         if myP.mode == 1:
             myP.update_input_driver_parent(memory, asDORA)
         elif myP.mode == -1:
             myP.update_input_driver_child(memory, asDORA)
-    for myRB in memory.driver.RBs:
+    for myRB in RBs:
         myRB.update_input_driver(memory, asDORA)
-    for myPO in memory.driver.POs:
+    for myPO in POs:
         myPO.update_input_driver(memory, asDORA)
     # done
     return memory
 
-# update inputs to recipient units.
-def update_recipient_inputs(memory, asDORA, phase_set, lateral_input_level, ignore_object_semantics):
+# update inputs to recipient units. tokens is an optional (Groups, Ps, RBs, POs) tuple of lists restricting the update to those recipient tokens (see update_inputs_incremental()); by default all recipient tokens are updated.
+def update_recipient_inputs(memory, asDORA, phase_set, lateral_input_level, ignore_object_semantics, tokens=None):
+    if tokens is None:
+        tokens = (memory.recipient.Groups, memory.recipient.Ps, memory.recipient.RBs, memory.recipient.POs)
+    Groups, Ps, RBs, POs = tokens
     # update inputs to all recipient units.
-    for Group in memory.recipient.Groups:
+    for Group in Groups:
         Group.update_input_driver(memory, asDORA)
-    for myP in memory.recipient.Ps:
+    for myP in Ps:
         if myP.mode == 1:
             myP.update_input_recipient_parent(memory, asDORA, phase_set, lateral_input_level)
         elif myP.mode == -1:
             myP.update_input_recipient_child(memory, asDORA, phase_set, lateral_input_level)
-    for myRB in memory.recipient.RBs:
+    for myRB in RBs:
         myRB.update_input_recipient(memory, asDORA, phase_set, lateral_input_level)
-    for myPO in memory.recipient.POs:
+    for myPO in POs:
         myPO.update_input_recipient(memory, asDORA, phase_set, lateral_input_level, ignore_object_semantics)
     # done.
     return memory
 
-# update input to all memorySet units that are not in driver, recipient, or newSet (used during retreival).
-def update_memory_inputs(memory, asDORA, lateral_input_level):
+# update input to all memorySet units that are not in driver, recipient, or newSet (used during retreival). tokens is an optional (Groups, Ps, RBs, POs) tuple of lists restricting the update to those tokens (see retrieval_routine()); by default all tokens in memory are updated.
+def update_memory_inputs(memory, asDORA, lateral_input_level, tokens=None):
     # for all units not in driver, recipient, or newSet (i.e., units with set != driver, recipient, or newSet), update input. Units in memory update as units in recipient.
     # set phase_set to 2.
     phase_set = 2
-    for Group in memory.Groups:
+    if tokens is None:
+        tokens = (memory.Groups, memory.Ps, memory.RBs, memory.POs)
+    Groups, Ps, RBs, POs = tokens
+    for Group in Groups:
         if Group.set == 'memory':
             Group.update_input_recipient(memory, asDORA, phase_set, lateral_input_level)
-    for myP in memory.Ps:
+    for myP in Ps:
         if myP.set == 'memory':
             # NOTE: I think it might be best to avoid modes altogether when working in retieval mode. This version of the code reflects this assumption.
             myP.update_input_recipient_parent(memory, asDORA, phase_set, lateral_input_level)
-    for myRB in memory.RBs:
+    for myRB in RBs:
         if myRB.set == 'memory':
             myRB.update_input_recipient(memory, asDORA, phase_set, lateral_input_level)
-    for myPO in memory.POs:
+    for myPO in POs:
         if myPO.set == 'memory':
             myPO.update_input_recipient(memory, asDORA, phase_set, lateral_input_level) # update with phase_set = 2 so that myPO units also take top down input from RBs.
     # done.
@@ -1288,177 +1295,309 @@ def get_max_sem_input(memory):
     # done.
     return max_input
 
-# function to do run the network during retieval.
-def retrieval_routine(memory, asDORA, gamma, delta, HebbBias, lateral_input_level, bias_retrieval_analogs):
-    # update input to memorySet units.
-    memory = update_memory_inputs(memory, asDORA, lateral_input_level)
-    # update activation of memorySet units.
-    memory = update_acts_memory(memory, gamma, delta, HebbBias)
+# function to do run the network during retieval. If num_threads > 0 (and retrieval is not restricted to candidate analogs or to a shortlist), the memory tokens are updated in num_shards shards on num_threads threads; if num_processes > 0, they are updated on that many worker processes instead (see retrievalShards_DING).
+def retrieval_routine(memory, asDORA, gamma, delta, HebbBias, lateral_input_level, bias_retrieval_analogs, num_threads=0, num_shards=0, num_processes=0):
+    # make sure there is a retrieval index (it is normally built at the start of do_retrieval()).
+    if memory.retrieval_index is None:
+        memory = make_retrieval_index(memory)
+    index = memory.retrieval_index
+    if index.restrict:
+        # only update the analogs reachable from semantics that have been active so far in this retrieval (bringing in any analogs reached by newly active semantics).
+        memory = expand_retrieval_candidates(memory, asDORA, lateral_input_level)
+        tokens = (memory.Groups, index.candidate_Ps, index.candidate_RBs, index.candidate_POs)
+        positions = index.candidate_positions
+    elif index.allowed is not None:
+        # only update the tokens of the analogs on the shortlist.
+        tokens = (memory.Groups, index.allowed_Ps, index.allowed_RBs, index.allowed_POs)
+        positions = index.allowed_positions
+    else:
+        tokens = None
+        positions = np.arange(len(index.tokens))
+    # the shards hold all the analogs, so they are only used when every analog is updated.
+    sharded = not index.restrict and index.allowed is None
+    if num_processes > 0 and sharded:
+        memory, done = retrievalShards_DING.process_retrieval_step(memory, num_processes, asDORA, gamma, delta, HebbBias, lateral_input_level, bias_retrieval_analogs)
+        if done:
+            # the workers have written the per-analog totals to the index (or, if not bias_retrieval_analogs, they keep the max acts, which are collected from them when the retrieval is finished).
+            return memory
+    acts = None
+    if num_threads > 0 and sharded:
+        memory, acts = retrievalShards_DING.sharded_retrieval_step(memory, num_threads, num_shards, asDORA, gamma, delta, HebbBias, lateral_input_level)
+    if acts is None:
+        # update input to memorySet units.
+        memory = update_memory_inputs(memory, asDORA, lateral_input_level, tokens)
+        # update activation of memorySet units.
+        memory = update_acts_memory(memory, gamma, delta, HebbBias, tokens)
+        if index.restrict:
+            # keep a running total of the input that analogs not yet instantiated would have received from the recipient, so they can catch up when instantiated.
+            memory = accumulate_pooled_retrieval_input(memory, asDORA, lateral_input_level)
+        # collect the activation of every updated token in a single pass, zeroing tokens that are not in memory (i.e., tokens already in driver or recipient). Tokens outside positions are at rest (act == 0.0).
+        acts = np.zeros(len(index.tokens))
+        acts[positions] = np.fromiter((index.tokens[position].act for position in positions), dtype=float, count=len(positions))
+        acts[~index.in_memory] = 0.0
     if bias_retrieval_analogs:
-        # for each analog, track the total activation of its units if they are in memory (i.e., if the analog is not already in driver or recipient). 
-        for analog in memory.analogs:
-            analog.total_act = 0.0
-            for myP in analog.myPs:
-                if myP.set == 'memory':
-                    analog.total_act += myP.act
-            for myRB in analog.myRBs:
-                if myRB.set == 'memory':
-                    analog.total_act += myRB.act
-            for myPO in analog.myPOs:
-                if myPO.set == 'memory':
-                    analog.total_act += myPO.act
-            analog.sum_num_units()
+        # for each analog, track the total activation of its units if they are in memory (i.e., if the analog is not already in driver or recipient). The sum over each analog's tokens is a segment sum over index.analog_ids (the last bin collects tokens with no analog and is dropped).
+        index.total_acts = np.bincount(index.analog_ids, weights=acts, minlength=index.num_analogs+1)[:index.num_analogs]
     else:
         # track the most active P, RB, and PO units in memory.
-        for myP in memory.Ps:
-            if myP.set == 'memory':
-                if myP.act > myP.max_act:
-                    myP.max_act = myP.act
-        for myRB in memory.RBs:
-            if myRB.set == 'memory':
-                if myRB.act > myRB.max_act:
-                    myRB.max_act = myRB.act
-        for myPO in memory.POs:
-            if myPO.set == 'memory':
-                if myPO.act > myPO.max_act:
-                    myPO.max_act = myPO.act
-        # done.
+        np.maximum(index.max_acts, acts, out=index.max_acts)
+    # done.
+    return memory
+
+# function to build the retrieval index (see dataTypes_DING.retrievalIndex) over the Ps, RBs, and POs in memory. The number of units in each analog is counted once here rather than on every retrieval step. Must be rebuilt if tokens or analogs are added to or removed from memory (do_retrieval() rebuilds it at the start of each retrieval). If allowed (a numpy bool array over memory.analogs, e.g., from retrievalPrefilter_DING.prefilter_analogs()) is given, only the tokens of those analogs are updated and scored, and only those analogs can be retrieved; if restrict, retrieval is also restricted to candidate analogs (see expand_retrieval_candidates()), drawn from the allowed analogs.
+def make_retrieval_index(memory, restrict=False, allowed=None):
+    index = dataTypes_DING.retrievalIndex()
+    index.tokens = memory.Ps + memory.RBs + memory.POs
+    index.num_analogs = len(memory.analogs)
+    # map each analog to its position in memory.analogs.
+    analog_positions = {}
+    for position, analog in enumerate(memory.analogs):
+        analog_positions[id(analog)] = position
+    index.analog_ids = np.array([analog_positions.get(id(token.myanalog), index.num_analogs) for token in index.tokens], dtype=int)
+    # count the units in each analog, and store the count in analog.num_units.
+    index.num_units = np.bincount(index.analog_ids, minlength=index.num_analogs+1)[:index.num_analogs]
+    for analog, num_units in zip(memory.analogs, index.num_units):
+        analog.num_units = int(num_units)
+    index.set_codes = np.array([dataTypes_DING.set_codes.get(token.set, -1) for token in index.tokens], dtype=int)
+    index.in_memory = index.set_codes == dataTypes_DING.set_codes['memory']
+    index.token_types = np.repeat([0, 1, 2], [len(memory.Ps), len(memory.RBs), len(memory.POs)])
+    index.retrieve_closures = None
+    index.total_acts = np.zeros(index.num_analogs)
+    index.max_acts = np.array([token.max_act for token in index.tokens], dtype=float)
+    # group token positions by analog (index.analog_order[index.analog_starts[i]:index.analog_starts[i+1]] are the positions of the tokens of analog i).
+    index.analog_order = np.argsort(index.analog_ids, kind='mergesort')
+    index.analog_starts = np.searchsorted(index.analog_ids[index.analog_order], np.arange(index.num_analogs+1))
+    # build the inverted index from each semantic to the memory POs that link to it, and to the analogs those POs belong to.
+    index.semantic_POs, index.semantic_analogs = {}, {}
+    first_PO = len(memory.Ps) + len(memory.RBs)
+    for position in range(first_PO, len(index.tokens)):
+        myPO = index.tokens[position]
+        if index.in_memory[position]:
+            for link in myPO.mySemantics:
+                index.semantic_POs.setdefault(link.mySemantic, []).append(myPO)
+                if index.analog_ids[position] < index.num_analogs:
+                    index.semantic_analogs.setdefault(link.mySemantic, set()).add(index.analog_ids[position])
+    index.allowed = allowed
+    if allowed is not None:
+        # the tokens of the allowed analogs (tokens with no analog in memory.analogs are never allowed).
+        index.allowed_tokens = np.append(allowed, False)[index.analog_ids]
+        index.allowed_positions = np.flatnonzero(index.allowed_tokens & index.in_memory)
+        index.allowed_Ps, index.allowed_RBs, index.allowed_POs = [[index.tokens[position] for position in index.allowed_positions[index.token_types[index.allowed_positions] == token_type]] for token_type in range(3)]
+    # start with no candidate analogs; retrieval_routine() adds them as their semantics become active.
+    index.restrict = restrict
+    index.candidate = np.zeros(index.num_analogs, dtype=bool)
+    index.candidate_Ps, index.candidate_RBs, index.candidate_POs = [], [], []
+    index.candidate_positions = np.zeros(0, dtype=int)
+    index.seen_semantics = set()
+    index.steps = 0
+    index.pooled = dict.fromkeys(['P', 'RB', 'PO', 'childP', 'RB_td'], 0.0)
+    memory.retrieval_index = index
+    # done.
+    return memory
+
+# function to add to the retrieval candidates every memory analog with a PO connected to a semantic that has become active since the last call (see dataTypes_DING.retrievalIndex). Analogs are only ever added, so the candidate set grows as retrieval proceeds. Newly added tokens are brought up to date with the inhibitory input they would have integrated from the recipient while they were at rest (see catch_up_memory_token()).
+def expand_retrieval_candidates(memory, asDORA, lateral_input_level):
+    index = memory.retrieval_index
+    # find the semantics that are active for the first time.
+    new_analogs = set()
+    for semantic in memory.semantics:
+        if semantic.act > 0 and semantic not in index.seen_semantics:
+            index.seen_semantics.add(semantic)
+            new_analogs.update(index.semantic_analogs.get(semantic, ()))
+    new_analogs = [analog_id for analog_id in sorted(new_analogs) if not index.candidate[analog_id]]
+    if index.allowed is not None:
+        new_analogs = [analog_id for analog_id in new_analogs if index.allowed[analog_id]]
+    if len(new_analogs) > 0:
+        new_positions = []
+        for analog_id in new_analogs:
+            index.candidate[analog_id] = True
+            for position in index.analog_order[index.analog_starts[analog_id]:index.analog_starts[analog_id+1]]:
+                if not index.in_memory[position]:
+                    continue
+                token = index.tokens[position]
+                if token.my_type == 'P':
+                    index.candidate_Ps.append(token)
+                elif token.my_type == 'RB':
+                    index.candidate_RBs.append(token)
+                else:
+                    index.candidate_POs.append(token)
+                catch_up_memory_token(token, index, asDORA, lateral_input_level)
+                new_positions.append(position)
+        index.candidate_positions = np.concatenate((index.candidate_positions, np.array(new_positions, dtype=int)))
+    # done.
+    return memory
+
+# function to give a memory token that has just become a retrieval candidate the input it would have integrated had it been updated on every previous step of this retrieval. A memory token in an analog with no active semantics gets no excitatory input (all its neighbours are in the same resting analog), so its act stays at 0.0 and its only input is inhibition from the recipient and its inhibitor, which memory units integrate across steps (their inputs are not reset during retrieval). The recipient part of that inhibition is pooled over all memory tokens, so it is kept as a running total in index.pooled (see accumulate_pooled_retrieval_input()).
+def catch_up_memory_token(token, index, asDORA, lateral_input_level):
+    if index.steps == 0:
+        return
+    if token.my_type == 'P':
+        token.lateral_input -= index.pooled['P']*lateral_input_level + token.inhibitor_act*10*index.steps
+    elif token.my_type == 'RB':
+        token.lateral_input -= index.pooled['RB']*lateral_input_level + token.inhibitor_act*10*index.steps
+    elif not token.inferred:
+        token.lateral_input -= index.pooled['PO']*lateral_input_level + token.inhibitor_act*10*index.steps
+        if asDORA:
+            token.lateral_input -= index.pooled['childP']*3
+            token.td_input -= index.pooled['RB_td']
+        elif token.predOrObj == 0:
+            token.lateral_input -= index.pooled['childP']*lateral_input_level
+
+# function to add this step's recipient inhibition of memory tokens to the running totals used by catch_up_memory_token().
+def accumulate_pooled_retrieval_input(memory, asDORA, lateral_input_level):
+    index = memory.retrieval_index
+    for myP in memory.recipient.Ps:
+        if myP.mode == 1:
+            index.pooled['P'] += myP.act
+        elif myP.mode == -1:
+            index.pooled['childP'] += myP.act
+    for myRB in memory.recipient.RBs:
+        if myRB.mode != -1:
+            index.pooled['RB'] += myRB.act
+        index.pooled['RB_td'] += myRB.act
+    for myPO in memory.recipient.POs:
+        index.pooled['PO'] += myPO.act
+    index.steps += 1
+    # done.
+    return memory
+
+# function to write the per-analog totals and per-token max activations computed by retrieval_routine() back to the analog and token objects (i.e., analog.total_act and token.max_act).
+def sync_retrieval_index(memory):
+    index = memory.retrieval_index
+    if index is not None:
+        for analog, total_act in zip(memory.analogs, index.total_acts):
+            analog.total_act = float(total_act)
+        for position in np.flatnonzero(index.in_memory):
+            index.tokens[position].max_act = float(index.max_acts[position])
+    # done.
     return memory
 
-# function to retrieve tokens from memory. Takes as arguments the memory set, and a bias_retrieval_analogs flag that if True, biases retrieval towards whole analogs.
+# function to draw num_draws random numbers in [0, 1) from the random module (as the rest of the run does, so random.seed() makes retrieval repeatable). Returns an array.
+def draw_random_numbers(num_draws):
+    # done.
+    return np.array([random.random() for draw in range(num_draws)])
+
+# function to retrieve tokens from memory. Takes as arguments the memory set, and a bias_retrieval_analogs flag that if True, biases retrieval towards whole analogs. Retrieval probabilities are computed for all analogs (or tokens) at once from the retrieval index, a draw is made with random.random() for each active analog, or, when retrieval is not biased to analogs, for each eligible token still in memory when its turn comes (in memory order, as the original per-token loops did), and the retrieved tokens are moved into the recipient in bulk (see retrieve_token_positions()).
 def retrieve_tokens(memory, bias_retrieval_analogs, use_relative_act):    
+    # make sure there is a retrieval index, and bring analog.total_act and token.max_act up to date with it.
+    if memory.retrieval_index is None:
+        memory = make_retrieval_index(memory)
+    memory = sync_retrieval_index(memory)
+    index = memory.retrieval_index
     # if bias_retrieval_analogs is true, bias towards retrieving whole analogs. Otherwise, default to no bias (myPs, RBs, and POs stand some odds of being retrieved regardless of their interconnectivity (of course, if a token is retrieved, all tokens below it that the token is connected to are also retrieved)). 
-    if use_relative_act:
-        # retrieve using relative activation of propositions.
-        if bias_retrieval_analogs:
-            # retrieve whole analogs.
-            # create a normalised retrieval score for each analog (i.e., analog.total_act/analog.num_units), and make a list of all analog activations.
-            analog_activation_list = []
-            for analog in memory.analogs:
-                # make sure analog has a .total_act and .num_units > 0.
-                if analog.total_act > 0 and analog.num_units > 0:
-                    # calculate analog.normalised_retrieval_act and add that to sum_normalised_analogs.
-                    analog.normalised_retrieval_act = analog.total_act/analog.num_units
-                    analog_activation_list.append(analog.normalised_retrieval_act)
-            # retrieve analogs with a probability calculated as a function of the ratio of the specific analog's normalised activation to the average normalised activation of all active analogs.
-            # find the average and highest normalised activation for analogs.
-            avg_analog_norm_act = np.mean(analog_activation_list)
-            high_analog_norm_act = max(analog_activation_list)
-            avg_analog_norm_act = (high_analog_norm_act+avg_analog_norm_act)/2
-            #pdb.set_trace()
-            # transform all retrieval activations using a sigmoidal function with a threshold around high_analog_norm_act. 
-            for analog in memory.analogs:
-                if analog.total_act > 0:
-                    analog.normalised_retrieval_act = 1/(1 + math.exp(10*(analog.normalised_retrieval_act-avg_analog_norm_act)))
-            # get the sum of all transformed noralised analog activations. 
-            sum_analog_norm_act = sum(analog_activation_list)
-            # retrieve analogs using the Luce choice rule appled to transformed activations. 
-            for analog in memory.analogs:
-                # if analog has a .total_act and .num_units > 0, then calculate the retrieve_prob.
-                if analog.total_act > 0 and analog.num_units > 0:
-                    retrieve_prob = analog.normalised_retrieval_act/sum_analog_norm_act
-                    randomNum = random.random()
-                    if retrieve_prob >= randomNum:
-                        # retrieve the analog and all it's tokens.
-                        analog = retrieve_analog_contents(analog)
-    else:
-        # retirieve using the old Luce choice axiom. 
-        if bias_retrieval_analogs:
-            # retrieve whole analogs.
-            # create a normalised retrieval score for each analog (i.e., analog.total_act/analog.num_units) and sum up all normalised retrieval scores for each analog in memory.
-            sum_normalised_analogs = 0.0
-            for analog in memory.analogs:
-                # make sure analog has a .total_act and .num_units > 0.
-                if analog.total_act > 0 and analog.num_units > 0:
-                    # calculate my num_units.
-                    analog.sum_num_units()
-                    # calculate analog.normalised_retrieval_act and add that to sum_normalised_analogs.
-                    analog.normalised_retrieval_act = analog.total_act/analog.num_units
-                    sum_normalised_analogs += analog.normalised_retrieval_act
-            # retrieve analogs using the Luce choice axiom.
-            for analog in memory.analogs:
-                # if analog has a .total_act and .num_units > 0, then calculate the retrieve_prob via Luce choice.
-                if analog.total_act > 0 and analog.num_units > 0:
-                    retrieve_prob = analog.normalised_retrieval_act/sum_normalised_analogs
-                    randomNum = random.random()
-                    if retrieve_prob >= randomNum:
-                        # retrieve the analog and all it's tokens.
-                        analog = retrieve_analog_contents(analog)
+    if bias_retrieval_analogs:
+        # retrieve whole analogs.
+        # create a normalised retrieval score for each analog (i.e., analog.total_act/analog.num_units) for analogs with a .total_act and .num_units > 0.
+        active = (index.total_acts > 0) & (index.num_units > 0)
+        if index.allowed is not None:
+            active &= index.allowed
+        normalised_acts = np.zeros(index.num_analogs)
+        normalised_acts[active] = index.total_acts[active]/index.num_units[active]
+        if use_relative_act:
+            # retrieve using relative activation of analogs.
+            retrieve_probs = relative_retrieval_probs(normalised_acts, active)
         else:
-            # get sum of all max_acts of all P, RB and P units in memorySet. 
-            P_sum, RB_sum, PO_sum = 0.0, 0.0, 0.0
-            for myP in memory.Ps:
-                P_sum += myP.max_act
-            for myRB in memory.RBs:
-                RB_sum += myRB.max_act
-            for myPO in memory.POs:
-                PO_sum += myPO.max_act
-            # for each P, RB, and PO in memorySet (i.e., NOT in driver, recipient, or newSet), retrieve it (and the proposition attached to it) into recipient according to the Luce choice rule. 
-            # P units.
-            for myP in memory.Ps:
-                # make sure that the P is in memory and that P_sum > 0 (so you don't get a divide by 0 error). 
-                if (myP.set == 'memory') and (myP_sum > 0):
-                    retrieve_prob = myP.max_act/P_sum
-                    randomNum = random.random()
-                    if retrieve_prob > randomNum:
-                        # retrieve P and all units attached into recipient.
-                        myP.set = 'recipient'
-                        # add the RBs.
-                        for myRB in myP.myRBs:
-                            myRB.set = 'recipient'
-                            # add the POs.
-                            myRB.myPred[0].set = 'recipient'
-                            # if it has an object add that object.
-                            if len(myRB.myObj) >= 1:
-                                myRB.myObj[0].set = 'recipient'
-                            else: # add it's child myP.
-                                myRB.myChildP[0].set = 'recipient'
-            # RB units.
-            for myRB in memory.RBs:
-                # make sure that the RB is in memory and that RB_sum > 0 (so you don't get a divide by 0 error). 
-                if (RB.set == 'memory') and (RB_sum > 0):
-                    retrieve_prob = myRB.max_act/RB_sum
-                    randomNum = random.random()
-                    if retrieve_prob > randomNum:
-                        # retrieve RB and all units attached into recipient.
-                        myRB.set = 'recipient'
-                        # add the Ps.
-                        for myP in myRB.myParentPs:
-                            myP.set = 'recipient'
-                        # add the POs.
-                        myRB.myPred[0].set = 'recipient'
-                        # if it has an object add that object.
-                        if len(RB.myObj) >= 1:
-                            myRB.myObj[0].set = 'recipient'
-                        else: # add it's child myP.
-                            myRB.myChildP[0].set = 'recipient'
-            # PO units.
-            for myPO in memory.POs:
-                # make sure that the PO is in memory and that PO_sum > 0 (so you don't get a divide by 0 error). 
-                if (myPO.set == 'memory') and (myPO_sum > 0):
-                    retrieve_prob = myPO.max_act/PO_sum
-                    randomNum = random.random()
-                    if retrieve_prob > randomNum:
-                        # retrieve PO and all units attached into recipient.
-                        myPO.set = 'recipient'
-                        memory.recipient.POs.append(myPO)
-                        # add the RBs.
-                        for myRB in myPO.myRBs:
-                            myRB.set = 'recipient'
-                            # add the RB's P unit if it exists.
-                            if len(myRB.myParentPs) > 0:
-                                myRB.myParentPs[0].set = 'recipient'
+            # retrieve using the old Luce choice axiom.
+            retrieve_probs = luce_retrieval_probs(normalised_acts, active)
+        for analog_id in np.flatnonzero(active):
+            memory.analogs[analog_id].normalised_retrieval_act = float(normalised_acts[analog_id])
+        # draw for the active analogs, and retrieve the analogs (and all their tokens) whose retrieve_prob >= the draw.
+        drawn = np.flatnonzero(active)
+        retrieved = drawn[retrieve_probs[drawn] >= draw_random_numbers(len(drawn))]
+        positions = [index.analog_order[index.analog_starts[analog_id]:index.analog_starts[analog_id+1]] for analog_id in retrieved]
+    else:
+        # for each P, RB, and PO in memorySet (i.e., NOT in driver, recipient, or newSet), retrieve it (and the proposition attached to it) into recipient according to the Luce choice rule applied within its token type (P, RB, or PO). 
+        # get sum of all max_acts of all P, RB and PO units (make sure the sum > 0 so you don't get a divide by 0 error).
+        type_sums = np.bincount(index.token_types, weights=index.max_acts, minlength=3)
+        eligible = index.in_memory & (type_sums[index.token_types] > 0)
+        if index.allowed is not None:
+            eligible &= index.allowed_tokens
+        retrieve_probs = np.zeros(len(index.tokens))
+        for token_type in range(3):
+            of_type = eligible & (index.token_types == token_type)
+            if use_relative_act:
+                # retrieve using relative activation of tokens.
+                retrieve_probs[of_type] = relative_retrieval_probs(index.max_acts[of_type], index.max_acts[of_type] > 0)
+            else:
+                # retrieve using the old Luce choice axiom.
+                retrieve_probs[of_type] = index.max_acts[of_type]/type_sums[token_type]
+        # go through the eligible tokens (Ps, then RBs, then POs), and for each token still in memory (i.e., not already brought into the recipient along with a token retrieved before it), draw, and retrieve the token if its retrieve_prob > the draw, along with the units attached to it.
+        if index.retrieve_closures is None:
+            index = make_retrieve_closures(index)
+        memory_code = dataTypes_DING.set_codes['memory']
+        positions = []
+        for position in np.flatnonzero(eligible):
+            if index.set_codes[position] == memory_code and retrieve_probs[position] > random.random():
+                closure = index.retrieve_closures[position]
+                index.set_codes[closure] = dataTypes_DING.set_codes['recipient']
+                positions.append(closure)
+                # retrieved POs are added to the recipient's POs.
+                if index.token_types[position] == 2:
+                    memory.recipient.POs.append(index.tokens[position])
+    if len(positions) > 0:
+        memory = retrieve_token_positions(memory, np.concatenate(positions))
     # done.
     return memory
 
-# funtion to retrieve all of the contents of an analog from memory into the recipient. 
-def retrieve_analog_contents(analog):
-    for myP in analog.myPs:
-        myP.set = 'recipient'
-    for myRB in analog.myRBs:
-            myRB.set = 'recipient'
-    for myPO in analog.myPOs:
-        myPO.set = 'recipient'
+# function to compute the old Luce choice retrieval probabilities: each active score divided by the sum of the active scores.
+def luce_retrieval_probs(scores, active):
+    retrieve_probs = np.zeros(len(scores))
+    if active.any():
+        retrieve_probs[active] = scores[active]/scores[active].sum()
+    # done.
+    return retrieve_probs
+
+# function to compute retrieval probabilities using relative activation. Active scores are transformed with a sigmoidal function with a threshold halfway between the average and the highest active score, and the transformed scores are divided by the sum of the (untransformed) active scores.
+def relative_retrieval_probs(scores, active):
+    retrieve_probs = np.zeros(len(scores))
+    if active.any():
+        threshold = (scores[active].max() + scores[active].mean())/2
+        retrieve_probs[active] = (1/(1 + np.exp(10*(scores[active]-threshold))))/scores[active].sum()
+    # done.
+    return retrieve_probs
+
+# function to work out, for each token in the retrieval index, the positions of the tokens retrieved along with it when it is retrieved on its own (i.e., when retrieval is not biased to analogs). A P brings its RBs and their POs (or child Ps), an RB brings its parent Ps and its POs (or child P), and a PO brings its RBs and their first parent P.
+def make_retrieve_closures(index):
+    positions = {}
+    for position, token in enumerate(index.tokens):
+        positions[id(token)] = position
+    index.retrieve_closures = []
+    for token in index.tokens:
+        closure = [token]
+        if token.my_type == 'P':
+            for myRB in token.myRBs:
+                closure.append(myRB)
+                closure.extend(myRB.myPred[:1])
+                if len(myRB.myObj) >= 1:
+                    closure.append(myRB.myObj[0])
+                else:
+                    closure.extend(myRB.myChildP[:1])
+        elif token.my_type == 'RB':
+            closure.extend(token.myParentPs)
+            closure.extend(token.myPred[:1])
+            if len(token.myObj) >= 1:
+                closure.append(token.myObj[0])
+            else:
+                closure.extend(token.myChildP[:1])
+        else:
+            for myRB in token.myRBs:
+                closure.append(myRB)
+                closure.extend(myRB.myParentPs[:1])
+        index.retrieve_closures.append(np.array([positions[id(unit)] for unit in closure if id(unit) in positions], dtype=int))
+    # done.
+    return index
+
+# function to move the tokens at the given positions in the retrieval index into the recipient. The set codes are updated in bulk, and then written back to the tokens.
+def retrieve_token_positions(memory, positions):
+    index = memory.retrieval_index
+    positions = np.unique(positions)
+    index.set_codes[positions] = dataTypes_DING.set_codes['recipient']
+    for position in positions:
+        index.tokens[position].set = 'recipient'
+    # tokens have moved out of memory, so refresh which indexed tokens are still in memory.
+    index.in_memory = index.set_codes == dataTypes_DING.set_codes['memory']
+    # done.
+    return memory
 
 # Take as input a set of nodes of a specific type (e.g., memory.POs, or memory.recipient.RBs) and return most active unit.
 def get_most_active_unit(tokens):
@@ -5,6 +5,8 @@
 import random, pdb
 
 # set parameters.
+# integer codes for the sets a token can be in (used by retrievalIndex.set_codes).
+set_codes = {'driver': 0, 'recipient': 1, 'memory': 2, 'newSet': 3}
 
 # Token units
 # noinspection PyPep8Naming
@@ -637,13 +639,99 @@ class Analog(object):
     
     # function to sum up the number of token units in the analog. Used for retrieval routine.
     def sum_num_units(self):
-        self.num_units = 0
-        for myP in self.myPs:
-            self.num_units += 1
-        for myRB in self.myRBs:
-            self.num_units += 1
-        for myPO in self.myPOs:
-            self.num_units += 1
+        self.num_units = len(self.myPs) + len(self.myRBs) + len(self.myPOs)
+
+
+# copy-on-write copies of analogs (used by basicRunDORA_DING.make_AM_copy() when running with exemplar memory). An analogCopy shares the connections of the analog it copies, and makes a tokenView of one of the original analog's tokens only when that token is first used. A tokenView starts with its own copy of the token's shared_fields and fresh activation state (act, inputs, inhibitor, etc.), all written into the view when it is made, so they are in vars() of the view like the fields of any other token (e.g., for state snapshots and result cache keys). Only its lists are made when first read: its connections to other tokens (mapped to the views of those tokens in the same copy), its Links to semantics, and fresh lists such as its mapping connections. Anything written to the view is kept to itself. So copying an analog costs nothing until a copied token is used.
+# the fields of each token type that connect it to other tokens. A tokenView maps these to the views of the connected tokens in its analogCopy.
+structural_fields = {'Group': ['myParentGroups', 'myChildGroups', 'myPs', 'myRBs'], 'P': ['myRBs', 'myParentRBs', 'myGroups'], 'RB': ['myParentPs', 'myPred', 'myObj', 'myChildP', 'myParentRB', 'myChildRB'], 'PO': ['myRBs', 'same_RB_POs']}
+# the fields a tokenView copies from the token it views when it is made.
+shared_fields = set(['name', 'my_type', 'predOrObj', 'myGroupLayer', 'inhibitorThreshold', 'semNormalization', 'max_sem_weight'])
+# the default value of every field of a freshly made token of each token class (filled in by get_token_defaults()).
+token_defaults = {}
+# the tokenView classes made for each token class (filled in by make_token_view()).
+token_view_classes = {}
+# the fields written into a new tokenView of each token class: the defaults that are not lists, i.e., the fresh activation state (filled in by make_token_view()).
+token_view_fields = {}
+
+# function to get the default fields of a freshly made token of token_class.
+def get_token_defaults(token_class):
+    if token_class not in token_defaults:
+        if issubclass(token_class, POUnit):
+            template = token_class(None, 'memory', None, False, None, 0)
+        elif issubclass(token_class, Groups):
+            template = token_class(None, None, False, None, None)
+        else:
+            template = token_class(None, 'memory', None, False, None)
+        token_defaults[token_class] = template.__dict__
+    return token_defaults[token_class]
+
+# function to make a view of token in analog_copy. The view is an instance of a subclass of the token's own class, so all the token's methods work on it.
+def make_token_view(token, analog_copy):
+    token_class = type(token)
+    if token_class not in token_view_classes:
+        token_view_classes[token_class] = type(token_class.__name__ + 'View', (tokenView, token_class), {})
+        token_view_fields[token_class] = dict((name, value) for name, value in get_token_defaults(token_class).items() if not isinstance(value, list) and name not in ('set', 'myanalog'))
+    view = object.__new__(token_view_classes[token_class])
+    view.__dict__.update(token_view_fields[token_class])
+    for name in shared_fields:
+        if name in token.__dict__:
+            view.__dict__[name] = token.__dict__[name]
+    view.__dict__['viewed_token'] = token
+    view.__dict__['analog_copy'] = analog_copy
+    # done.
+    return view
+
+class tokenView(object):
+    # fields not in the view yet (its lists, and its set and analog) are worked out from the viewed token when first read, and kept in the view from then on.
+    # NOTE: a structural field (connections to other tokens, or Links to semantics) is read from the original token when the view first reads it, not when the copy is made. So a change to the original analog after the copy is made (e.g., by learning in the same run) shows up in the copy for the fields it has not read yet.
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('viewed_token', 'analog_copy'):
+            raise AttributeError(name)
+        token = self.viewed_token
+        if name in structural_fields.get(token.my_type, ()):
+            value = [self.analog_copy.view_of(connected) for connected in getattr(token, name) if self.analog_copy.has_token(connected)]
+        elif name == 'mySemantics':
+            # the view gets its own Links to the same semantics with the same weights (see basicRunDORA_DING.copy_analog() for connecting them to the semantics).
+            value = [Link(self, link.myP, link.mySemantic, link.weight) for link in token.mySemantics]
+        elif name == 'set':
+            value = self.analog_copy.sets.get(id(token), 'memory')
+        elif name == 'myanalog':
+            value = self.analog_copy
+        else:
+            defaults = get_token_defaults(type(token))
+            if name not in defaults:
+                raise AttributeError(name)
+            value = defaults[name]
+            if isinstance(value, list):
+                value = list(value)
+        self.__dict__[name] = value
+        return value
+
+class analogCopy(Analog):
+    def __init__(self, original):
+        # NOTE: the token lists (myGroups, myPs, myRBs, myPOs) are made from the original analog when first read (see __getattr__()).
+        self.original = original
+        self.total_act = 0.0
+        self.num_units = None
+        self.normalised_retrieval_act = None
+        self.sets = {} # id(token) -> set of the copy of that token, for every token of the original analog in the copy. Tokens not in sets are not in the copy.
+        self.views = {} # id(token) -> tokenView of that token.
+    
+    def has_token(self, token):
+        return id(token) in self.sets
+    
+    def view_of(self, token):
+        if id(token) not in self.views:
+            self.views[id(token)] = make_token_view(token, self)
+        return self.views[id(token)]
+    
+    def __getattr__(self, name):
+        if name in ('myGroups', 'myPs', 'myRBs', 'myPOs'):
+            value = [self.view_of(token) for token in getattr(self.original, name) if self.has_token(token)]
+            self.__dict__[name] = value
+            return value
+        raise AttributeError(name)
 
 
 # class to house the driver units.
@@ -695,4 +783,59 @@ class memorySet(object):
         self.to_add_RBs = []
         self.to_add_POs = []
         self.analogs = []
+        self.retrieval_index = None # retrievalIndex over the tokens in memory (built at the start of retrieval).
+        self.sub_token_index = None # subTokenIndex of the memoized closures of tokens below each token (see basicRunDORA_DING.make_AM()).
+        self.semantic_LSH = None # retrievalPrefilter_DING.semanticLSH over the analogs (built by the retrieval prefilter).
+
+# class to house the dirty tracker used for incremental input updates (see basicRunDORA_DING.update_inputs_incremental()). units are the driver and recipient tokens and the semantics (and memory POs, if semantics take input from memory). For each pass (1: driver inputs, 2: semantic and recipient inputs), pass_groups and pass_readers give, for each unit, the groups of units (keys of group_members) and the other units in that pass whose inputs read the unit, and seen gives the state of each unit when the pass last recomputed inputs.
+class dirtyTracker(object):
+    def __init__(self):
+        self.units = []
+        self.group_members = {} # (set, token type) -> list of tokens (e.g., ('recipient', 'PO') -> memory.recipient.POs).
+        self.pass_groups = {1: [], 2: []}
+        self.pass_readers = {1: [], 2: []}
+        self.seen = {1: [], 2: []}
+        self.structure_key = None # the driver, recipient, semantics, and mapping connections the tracker was built for.
+        self.settings_key = None # the settings (phase_set, asDORA, etc.) inputs were last fully computed with.
+        self.steps_since_refresh = 0
+
+# class to house the memoized sub-token closures (every token below a token) used to move propositions into AM. closures maps id(token) to the list of tokens below it. structure_key records every token and its children when the closures were made, so the closures can be cleared when the structure of memory changes.
+class subTokenIndex(object):
+    def __init__(self):
+        self.closures = {}
+        self.structure_key = None
+
+# class to house the flat index over memory tokens used during retrieval. Tokens are all the Ps, RBs, and POs in memory (in that order), and analog_ids gives, for each token, the position in memory.analogs of the analog it belongs to (tokens with no analog in memory.analogs get the id num_analogs, which is dropped when summing). With this index the per-analog activation sums of the retrieval routine are a single np.bincount rather than a loop over every analog and every token in it.
+class retrievalIndex(object):
+    def __init__(self):
+        self.tokens = []
+        self.analog_ids = None # numpy array, one entry per token.
+        self.num_analogs = 0
+        self.num_units = None # numpy array, number of P, RB, and PO units in each analog (counted once when the index is built).
+        self.set_codes = None # numpy array, the set of each token as a code from set_codes (-1 for any other set).
+        self.in_memory = None # numpy bool array, True for tokens whose .set is 'memory'.
+        self.token_types = None # numpy array, 0 for Ps, 1 for RBs, 2 for POs.
+        self.retrieve_closures = None # for each token, numpy array of the positions of the tokens retrieved with it (built when first needed; see basicRunDORA_DING.make_retrieve_closures()).
+        self.total_acts = None # numpy array, summed activation of the memory tokens in each analog on the last retrieval step.
+        self.max_acts = None # numpy array, running max activation of each token (used when retrieval is not biased to analogs).
+        self.analog_order = None # token positions sorted by analog.
+        self.analog_starts = None # analog i's tokens are analog_order[analog_starts[i]:analog_starts[i+1]].
+        self.semantic_POs = {} # inverted index: semantic -> memory POs linked to it.
+        self.semantic_analogs = {} # inverted index: semantic -> ids of the analogs of the memory POs linked to it.
+        self.restrict = False # if True, retrieval only updates candidate analogs (analogs reachable from semantics that have been active).
+        self.candidate = None # numpy bool array, True for analogs that are retrieval candidates.
+        self.candidate_Ps = [] # memory tokens of the candidate analogs.
+        self.candidate_RBs = []
+        self.candidate_POs = []
+        self.candidate_positions = None # numpy array, positions in tokens of the candidate tokens.
+        self.seen_semantics = set() # semantics that have been active during this retrieval.
+        self.steps = 0 # number of retrieval steps run since the index was built.
+        self.allowed = None # numpy bool array, True for the analogs on the retrieval shortlist: only their tokens are updated and scored during retrieval (and, if restrict, only they may become candidates). None if all analogs are (see retrievalPrefilter_DING).
+        self.allowed_tokens = None # numpy bool array, True for tokens of analogs on the shortlist.
+        self.allowed_Ps = [] # memory tokens of the analogs on the shortlist.
+        self.allowed_RBs = []
+        self.allowed_POs = []
+        self.allowed_positions = None # numpy array, positions in tokens of the memory tokens of the analogs on the shortlist.
+        self.pooled = {} # running totals of the recipient activation that inhibits memory tokens (see basicRunDORA_DING.catch_up_memory_token()).
+        self.shards = None # retrievalShards_DING.retrievalShards the memory tokens are updated on during a threaded retrieval (False if they cannot be; see basicRunDORA_DING.retrieval_routine()).
 
@@ -0,0 +1,245 @@
+# jitEngine_DING.py
+
+# optional JIT backend for the array engine (see arrayEngine_DING). fused_step() runs a whole time-step (as basicRunDORA_DING.runDORA.time_step_activations(): P modes, driver inputs, inhibitors, semantic input, recipient inputs, and activations; and, for a Ding sim, setting the pattern's semantics, RB modes, and the local inhibitor as well) as one loop over a plan's arrays, so a time-step costs one call rather than one numpy call per set of units. fused_step() is compiled with Numba (with cache=True, so the compiled code is written next to this file and reused by later runs and worker processes rather than compiled again). If Numba is not installed, time_step() and ding_time_step() fall back to the numpy versions in arrayEngine_DING.
+
+# imports.
+import time
+import numpy as np
+import arrayEngine_DING
+try:
+    import numba
+    have_numba = True
+except ImportError:
+    have_numba = False
+
+# function to run a time-step on a plan's arrays (see the argument list built by get_kernel_arguments()). Returns 1 (having changed only the clamped semantics and the modes) if the modes are not the ones the plan is specialized for, or the plan can not run the network in them, and 0 once the time-step is done.
+def fused_step(act, inputs, net_input, mode, inhibitor_input, inhibitor_act, semantic_act, semantic_input, scalars,
+               ding, pattern_positions, mode_RBs, RB_down_sources, RB_down_targets, RB_up_sources, RB_up_targets, RB_has_parent,
+               count_by_RBs, mode_Ps, P_down_sources, P_down_targets, P_up_sources, P_up_targets,
+               mode_units, specialized_modes, specialization_ok,
+               edge_sources, edge_targets, edge_weights,
+               group_member_starts, group_members, group_target_starts, group_targets, group_weights,
+               mapping_sources, mapping_targets, mapping_flat_targets, mapping_weights, max_map,
+               old_inhibitor_terms, new_inhibitor_terms, inhibitor_units, inhibitor_thresholds, inhibitor_is_PO, asDORA,
+               driver_POs, driver_RBs, recipient_POs,
+               semantic_link_POs, semantic_link_semantics, semantic_link_weights,
+               bu_link_POs, bu_link_semantics, bu_link_weights, semNormalization, inferred,
+               newSet_units, newSet_makers,
+               gamma, delta, HebbBias, do_ding):
+    N = net_input.shape[0]
+    # for a Ding sim, set the act of the pattern's semantics to 1.0, and update the RB modes.
+    if ding:
+        for i in range(pattern_positions.shape[0]):
+            semantic_act[pattern_positions[i]] = 1.0
+        parent_input = np.zeros(mode_RBs.shape[0])
+        child_input = np.zeros(mode_RBs.shape[0])
+        for i in range(RB_down_sources.shape[0]):
+            parent_input[RB_down_targets[i]] += act[RB_down_sources[i]]
+        for i in range(RB_up_sources.shape[0]):
+            child_input[RB_up_targets[i]] += act[RB_up_sources[i]]
+        for i in range(mode_RBs.shape[0]):
+            if parent_input[i] > child_input[i]:
+                mode[mode_RBs[i]] = 1
+            elif act[mode_RBs[i]] > 0.0 and RB_has_parent[i]:
+                mode[mode_RBs[i]] = -1
+            else:
+                mode[mode_RBs[i]] = 0
+    # 4.3.2) P modes.
+    if count_by_RBs:
+        parent_input = np.zeros(mode_Ps.shape[0])
+        child_input = np.zeros(mode_Ps.shape[0])
+        for i in range(P_down_sources.shape[0]):
+            parent_input[P_down_targets[i]] += act[P_down_sources[i]]
+        for i in range(P_up_sources.shape[0]):
+            child_input[P_up_targets[i]] += act[P_up_sources[i]]
+        for i in range(mode_Ps.shape[0]):
+            if parent_input[i] > child_input[i]:
+                mode[mode_Ps[i]] = 1
+            elif parent_input[i] < child_input[i]:
+                mode[mode_Ps[i]] = -1
+            else:
+                mode[mode_Ps[i]] = 0
+    # make sure the plan is specialized for these modes.
+    if not specialization_ok:
+        return 1
+    for i in range(mode_units.shape[0]):
+        if mode[mode_units[i]] != specialized_modes[i]:
+            return 1
+    # 4.3.1, 4.3.3, 4.3.9) inputs that are sums over the acts of other tokens.
+    for i in range(inputs.shape[0]):
+        inputs[i] = 0.0
+    for i in range(edge_sources.shape[0]):
+        inputs[edge_targets[i]] += edge_weights[i]*act[edge_sources[i]]
+    for group in range(group_weights.shape[0]):
+        total = 0.0
+        for i in range(group_member_starts[group], group_member_starts[group+1]):
+            total += act[group_members[i]]
+        for i in range(group_target_starts[group], group_target_starts[group+1]):
+            inputs[group_targets[i]] += group_weights[group]*total
+    for i in range(mapping_sources.shape[0]):
+        driver_act = act[mapping_sources[i]]
+        inputs[mapping_flat_targets[i]] += (3*mapping_weights[i]*driver_act) - (max_map[mapping_targets[i]]*driver_act) - (max_map[mapping_sources[i]]*driver_act)
+    for i in range(old_inhibitor_terms.shape[0]):
+        inputs[2*N + old_inhibitor_terms[i]] -= inhibitor_act[old_inhibitor_terms[i]]*10
+    # 4.3.4-7) RB and PO inhibitors (PO inhibitors only if asDORA), and the local and global inhibitors.
+    for i in range(inhibitor_units.shape[0]):
+        unit = inhibitor_units[i]
+        inhibitor_input[unit] += act[unit]
+        if inhibitor_input[unit] >= inhibitor_thresholds[i] and (asDORA or not inhibitor_is_PO[i]):
+            inhibitor_act[unit] = 1.0
+    for i in range(driver_POs.shape[0]):
+        if inhibitor_act[driver_POs[i]] == 1.0:
+            scalars[0] = 1.0
+    for i in range(driver_RBs.shape[0]):
+        if inhibitor_act[driver_RBs[i]] == 1.0:
+            scalars[1] = 1.0
+    # 4.3.8) semantic input.
+    for i in range(semantic_input.shape[0]):
+        semantic_input[i] = 0.0
+    for i in range(semantic_link_POs.shape[0]):
+        semantic_input[semantic_link_semantics[i]] += act[semantic_link_POs[i]]*semantic_link_weights[i]
+    # 4.3.9) the rest of the recipient inputs.
+    for i in range(new_inhibitor_terms.shape[0]):
+        inputs[2*N + new_inhibitor_terms[i]] -= inhibitor_act[new_inhibitor_terms[i]]*10
+    bu_input = np.zeros(N)
+    for i in range(bu_link_POs.shape[0]):
+        bu_input[bu_link_POs[i]] += semantic_act[bu_link_semantics[i]]*bu_link_weights[i]
+    for i in range(recipient_POs.shape[0]):
+        unit = recipient_POs[i]
+        if inferred[unit]:
+            for component in range(4):
+                inputs[component*N + unit] = 0.0
+        else:
+            inputs[N + unit] = bu_input[unit]/semNormalization[unit]
+    # newSet tokens take their act from the tokens that made them.
+    for i in range(newSet_units.shape[0]):
+        if act[newSet_makers[i]] > .75:
+            act[newSet_units[i]] = 1.0
+        else:
+            act[newSet_units[i]] = 0.0
+    # 4.3.10) activations.
+    for unit in range(N):
+        net_input[unit] = inputs[unit] + inputs[N + unit] + inputs[2*N + unit] + (inputs[3*N + unit]*HebbBias)
+        act[unit] += gamma*net_input[unit]*(1.1 - act[unit]) - (delta*act[unit])
+        if act[unit] > 1.0:
+            act[unit] = 1.0
+        if act[unit] < 0.0:
+            act[unit] = 0.0
+    if not do_ding:
+        max_input = 0.0
+        for i in range(semantic_input.shape[0]):
+            if semantic_input[i] > max_input:
+                max_input = semantic_input[i]
+        scalars[3] = max_input
+        for i in range(semantic_input.shape[0]):
+            if max_input > 0:
+                semantic_act[i] = semantic_input[i]/max_input
+            else:
+                semantic_act[i] = 0.0
+    # for a Ding sim, fire the local inhibitor if necessary (clearing the driver and recipient POs and the semantics).
+    if ding and asDORA and scalars[0] >= 0.99 and scalars[2] == 0.0:
+        for POs in (driver_POs, recipient_POs):
+            for i in range(POs.shape[0]):
+                unit = POs[i]
+                act[unit] = 0.0
+                net_input[unit] = 0.0
+                for component in range(4):
+                    inputs[component*N + unit] = 0.0
+        for i in range(semantic_act.shape[0]):
+            semantic_act[i] = 0.0
+            semantic_input[i] = 0.0
+        scalars[2] = 1.0
+    # done.
+    return 0
+
+# compile fused_step() if Numba is installed.
+if have_numba:
+    fused_step = numba.njit(cache=True)(fused_step)
+
+# function to lay a plan's groups (see arrayEngine_DING.specialize_plan()) out as flat arrays for fused_step(), redoing it only when the plan has been specialized again since the last time.
+def get_group_arrays(plan):
+    if getattr(plan, 'group_arrays_modes', None) != plan.modes:
+        members = [np.asarray(group[0], dtype=np.int64) for group in plan.groups]
+        targets = [np.asarray(group[1], dtype=np.int64) for group in plan.groups]
+        plan.group_arrays = (np.concatenate([[0], np.cumsum([len(group) for group in members])]).astype(np.int64), np.concatenate(members + [np.zeros(0, dtype=np.int64)]), np.concatenate([[0], np.cumsum([len(group) for group in targets])]).astype(np.int64), np.concatenate(targets + [np.zeros(0, dtype=np.int64)]), np.array([group[2] for group in plan.groups], dtype=float))
+        plan.group_arrays_modes = plan.modes
+    return plan.group_arrays
+
+# function to build the arguments to fused_step() for a plan.
+def get_kernel_arguments(plan, scalars, ding, pattern_positions, count_by_RBs, gamma, delta, HebbBias, do_ding):
+    return ((plan.act, plan.inputs.reshape(-1), plan.net_input, plan.mode, plan.inhibitor_input, plan.inhibitor_act, plan.semantic_act, plan.semantic_input, scalars,
+             ding, pattern_positions, plan.mode_RBs, plan.RB_down_sources, plan.RB_down_targets, plan.RB_up_sources, plan.RB_up_targets, plan.RB_has_parent,
+             count_by_RBs, plan.mode_Ps, plan.P_down_sources, plan.P_down_targets, plan.P_up_sources, plan.P_up_targets,
+             plan.mode_units, plan.specialized_modes, plan.mode_problem is None,
+             plan.edge_sources, plan.edge_targets, plan.edge_weights) + get_group_arrays(plan) +
+            (plan.mapping_sources, plan.mapping_targets, plan.mapping_flat_targets, plan.mapping_weights, plan.max_map,
+             plan.old_inhibitor_terms, plan.new_inhibitor_terms, plan.inhibitor_units, plan.inhibitor_thresholds, plan.inhibitor_is_PO, plan.settings[0],
+             plan.driver_POs, plan.driver_RBs, plan.recipient_POs,
+             plan.semantic_link_POs, plan.semantic_link_semantics, plan.semantic_link_weights,
+             plan.bu_link_POs, plan.bu_link_semantics, plan.bu_link_weights, plan.semNormalization, plan.inferred,
+             plan.newSet_units, plan.newSet_makers,
+             gamma, delta, HebbBias, do_ding))
+
+# function to run fused_step() on a plan until it has done the time-step, specializing the plan for new modes as needed. Returns False if the plan can not run the network in its current modes.
+def run_fused_step(plan, ding, pattern_positions, count_by_RBs, gamma, delta, HebbBias, do_ding):
+    if not plan.supported:
+        return False
+    if plan.specialized_modes is None and not arrayEngine_DING.specialize_plan(plan):
+        return False
+    plan.inputs = np.ascontiguousarray(plan.inputs)
+    scalars = np.array([plan.local_inhibitor_act, plan.global_inhibitor_act, float(plan.local_inhibitor_fired), plan.max_sem_input])
+    while fused_step(*get_kernel_arguments(plan, scalars, ding, pattern_positions, bool(count_by_RBs), gamma, delta, HebbBias, do_ding)) != 0:
+        if not arrayEngine_DING.specialize_plan(plan):
+            return False
+    plan.local_inhibitor_act, plan.global_inhibitor_act, plan.local_inhibitor_fired, plan.max_sem_input = scalars[0], scalars[1], scalars[2] == 1.0, scalars[3]
+    # done.
+    return True
+
+# function to run a time-step on a plan (as arrayEngine_DING.time_step()).
+def time_step(plan, gamma, delta, HebbBias, count_by_RBs, do_ding=False):
+    if not have_numba:
+        return arrayEngine_DING.time_step(plan, gamma, delta, HebbBias, count_by_RBs, do_ding)
+    return run_fused_step(plan, False, np.zeros(0, dtype=np.int64), count_by_RBs, gamma, delta, HebbBias, do_ding)
+
+# function to run a time-step of a Ding sim on a plan (as arrayEngine_DING.ding_time_step()).
+def ding_time_step(plan, pattern_positions, gamma, delta, HebbBias):
+    if not have_numba:
+        return arrayEngine_DING.ding_time_step(plan, pattern_positions, gamma, delta, HebbBias)
+    return run_fused_step(plan, True, np.asarray(pattern_positions, dtype=np.int64), True, gamma, delta, HebbBias, True)
+
+# function to benchmark the engines on a Ding sim. Takes a function that returns a freshly built memory (the same network each call), the run parameters, the firing order as a list of lists of semantic names, and the engines to compare ('object', 'array', and 'jit'; the first run of the 'jit' engine is not timed, so the time does not include compiling). Reports the time do_ding_ops() takes with each engine, its speedup over the object engine, and the largest difference between its traces and those of the object engine. Returns a list of dicts (one per engine).
+def benchmark_engines(make_memory, parameters, firing_order_names, engines=('object', 'array', 'jit'), repeats=3):
+    import basicRunDORA_DING
+    # function to run the Ding sim with an engine, returning the time do_ding_ops() took and the units_dict.
+    def run_ding(engine):
+        engine_parameters = dict(parameters)
+        engine_parameters['engine'], engine_parameters['doGUI'] = engine, False
+        network = basicRunDORA_DING.runDORA(make_memory(), engine_parameters)
+        firing_order = [[semantic for semantic in network.memory.semantics if semantic.name in names] for names in firing_order_names]
+        network.initialize_run(mapping=False)
+        network.initialize_network_state()
+        start = time.time()
+        units_dict = network.do_ding_ops(firing_order)
+        return time.time() - start, units_dict
+    if 'jit' in engines and have_numba:
+        run_ding('jit')
+    elif 'jit' in engines:
+        print 'Numba is not installed, so the jit engine runs the numpy array engine.'
+    object_time, object_units = None, None
+    report = []
+    for engine in engines:
+        times = []
+        for repeat in range(repeats):
+            run_time, units_dict = run_ding(engine)
+            times.append(run_time)
+        run_time = min(times)
+        if object_time is None and engine == 'object':
+            object_time, object_units = run_time, units_dict
+        if object_units is None:
+            object_time, object_units = run_ding('object')
+        divergence = max([max([abs(act1 - act2) for act1, act2 in zip(units_dict[name], object_units[name])] + [0.0]) for name in units_dict] + [0.0])
+        result = {'engine': engine, 'time': run_time, 'speedup': object_time/max(run_time, 1e-9), 'max_divergence': divergence}
+        print '%s engine: %.4fs (%.1fx the object engine), largest difference from the object engine %.3g' % (engine, run_time, result['speedup'], divergence)
+        report.append(result)
+    # done.
+    return report
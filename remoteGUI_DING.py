@@ -0,0 +1,171 @@
+# remoteGUI_DING.py
+
+# GUI that runs in its own process, so drawing never holds up the sim. The sim writes the activations of the units on the screen into a ring buffer of frames in shared memory (without waiting on the GUI), and the GUI process draws the most recent frame whenever it is ready for one, dropping any frames it fell behind on. Keypresses in the GUI window (p to pause and unpause, d to enter the debugger) are sent back to the sim over a control channel, which the sim checks without blocking on each time-step.
+# The layout (which units are on the screen, and where) is made in the sim process with DORA_GUI_ding.make_GUI_information() and sent to the GUI process over the control channel, and is sent again whenever units are added to the driver, recipient, or newSet. Each frame is tagged with the layout it was written under, so the GUI never draws a frame against the wrong layout.
+
+# imports.
+import numpy as np
+from multiprocessing import Pipe, Process
+from multiprocessing.sharedctypes import RawArray, RawValue
+import DORA_GUI_ding
+
+# each frame starts with a header of: the layout generation the frame was written under, the number of units in the frame, and the time-step it was written on.
+frame_header = 3
+
+class remoteGUI(object):
+    def __init__(self, screen_width, screen_height, num_slots, max_units, min_node_width=0):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.min_node_width = min_node_width # see DORA_GUI_ding.make_GUI_information().
+        self.num_slots = num_slots # number of frames in the ring buffer.
+        self.max_units = max_units # most units a frame can hold (units past this are not shown).
+        self.ring = RawArray('d', num_slots*(frame_header+max_units)) # the ring buffer of frames.
+        self.frames = np.frombuffer(self.ring, dtype=np.float64).reshape(num_slots, frame_header+max_units)
+        self.frame_count = RawValue('l', 0) # number of frames written so far (frame n is in slot n % num_slots).
+        self.connection = None # the sim end of the control channel.
+        self.process = None
+        self.generation = 0 # layout generation.
+        self.units = [] # the units on the screen, in frame order.
+        self.layout_key = None
+        self.paused = False
+        self.closed = False
+
+# function to start the GUI process. num_slots is the number of frames in the ring buffer, max_units the most units a frame can hold, max_fps the most frames per second the GUI process draws, and min_node_width is passed on to DORA_GUI_ding.make_GUI_information(). Returns a remoteGUI.
+def start_remote_GUI(screen_width, screen_height, num_slots=64, max_units=4096, max_fps=60, min_node_width=0):
+    GUI = remoteGUI(screen_width, screen_height, num_slots, max_units, min_node_width)
+    GUI.connection, GUI_connection = Pipe()
+    GUI.process = Process(target=run_GUI_process, args=(GUI_connection, GUI.ring, GUI.frame_count, num_slots, max_units, screen_width, screen_height, max_fps))
+    GUI.process.daemon = True
+    GUI.process.start()
+    # done.
+    return GUI
+
+# function to make the layout for the current network and send it to the GUI process.
+def set_remote_layout(GUI, memory):
+    units, layout = DORA_GUI_ding.get_GUI_layout(GUI.screen_width, GUI.screen_height, memory, GUI.min_node_width)
+    if len(units) > GUI.max_units:
+        print 'remote GUI: only the first %d of %d units are shown.' % (GUI.max_units, len(units))
+        units, layout = units[:GUI.max_units], layout[:GUI.max_units]
+    GUI.generation += 1
+    GUI.units = units
+    GUI.layout_key = DORA_GUI_ding.get_layout_key(memory)
+    if not GUI.closed:
+        GUI.connection.send(('layout', GUI.generation, layout))
+    # done.
+    return memory
+
+# function to write the current activations of the units on the screen to the next frame in the ring buffer. Never waits on the GUI process: if it has not read the frames already there, they are written over.
+def publish_frame(GUI, memory, time_step):
+    if GUI.closed:
+        return
+    if DORA_GUI_ding.get_layout_key(memory) != GUI.layout_key:
+        memory = set_remote_layout(GUI, memory)
+    count = GUI.frame_count.value
+    frame = GUI.frames[count % GUI.num_slots]
+    num_units = len(GUI.units)
+    frame[0] = GUI.generation
+    frame[1] = num_units
+    frame[2] = time_step
+    frame[frame_header:frame_header+num_units] = [unit.act for unit in GUI.units]
+    # the count is moved on only once the frame is written, so the GUI process never reads a partly written frame as the newest one.
+    GUI.frame_count.value = count + 1
+
+# function to check the control channel for messages from the GUI process. While the GUI is paused, waits (on the channel, so the sim is not spinning) until it is unpaused. Returns True if the user asked to enter the debugger.
+def poll_control(GUI):
+    debug = False
+    if GUI.closed:
+        return debug
+    while GUI.paused or GUI.connection.poll():
+        try:
+            message = GUI.connection.recv()
+        except EOFError:
+            message = ('closed',)
+        if message[0] == 'pause':
+            GUI.paused = True
+        elif message[0] == 'resume':
+            GUI.paused = False
+        elif message[0] == 'debug':
+            debug = True
+        elif message[0] == 'closed':
+            # the window was closed, so stop sending frames (the sim keeps running).
+            GUI.closed = True
+            GUI.paused = False
+            break
+    # done.
+    return debug
+
+# function to close the GUI process. Returns a dict of the number of frames written by the sim, and the number the GUI process drew and dropped (or None for those if the GUI was already closed).
+def close_remote_GUI(GUI):
+    report = {'written': GUI.frame_count.value, 'drawn': None, 'dropped': None}
+    if not GUI.closed:
+        GUI.connection.send(('close',))
+        while True:
+            try:
+                message = GUI.connection.recv()
+            except EOFError:
+                break
+            if message[0] == 'stats':
+                report['drawn'], report['dropped'] = message[1], message[2]
+                break
+        GUI.closed = True
+    GUI.process.join()
+    # done.
+    return report
+
+# the GUI process: draws the newest frame in the ring buffer (under the current layout) up to max_fps times a second, and sends keypresses back to the sim.
+def run_GUI_process(connection, ring, frame_count, num_slots, max_units, screen_width, screen_height, max_fps):
+    import pygame
+    from pygame.locals import QUIT, KEYDOWN, K_p, K_d
+    frames = np.frombuffer(ring, dtype=np.float64).reshape(num_slots, frame_header+max_units)
+    screen = DORA_GUI_ding.make_screen(screen_width, screen_height)
+    GUI_information = DORA_GUI_ding.GUI_information_class()
+    generation = 0
+    units = []
+    last_count = 0
+    drawn = 0
+    dropped = 0
+    paused = False
+    clock = pygame.time.Clock()
+    running = True
+    while running:
+        # keypresses.
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                connection.send(('closed',))
+                running = False
+            elif event.type == KEYDOWN and event.key == K_p:
+                paused = not paused
+                if paused:
+                    connection.send(('pause',))
+                else:
+                    connection.send(('resume',))
+            elif event.type == KEYDOWN and event.key == K_d:
+                connection.send(('debug',))
+        # messages from the sim.
+        while running and connection.poll():
+            message = connection.recv()
+            if message[0] == 'layout':
+                generation = message[1]
+                GUI_information, units = DORA_GUI_ding.draw_layout(screen, screen_width, screen_height, message[2])
+            elif message[0] == 'close':
+                connection.send(('stats', drawn, dropped))
+                running = False
+        if not running:
+            break
+        # the newest frame.
+        count = frame_count.value
+        if count > last_count:
+            frame = frames[(count-1) % num_slots].copy()
+            # the frame can have been written over while it was copied only if the sim has since gone all the way round the ring buffer.
+            if frame_count.value - count < num_slots-1 and int(frame[0]) == generation:
+                acts = frame[frame_header:frame_header+int(frame[1])]
+                for unit, act in zip(units, acts):
+                    unit.act = act
+                DORA_GUI_ding.update_node_acts(screen, GUI_information)
+                drawn += 1
+                dropped += count - last_count - 1
+            else:
+                dropped += count - last_count
+            last_count = count
+        clock.tick(max_fps)
+    pygame.display.quit()
@@ -0,0 +1,141 @@
+# resultCache_DING.py
+
+# content-addressed on-disk cache of the results of runDORA.do_ding_ops() and do_retrieval(). A run is keyed by a hash of everything its result depends on: the network (its units, their connections, and their current state), the run settings (the plain-valued fields of the runDORA object, i.e., the parameters it was made with and any changed since), the firing order, and, for runs that draw random numbers (do_retrieval()), the state of the random number generators (so runs made after seeding the generators the same way share a key). Each entry holds the result along with the state the run left the network (and the random number generators) in, so a hit leaves the network just as running it would have. Entries are files in a directory, and the least recently used entries are removed when the directory holds more than max_bytes.
+# Sweep runners can use get_cache_key() to find runs that are the same before scheduling them.
+
+# imports.
+import os, hashlib, numbers, random, tempfile
+import cPickle
+import numpy as np
+
+class resultCache(object):
+    def __init__(self, path, max_bytes=1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    # function to get the file an entry is kept in.
+    def entry_path(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    # function to look up a run. On a hit, the network (and the random number generators) are put in the state the run left them in, and the entry is marked as recently used. Returns (True, result) on a hit, and (False, None) on a miss.
+    def load(self, network, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as entry:
+                result, record = cPickle.load(entry)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return False, None
+        os.utime(path, None)
+        restore_network_record(network, record)
+        # done.
+        return True, result
+
+    # function to store the result of a run (along with the state the run left the network in, and, if random_state, the state of the random number generators), and remove least recently used entries if the cache is over max_bytes.
+    def store(self, network, key, result, random_state=True):
+        # write to a temporary file and rename it, so a reader never sees a partly written entry.
+        handle, temporary_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as entry:
+            cPickle.dump((result, get_network_record(network, random_state)), entry, 2)
+        os.rename(temporary_path, self.entry_path(key))
+        self.evict(keep=key)
+
+    # function to remove least recently used entries until the cache holds at most max_bytes (the entry keep is never removed).
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == str(keep) + '.pkl':
+                continue
+            os.remove(os.path.join(self.path, name))
+            total -= size
+
+# function to get the units whose structure and state a run depends on (and leaves behind): the units, links, mapping connections, and inhibitors of a state snapshot (see basicRunDORA_DING.get_state_units()), and the analogs.
+def get_record_units(memory):
+    import basicRunDORA_DING
+    # done.
+    return basicRunDORA_DING.get_state_units(memory) + memory.analogs
+
+# function to get the positions of the units in the driver, recipient, and newSet.
+def get_set_positions(memory, unit_positions):
+    set_positions = []
+    for mySet in (memory.driver, memory.recipient, memory.newSet):
+        for units in (mySet.Groups, mySet.Ps, mySet.RBs, mySet.POs):
+            set_positions.append([unit_positions[id(unit)] for unit in units])
+    # done.
+    return set_positions
+
+# function to describe a value for the cache key: numbers and strings by value, units by position, and lists of them element by element.
+def describe_value(value, unit_positions):
+    if isinstance(value, (numbers.Number, basestring)) or value is None:
+        return repr(value)
+    if id(value) in unit_positions:
+        return '@%d' % unit_positions[id(value)]
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(describe_value(item, unit_positions) for item in value) + ']'
+    # done.
+    return type(value).__name__
+
+# function to compute the cache key of a run: operation is the name of the run function ('do_ding_ops' or 'do_retrieval'), firing_order is the firing order of a do_ding_ops() run (a list of lists of semantics), and random_state is True if the run draws random numbers. Returns a hex string.
+def get_cache_key(network, operation, firing_order=None, random_state=True):
+    memory = network.memory
+    units = get_record_units(memory)
+    unit_positions = dict((id(unit), position) for position, unit in enumerate(units))
+    key = hashlib.sha1()
+    key.update(operation)
+    # the network: every unit's fields (its state, and its connections to other units), and the makeup of the driver, recipient, and newSet.
+    for unit in units:
+        key.update(type(unit).__name__)
+        for name, value in sorted(vars(unit).items()):
+            key.update('%s=%s;' % (name, describe_value(value, unit_positions)))
+    key.update(repr(get_set_positions(memory, unit_positions)))
+    # the run settings.
+    for name, value in sorted(vars(network).items()):
+        if isinstance(value, (numbers.Number, basestring)) or value is None:
+            key.update('%s=%r;' % (name, value))
+    # the firing order.
+    if firing_order is not None:
+        key.update(describe_value(firing_order, unit_positions))
+    # the random number generators.
+    if random_state:
+        key.update(repr(random.getstate()))
+        np_state = np.random.get_state()
+        key.update(repr(np_state[0]) + np_state[1].tostring() + repr(np_state[2:]))
+    # done.
+    return key.hexdigest()
+
+# function to record the state a run leaves the network in: the plain-valued fields (numbers, strings, and None) of every unit, the makeup of the driver, recipient, and newSet, the run flags that carry across time-steps, and, if random_state, the state of the random number generators.
+def get_network_record(network, random_state=True):
+    memory = network.memory
+    units = get_record_units(memory)
+    unit_positions = dict((id(unit), position) for position, unit in enumerate(units))
+    unit_states = [dict((name, value) for name, value in vars(unit).items() if isinstance(value, (numbers.Number, basestring)) or value is None) for unit in units]
+    random_states = None
+    if random_state:
+        random_states = (random.getstate(), np.random.get_state())
+    # done.
+    return (unit_states, get_set_positions(memory, unit_positions), network.local_inhibitor_fired, getattr(network, 'inferred_new_P', False), random_states)
+
+# function to put the network in the state recorded by get_network_record().
+def restore_network_record(network, record):
+    memory = network.memory
+    unit_states, set_positions, network.local_inhibitor_fired, network.inferred_new_P, random_states = record
+    units = get_record_units(memory)
+    for unit, unit_state in zip(units, unit_states):
+        unit.__dict__.update(unit_state)
+    set_lists = iter(set_positions)
+    for mySet in (memory.driver, memory.recipient, memory.newSet):
+        mySet.Groups, mySet.Ps, mySet.RBs, mySet.POs = [[units[position] for position in next(set_lists)] for set_type in range(4)]
+    if random_states is not None:
+        random.setstate(random_states[0])
+        np.random.set_state(random_states[1])
+    # the indexes and trackers built over the network no longer match it.
+    memory.retrieval_index = None
+    network.dirty_tracker = None
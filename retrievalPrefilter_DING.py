@@ -0,0 +1,203 @@
+# retrievalPrefilter_DING.py
+
+# approximate similarity prefilter for retrieval. Each analog in memory is represented as a sparse bag of the semantics of its POs (weighted by Link.weight), and the bags are hashed with random-projection LSH (sign of the projection onto random hyperplanes, several tables of several bits each). Before retrieval, the driver's bag is hashed, the analogs in matching buckets are re-ranked by their exact cosine similarity to the driver, and only the top K analogs are passed on to the full retrieval dynamics (see basicRunDORA_DING.retrieval_routine()).
+
+# imports.
+import random, time
+import numpy as np
+
+# class to hold the LSH index over the analogs in memory.
+class semanticLSH(object):
+    def __init__(self):
+        self.analogs = [] # the analogs indexed (memory.analogs when the index was built).
+        self.semantic_columns = {} # semantic -> column in the bags.
+        self.indptr = None # analog i's bag is indices[indptr[i]:indptr[i+1]], data[indptr[i]:indptr[i+1]] (CSR layout).
+        self.indices = None
+        self.data = None
+        self.norms = None # numpy array, the length of each analog's bag.
+        self.in_memory = None # numpy bool array, True for analogs with POs in memory (only these can be shortlisted).
+        self.num_tables = 0
+        self.num_bits = 0
+        self.projections = None # numpy array (num_semantics x num_tables*num_bits) of random hyperplanes.
+        self.tables = [] # for each table, a dict from bucket key to numpy array of analog ids.
+
+# function to make the sparse semantic bag of each analog (a dict from semantic to summed link weight over the POs of the analog in memory).
+def make_analog_bags(memory):
+    bags, in_memory = [], []
+    for analog in memory.analogs:
+        bag = {}
+        has_memory_POs = False
+        for myPO in analog.myPOs:
+            if myPO.set == 'memory':
+                has_memory_POs = True
+                for link in myPO.mySemantics:
+                    bag[link.mySemantic] = bag.get(link.mySemantic, 0.0) + link.weight
+        bags.append(bag)
+        in_memory.append(has_memory_POs)
+    # done.
+    return bags, np.array(in_memory, dtype=bool)
+
+# function to make the semantic bag of the current driver (all driver POs).
+def make_driver_bag(memory):
+    bag = {}
+    for myPO in memory.driver.POs:
+        for link in myPO.mySemantics:
+            bag[link.mySemantic] = bag.get(link.mySemantic, 0.0) + link.weight
+    # done.
+    return bag
+
+# function to compute the LSH signature bits of rows of a CSR matrix (one row of num_tables*num_bits booleans per bag).
+def sign_bits(indptr, indices, data, projections):
+    num_rows = len(indptr)-1
+    products = np.zeros((num_rows, projections.shape[1]))
+    nonempty = np.flatnonzero(np.diff(indptr) > 0)
+    if len(nonempty) > 0:
+        contributions = data[:, None]*projections[indices]
+        products[nonempty] = np.add.reduceat(contributions, indptr[nonempty], axis=0)
+    # done.
+    return products > 0
+
+# function to turn signature bits into one integer bucket key per table.
+def bucket_keys(bits, num_tables, num_bits):
+    powers = 1 << np.arange(num_bits)
+    # done.
+    return (bits.reshape(len(bits), num_tables, num_bits)*powers).sum(axis=2)
+
+# function to build the LSH index over memory.analogs. Must be rebuilt if analogs are added to memory or their semantics change.
+def make_semantic_LSH(memory, num_tables=8, num_bits=12, seed=0):
+    lsh = semanticLSH()
+    lsh.analogs = list(memory.analogs)
+    bags, lsh.in_memory = make_analog_bags(memory)
+    # give each semantic a column.
+    for semantic in memory.semantics:
+        lsh.semantic_columns[semantic] = len(lsh.semantic_columns)
+    for bag in bags:
+        for semantic in bag:
+            if semantic not in lsh.semantic_columns:
+                lsh.semantic_columns[semantic] = len(lsh.semantic_columns)
+    # lay the bags out in CSR form.
+    lengths = np.array([len(bag) for bag in bags], dtype=int)
+    lsh.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+    lsh.indices = np.array([lsh.semantic_columns[semantic] for bag in bags for semantic in bag], dtype=int)
+    lsh.data = np.array([weight for bag in bags for weight in bag.values()], dtype=float)
+    rows = np.repeat(np.arange(len(bags)), lengths)
+    lsh.norms = np.sqrt(np.bincount(rows, weights=lsh.data**2, minlength=len(bags)))
+    # draw the random hyperplanes and hash every analog in memory into each table.
+    lsh.num_tables, lsh.num_bits = num_tables, num_bits
+    lsh.projections = np.random.RandomState(seed).standard_normal((len(lsh.semantic_columns), num_tables*num_bits))
+    keys = bucket_keys(sign_bits(lsh.indptr, lsh.indices, lsh.data, lsh.projections), num_tables, num_bits)
+    memory_analogs = np.flatnonzero(lsh.in_memory & (lsh.norms > 0))
+    lsh.tables = []
+    for table in range(num_tables):
+        buckets = {}
+        order = memory_analogs[np.argsort(keys[memory_analogs, table], kind='mergesort')]
+        if len(order) > 0:
+            sorted_keys = keys[order, table]
+            starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+            for start, end in zip(starts, np.append(starts[1:], len(order))):
+                buckets[int(sorted_keys[start])] = order[start:end]
+        lsh.tables.append(buckets)
+    # done.
+    return lsh
+
+# function to compute the exact cosine similarity between a query bag and the bags of the given analogs.
+def cosine_similarity(lsh, query, analog_ids):
+    dense = np.zeros(len(lsh.semantic_columns))
+    for semantic, weight in query.items():
+        if semantic in lsh.semantic_columns:
+            dense[lsh.semantic_columns[semantic]] += weight
+    query_norm = np.sqrt((dense**2).sum())
+    starts, ends = lsh.indptr[analog_ids], lsh.indptr[analog_ids+1]
+    lengths = ends - starts
+    positions = np.repeat(ends - np.cumsum(lengths), lengths) + np.arange(lengths.sum())
+    dots = np.bincount(np.repeat(np.arange(len(analog_ids)), lengths), weights=lsh.data[positions]*dense[lsh.indices[positions]], minlength=len(analog_ids))
+    norms = lsh.norms[analog_ids]*query_norm
+    # done.
+    return np.where(norms > 0, dots/np.where(norms > 0, norms, 1.0), 0.0)
+
+# function to shortlist the K analogs in memory most similar to the query bag. Candidates are the analogs sharing a bucket with the query in any table; if there are fewer than K, the buckets one bit away from the query's are probed as well. Candidates are ranked by exact cosine similarity. Returns a numpy array of analog ids (positions in lsh.analogs), most similar first.
+def shortlist_analogs(lsh, query, K):
+    empty = np.zeros(0, dtype=int)
+    if len(query) == 0 or len(lsh.tables) == 0:
+        return empty
+    indices = np.array([lsh.semantic_columns[semantic] for semantic in query if semantic in lsh.semantic_columns], dtype=int)
+    data = np.array([query[semantic] for semantic in query if semantic in lsh.semantic_columns], dtype=float)
+    bits = sign_bits(np.array([0, len(indices)]), indices, data, lsh.projections)
+    keys = bucket_keys(bits, lsh.num_tables, lsh.num_bits)[0]
+    candidates = [lsh.tables[table].get(int(keys[table]), empty) for table in range(lsh.num_tables)]
+    candidates = np.unique(np.concatenate(candidates))
+    if len(candidates) < K:
+        # multi-probe the buckets at Hamming distance 1.
+        probes = [candidates]
+        for table in range(lsh.num_tables):
+            for bit in range(lsh.num_bits):
+                probes.append(lsh.tables[table].get(int(keys[table]) ^ (1 << bit), empty))
+        candidates = np.unique(np.concatenate(probes))
+    if len(candidates) == 0:
+        return empty
+    similarity = cosine_similarity(lsh, query, candidates)
+    keep = similarity > 0
+    candidates, similarity = candidates[keep], similarity[keep]
+    # done.
+    return candidates[np.argsort(-similarity, kind='mergesort')[:K]]
+
+# function to shortlist the top K analogs by exhaustive cosine similarity (the reference the LSH shortlist is measured against).
+def exhaustive_shortlist(lsh, query, K):
+    analog_ids = np.flatnonzero(lsh.in_memory)
+    similarity = cosine_similarity(lsh, query, analog_ids)
+    keep = similarity > 0
+    analog_ids, similarity = analog_ids[keep], similarity[keep]
+    # done.
+    return analog_ids[np.argsort(-similarity, kind='mergesort')[:K]]
+
+# function to return the shortlisted analogs for the current driver as a numpy bool array over memory.analogs, (re)building the LSH index stored in memory.semantic_LSH if memory.analogs has changed.
+def prefilter_analogs(memory, K, num_tables=8, num_bits=12, seed=0):
+    lsh = memory.semantic_LSH
+    if lsh is None or lsh.analogs != memory.analogs:
+        lsh = make_semantic_LSH(memory, num_tables, num_bits, seed)
+        memory.semantic_LSH = lsh
+    allowed = np.zeros(len(memory.analogs), dtype=bool)
+    allowed[shortlist_analogs(lsh, make_driver_bag(memory), K)] = True
+    # done.
+    return allowed
+
+# function to report how well the prefilter does. Takes a function that returns a freshly built memory (the same network each call), the run parameters, and the values of K to test. For each K reports recall@K of the LSH shortlist against the exhaustive cosine top-K, the recall of the analogs retrieved by exhaustive retrieval (i.e., with no prefilter) that made the shortlist, and the speedup of do_retrieval(). Returns a list of dicts (one per K).
+def evaluate_prefilter(make_memory, parameters, K_values, num_tables=8, num_bits=12, seed=0):
+    import basicRunDORA_DING
+    # index a fresh copy of the network (with its driver and recipient set up) to score the shortlists against.
+    network = basicRunDORA_DING.runDORA(make_memory(), parameters)
+    network.initialize_run(mapping=False)
+    memory = network.memory
+    lsh = make_semantic_LSH(memory, num_tables, num_bits, seed)
+    query = make_driver_bag(memory)
+    # exhaustive retrieval (an analog is retrieved if it started in memory and ended up in the recipient).
+    full_parameters = dict(parameters)
+    full_parameters['retrieval_shortlist'] = 0
+    random.seed(seed)
+    network = basicRunDORA_DING.runDORA(make_memory(), full_parameters)
+    start = time.time()
+    network.do_retrieval()
+    full_time = time.time() - start
+    retrieved = set(position for position, analog in enumerate(network.memory.analogs) if lsh.in_memory[position] and len(analog.myPOs) > 0 and analog.myPOs[0].set == 'recipient')
+    report = []
+    for K in K_values:
+        exact = set(exhaustive_shortlist(lsh, query, K))
+        approximate = set(shortlist_analogs(lsh, query, K))
+        # retrieval with the prefilter.
+        shortlist_parameters = dict(parameters)
+        shortlist_parameters['retrieval_shortlist'] = K
+        shortlist_parameters['LSH_tables'], shortlist_parameters['LSH_bits'], shortlist_parameters['LSH_seed'] = num_tables, num_bits, seed
+        random.seed(seed)
+        network = basicRunDORA_DING.runDORA(make_memory(), shortlist_parameters)
+        start = time.time()
+        network.do_retrieval()
+        shortlist_time = time.time() - start
+        result = {'K': K, 'recall_at_K': len(exact & approximate)/float(max(len(exact), 1)), 'retrieved_recall': None, 'full_time': full_time, 'shortlist_time': shortlist_time, 'speedup': full_time/max(shortlist_time, 1e-9)}
+        retrieved_recall = 'n/a (nothing retrieved)'
+        if len(retrieved) > 0:
+            result['retrieved_recall'] = len(retrieved & approximate)/float(len(retrieved))
+            retrieved_recall = '%.3f' % result['retrieved_recall']
+        print 'K = %d: recall@K = %.3f, recall of retrieved analogs = %s, retrieval time %.3fs vs %.3fs (%.1fx speedup)' % (K, result['recall_at_K'], retrieved_recall, shortlist_time, full_time, result['speedup'])
+        report.append(result)
+    # done.
+    return report
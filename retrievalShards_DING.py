@@ -0,0 +1,433 @@
+# retrievalShards_DING.py
+
+# threaded retrieval. The memory tokens (the Ps, RBs, and POs in the retrieval index whose .set is 'memory') are split into shards of whole analogs, and on each retrieval step the shards update their inputs and activations (as basicRunDORA_DING.update_memory_inputs() and update_acts_memory() do) on a pool of threads. Memory tokens only read from the tokens they are connected to, from the semantics, and from the recipient, so the shards only share the acts at the start of the step and the sums over the recipient that inhibit every memory token. These pooled terms are computed once per step before the shards run, and each shard's update is then a handful of numpy operations over its own arrays (which release the GIL), so the shards run in parallel.
+# The shards own the inputs and activations of the memory tokens until the retrieval is over: acts are written back to the tokens on every step (so the rest of retrieval sees them as usual), and inputs when finish_retrieval_shards() is called at the end of basicRunDORA_DING.runDORA.do_retrieval().
+# With retrieval_processes, the shards run on worker processes instead, which own the state of the memory tokens until the retrieval is over and only report the total act of each analog on each step (see process_retrieval_step()).
+# NOTE: Groups (in memory, or above memory Ps) and memory tokens with mapping connections are not supported, and neither are the configurations where the object code stops with an error (a non-inferred memory PO with no semantic weight, or a recipient P in child mode when asDORA; see dataTypes_DING.POUnit.update_input_recipient()). In these cases retrieval runs on the token objects as usual.
+
+# imports.
+import numpy as np
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Listener
+from multiprocessing.pool import ThreadPool
+from multiprocessing.sharedctypes import RawArray
+
+# the components of a token's input (the rows of retrievalShard.inputs).
+TD, BU, LATERAL, MAP = 0, 1, 2, 3
+# the pooled recipient terms (the entries of retrievalShards.pools): act of recipient Ps in parent mode, of recipient RBs not in child mode, of all recipient POs, and of recipient Ps in child mode.
+POOLED_P, POOLED_RB, POOLED_PO, POOLED_CHILD_P = 0, 1, 2, 3
+
+# class to hold the arrays for one shard of memory tokens. Edges are kept sorted by target, so each target's input is a segment sum (np.add.reduceat()) over edge_starts.
+class retrievalShard(object):
+    def __init__(self):
+        self.tokens = [] # the memory tokens in this shard.
+        self.positions = None # numpy array, the positions of the tokens in the retrieval index.
+        self.inputs = None # numpy array (4 x number of tokens), td, bu, lateral, and map input.
+        self.net_input = None
+        self.edge_sources = None # numpy array, positions in retrievalShards.source_act of the units each edge reads.
+        self.edge_weights = None
+        self.edge_starts = None # start of each target's segment of edges.
+        self.edge_targets = None # flat position (component*number of tokens + token) in inputs of each segment's target.
+        self.semantic_sources = None # numpy array, positions in retrievalShards.semantics of the semantics each PO link reads.
+        self.semantic_weights = None
+        self.semantic_starts = None # start of each PO's segment of links.
+        self.semantic_targets = None # the PO (position in the shard) of each segment.
+        self.semantic_norms = None # the semNormalization of the PO of each segment.
+        self.semantic_POs = None # positions in the shard of the non-inferred POs (their bu_input is set from their semantics every step).
+        self.pooled_lateral = None # numpy array (number of tokens x 4), the multiplier on each pooled term for each token's lateral input.
+        self.pooled_td = None # numpy array, the multiplier on the summed act of recipient RBs for each token's td input.
+        self.lateral_const = None # numpy array, the inhibition from each token's inhibitor.
+        self.num_sources = 0 # length of the source acts (on a worker).
+
+# class to hold the shards of a retrieval and the state they share.
+class retrievalShards(object):
+    def __init__(self):
+        self.settings = None # (asDORA, lateral_input_level) the shards were made for.
+        self.shards = []
+        self.pool = None # ThreadPool the shards run on.
+        self.workers = [] # (process, connection, analog ids) of each shard's worker, if the shards run on worker processes.
+        self.num_inputs = 0 # number of step inputs sent to the workers before the acts (the semantic acts and the pooled terms).
+        self.shared_values = None # RawArray the step inputs are written to for the workers.
+        self.values = None # numpy view of shared_values.
+        self.token_positions = {} # id of each token in the retrieval index -> its position.
+        self.semantic_positions = {} # id of each semantic -> its position in semantics.
+        self.memory_positions = None # numpy array, positions in the retrieval index of the memory tokens.
+        self.memory_tokens = []
+        self.other_positions = None # numpy array, positions in the retrieval index of the tokens that are not in memory (their acts are read from the token objects every step).
+        self.other_tokens = []
+        self.act = None # numpy array, the act of each token in the retrieval index (current for memory tokens).
+        self.source_act = None # numpy array, the acts the shards read this step: the act of each token in the retrieval index, then (at an offset of the number of tokens) the act of each recipient RB that is not in child mode.
+        self.recipient_RB_positions = None
+        self.semantics = []
+        self.semantic_act = None
+        self.pools = np.zeros(4) # the pooled recipient terms this step.
+        self.pooled_RB_td = 0.0 # summed act of all recipient RBs this step.
+        self.check_child_Ps = False # True if a recipient P in child mode would stop the object code (asDORA with non-inferred memory POs).
+
+# function to return the distinct tokens in a list (in order).
+def distinct(tokens):
+    seen, result = set(), []
+    for token in tokens:
+        if id(token) not in seen:
+            seen.add(id(token))
+            result.append(token)
+    # done.
+    return result
+
+# function to split the memory tokens in the retrieval index into num_shards groups of whole analogs of roughly equal numbers of tokens (tokens with no analog go in the last group). Returns a list of numpy arrays of positions.
+def partition_memory(index, num_shards):
+    memory_positions = np.flatnonzero(index.in_memory)
+    if len(memory_positions) == 0:
+        return []
+    analog_ids = index.analog_ids[memory_positions]
+    order = np.argsort(analog_ids, kind='mergesort')
+    memory_positions, analog_ids = memory_positions[order], analog_ids[order]
+    counts = np.bincount(analog_ids, minlength=index.num_analogs+1)
+    tokens_before = np.cumsum(counts) - counts
+    shard_of_analog = np.minimum(tokens_before*num_shards//len(memory_positions), num_shards-1)
+    shard_ids = shard_of_analog[analog_ids]
+    # done.
+    return [memory_positions[shard_ids == shard_id] for shard_id in np.unique(shard_ids)]
+
+# function to make the arrays for one shard. Returns None if any of its tokens is not supported.
+def make_shard(memory, state, positions, asDORA, lateral_input_level):
+    index = memory.retrieval_index
+    num_tokens = len(index.tokens)
+    token_positions = state.token_positions
+    shard = retrievalShard()
+    shard.positions = positions
+    shard.tokens = [index.tokens[position] for position in positions]
+    n = len(positions)
+    shard.inputs = np.zeros((4, n))
+    shard.net_input = np.zeros(n)
+    shard.pooled_lateral = np.zeros((n, 4))
+    shard.pooled_td = np.zeros(n)
+    shard.lateral_const = np.zeros(n)
+    edges, links, semantic_POs = [], [], []
+    for i, token in enumerate(shard.tokens):
+        if len(token.mappingConnections) > 0:
+            return None
+        shard.inputs[:, i] = token.td_input, token.bu_input, token.lateral_input, token.map_input
+        shard.net_input[i] = token.net_input
+        if token.my_type == 'P':
+            # as update_input_recipient_parent() with phase_set = 2.
+            if len(token.myGroups) > 0:
+                return None
+            for myRB in token.myRBs:
+                edges.append((token_positions[id(myRB)], BU*n+i, 1.0))
+            shard.pooled_lateral[i, POOLED_P] = lateral_input_level
+            shard.lateral_const[i] = -token.inhibitor_act*10
+        elif token.my_type == 'RB':
+            for myP in token.myParentPs:
+                edges.append((token_positions[id(myP)], TD*n+i, 1.0))
+            for children in (token.myPred, token.myObj, token.myChildP, token.myChildRB):
+                if len(children) >= 1:
+                    edges.append((token_positions[id(children[0])], BU*n+i, 1.0))
+            # the pooled term counts recipient RBs that are my parents, so take them back out (they only count when not in child mode).
+            for myRB in distinct(token.myParentRB):
+                if myRB.set == 'recipient':
+                    edges.append((num_tokens+token_positions[id(myRB)], LATERAL*n+i, lateral_input_level))
+            shard.pooled_lateral[i, POOLED_RB] = lateral_input_level
+            shard.lateral_const[i] = -token.inhibitor_act*10
+        elif not token.inferred:
+            if not token.semNormalization:
+                return None
+            for myRB in token.myRBs:
+                edges.append((token_positions[id(myRB)], TD*n+i, 2.0 if token.predOrObj == 1 else 1.0))
+            for link in token.mySemantics:
+                links.append((i, state.semantic_positions[id(link.mySemantic)], link.weight))
+            semantic_POs.append(i)
+            # recipient POs in my RBs inhibit me twice as much when asDORA, and not at all otherwise.
+            for myPO in distinct(token.same_RB_POs):
+                if myPO.set == 'recipient' and myPO is not token:
+                    edges.append((token_positions[id(myPO)], LATERAL*n+i, -lateral_input_level if asDORA else lateral_input_level))
+            shard.pooled_lateral[i, POOLED_PO] = lateral_input_level
+            if asDORA:
+                # recipient RBs I am connected to do not inhibit me.
+                for myRB in distinct(token.myRBs):
+                    if myRB.set == 'recipient':
+                        edges.append((token_positions[id(myRB)], TD*n+i, 1.0))
+                shard.pooled_td[i] = 1.0
+                state.check_child_Ps = True
+            elif token.predOrObj == 0:
+                shard.pooled_lateral[i, POOLED_CHILD_P] = lateral_input_level
+            shard.lateral_const[i] = -token.inhibitor_act*10
+    # lay the edges and links out sorted by target.
+    shard.edge_sources, shard.edge_weights, shard.edge_starts, shard.edge_targets = segment_arrays([(target, source, weight) for source, target, weight in edges])
+    shard.semantic_sources, shard.semantic_weights, shard.semantic_starts, shard.semantic_targets = segment_arrays(links)
+    shard.semantic_norms = np.array([shard.tokens[i].semNormalization for i in shard.semantic_targets], dtype=float)
+    shard.semantic_POs = np.array(semantic_POs, dtype=int)
+    # done.
+    return shard
+
+# function to turn a list of (target, source, weight) triples into arrays of sources and weights sorted by target, the start of each target's segment, and the target of each segment.
+def segment_arrays(triples):
+    triples = sorted(triples, key=lambda triple: triple[0])
+    targets = np.array([triple[0] for triple in triples], dtype=int)
+    sources = np.array([triple[1] for triple in triples], dtype=int)
+    weights = np.array([triple[2] for triple in triples], dtype=float)
+    starts = np.flatnonzero(np.concatenate(([True], targets[1:] != targets[:-1]))) if len(targets) > 0 else np.zeros(0, dtype=int)
+    # done.
+    return sources, weights, starts, targets[starts]
+
+# function to make the shards for the current retrieval index, and start the thread pool (or, if num_processes > 0, the worker processes) they run on. Returns None if any memory token is not supported.
+def make_retrieval_shards(memory, num_threads, num_shards, asDORA, lateral_input_level, num_processes=0):
+    index = memory.retrieval_index
+    for Group in memory.Groups:
+        if Group.set == 'memory':
+            return None
+    state = retrievalShards()
+    state.settings = (asDORA, lateral_input_level, num_processes > 0)
+    state.token_positions = dict((id(token), position) for position, token in enumerate(index.tokens))
+    state.semantics = list(memory.semantics)
+    state.semantic_positions = dict((id(semantic), position) for position, semantic in enumerate(state.semantics))
+    state.semantic_act = np.zeros(len(state.semantics))
+    if num_processes > 0:
+        num_shards = num_processes
+    for positions in partition_memory(index, num_shards or num_threads):
+        shard = make_shard(memory, state, positions, asDORA, lateral_input_level)
+        if shard is None:
+            return None
+        state.shards.append(shard)
+    state.memory_positions = np.flatnonzero(index.in_memory)
+    state.memory_tokens = [index.tokens[position] for position in state.memory_positions]
+    state.other_positions = np.flatnonzero(~index.in_memory)
+    state.other_tokens = [index.tokens[position] for position in state.other_positions]
+    state.act = np.array([token.act for token in index.tokens], dtype=float)
+    state.source_act = np.zeros(2*len(index.tokens))
+    state.recipient_RB_positions = np.array([state.token_positions[id(myRB)] for myRB in memory.recipient.RBs], dtype=int)
+    if num_processes > 0:
+        if not start_workers(state, index):
+            return None
+    else:
+        state.pool = ThreadPool(num_threads)
+    # done.
+    return state
+
+# function to get the shards for the current retrieval (see sharded_retrieval_step()), making them if they have not been made yet. Returns None if the memory tokens must be updated on the token objects instead.
+def get_retrieval_shards(memory, num_threads, num_shards, num_processes, asDORA, lateral_input_level):
+    index = memory.retrieval_index
+    state = index.shards
+    if state is not None and state is not False and state.settings != (asDORA, lateral_input_level, num_processes > 0):
+        memory = finish_retrieval_shards(memory)
+        state = None
+    if state is None:
+        state = make_retrieval_shards(memory, num_threads, num_shards, asDORA, lateral_input_level, num_processes)
+        if state is None:
+            index.shards = False
+            return None
+        index.shards = state
+    if state is False:
+        return None
+    # done.
+    return state
+
+# function to compute the pooled recipient terms for this step, and the act of each recipient RB that is not in child mode, once for all shards. Returns False if a recipient P in child mode would stop the object code (in which case the shards' state has been written back to the tokens, and the shards are not used again for this retrieval).
+def gather_pooled_terms(memory, state):
+    index = memory.retrieval_index
+    num_tokens = len(index.tokens)
+    state.pools[:] = 0.0
+    for myP in memory.recipient.Ps:
+        if myP.mode == 1:
+            state.pools[POOLED_P] += myP.act
+        elif myP.mode == -1:
+            if state.check_child_Ps:
+                memory = finish_retrieval_shards(memory)
+                index.shards = False
+                return False
+            state.pools[POOLED_CHILD_P] += myP.act
+    state.pooled_RB_td = 0.0
+    state.source_act[num_tokens:] = 0.0
+    for myRB, position in zip(memory.recipient.RBs, state.recipient_RB_positions):
+        if myRB.mode != -1:
+            state.pools[POOLED_RB] += myRB.act
+            state.source_act[num_tokens+position] = myRB.act
+        state.pooled_RB_td += myRB.act
+    for myPO in memory.recipient.POs:
+        state.pools[POOLED_PO] += myPO.act
+    # get the acts at the start of the step.
+    state.act[state.other_positions] = [token.act for token in state.other_tokens]
+    state.source_act[:num_tokens] = state.act
+    state.semantic_act[:] = [semantic.act for semantic in state.semantics]
+    # done.
+    return True
+
+# function to update the inputs and acts of the tokens in one shard from the shared state (run on the thread pool).
+def update_shard(shard, state, gamma, delta, HebbBias):
+    inputs = shard.inputs
+    flat_inputs = inputs.reshape(-1)
+    if len(shard.edge_targets) > 0:
+        flat_inputs[shard.edge_targets] += np.add.reduceat(shard.edge_weights*state.source_act[shard.edge_sources], shard.edge_starts)
+    # bu_input of non-inferred POs is set (not added to) from their semantics.
+    if len(shard.semantic_POs) > 0:
+        semantic_input = np.zeros(len(shard.positions))
+        if len(shard.semantic_targets) > 0:
+            semantic_input[shard.semantic_targets] = np.add.reduceat(shard.semantic_weights*state.semantic_act[shard.semantic_sources], shard.semantic_starts)/shard.semantic_norms
+        inputs[BU, shard.semantic_POs] = semantic_input[shard.semantic_POs]
+    inputs[LATERAL] -= shard.pooled_lateral.dot(state.pools)
+    inputs[LATERAL] += shard.lateral_const
+    inputs[TD] -= shard.pooled_td*state.pooled_RB_td
+    shard.net_input = inputs[TD] + inputs[BU] + inputs[LATERAL] + inputs[MAP]*HebbBias
+    act = state.source_act[shard.positions]
+    act += gamma*shard.net_input*(1.1-act) - delta*act
+    np.clip(act, 0.0, 1.0, out=act)
+    state.act[shard.positions] = act
+
+# function to run one retrieval step on the shards (i.e., update_memory_inputs() and update_acts_memory() for every memory token) on a thread pool, making the shards if they have not been made yet. Returns the memory and the act of each token in the retrieval index (0.0 for tokens not in memory), or None for the acts if the step must run on the token objects instead (in which case the shards' state has been written back to the tokens, and the shards are not used again for this retrieval).
+def sharded_retrieval_step(memory, num_threads, num_shards, asDORA, gamma, delta, HebbBias, lateral_input_level):
+    state = get_retrieval_shards(memory, num_threads, num_shards, 0, asDORA, lateral_input_level)
+    if state is None or not gather_pooled_terms(memory, state):
+        return memory, None
+    # update the shards.
+    state.pool.map(lambda shard: update_shard(shard, state, gamma, delta, HebbBias), state.shards)
+    # write the new acts back to the memory tokens.
+    for token, act in zip(state.memory_tokens, state.act[state.memory_positions].tolist()):
+        token.act = act
+    acts = np.zeros(len(memory.retrieval_index.tokens))
+    acts[state.memory_positions] = state.act[state.memory_positions]
+    # done.
+    return memory, acts
+
+# functions for retrieval on worker processes. Each worker owns one shard (a partition of the analogs in memory) and runs its memory-side updates; on each step the coordinator (the process running DORA) sends the workers the semantic acts and the recipient terms, and gets back only the total act of each of their analogs, from which it makes the Luce choice in retrieve_tokens() as usual. The coordinator talks to a worker through a connection (multiprocessing.connection) with these messages (all plain tuples of numbers and numpy arrays):
+#   ('load', shard, num_inputs, token_analogs, num_analogs, act, max_act) -> ('loaded',): the worker's shard (with its edges reading from [its own acts, the step inputs after the first num_inputs]), the analog (0 to num_analogs-1) of each of its tokens, and their acts and max acts so far.
+#   ('step', gamma, delta, HebbBias, track_max, values) -> ('total_acts', total act of each analog): run one step (and keep the running max act of each token if track_max). values is the step inputs (semantic acts, the 4 pooled terms, the summed act of recipient RBs, then the act of each token not in memory and of each recipient RB not in child mode), or None if the worker reads them from the memory it shares with the coordinator.
+#   ('finish',) -> ('state', act, inputs, net_input, max_act): the state of the worker's tokens.
+#   ('close',): stop.
+# Only the local backend (a worker process per shard on this machine, with the step inputs in shared memory) is started by the coordinator. A worker on another host is run with serve_worker(), and gets the step inputs in its messages.
+# function to run a worker: answer messages from the coordinator on connection until told to close. shared_values is the shared memory (a multiprocessing RawArray) the step inputs are written to, or None.
+def run_worker(connection, shared_values=None):
+    shard, state = None, None
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == 'load':
+            shard, num_inputs, token_analogs, num_analogs, act, max_act = message[1:]
+            num_semantics = num_inputs - 5
+            state = retrievalShards()
+            state.act = act
+            state.source_act = np.zeros(shard.num_sources)
+            connection.send(('loaded',))
+        elif command == 'step':
+            gamma, delta, HebbBias, track_max, values = message[1:]
+            if values is None:
+                values = np.frombuffer(shared_values)
+            state.semantic_act = values[:num_semantics]
+            state.pools = values[num_semantics:num_semantics+4]
+            state.pooled_RB_td = values[num_semantics+4]
+            state.source_act[:len(state.act)] = state.act
+            state.source_act[len(state.act):] = values[num_inputs:]
+            update_shard(shard, state, gamma, delta, HebbBias)
+            if track_max:
+                np.maximum(max_act, state.act, out=max_act)
+            connection.send(('total_acts', np.bincount(token_analogs, weights=state.act, minlength=num_analogs)))
+        elif command == 'finish':
+            connection.send(('state', state.act, shard.inputs, shard.net_input, max_act))
+        elif command == 'close':
+            break
+    connection.close()
+
+# function to serve a worker on another host: listen on address (a (host, port) pair) and run a worker for each coordinator that connects.
+def serve_worker(address, authkey):
+    listener = Listener(address, authkey=authkey)
+    while True:
+        connection = listener.accept()
+        run_worker(connection)
+
+# function to make the copy of a shard that is sent to a worker. The worker's source acts are its own tokens' acts followed by the step inputs after the semantic and pooled terms (the act of each token not in memory, then of each recipient RB not in child mode), so the edge sources are renumbered. Returns None if any edge reads a memory token in another shard.
+def make_worker_shard(shard, state, index):
+    num_tokens = len(index.tokens)
+    n = len(shard.positions)
+    local_positions = dict((position, i) for i, position in enumerate(shard.positions))
+    other_positions = dict((position, n+i) for i, position in enumerate(state.other_positions))
+    RB_positions = dict((position, n+len(state.other_positions)+i) for i, position in enumerate(state.recipient_RB_positions))
+    sources = []
+    for source in shard.edge_sources:
+        if source >= num_tokens:
+            sources.append(RB_positions[source-num_tokens])
+        elif source in local_positions:
+            sources.append(local_positions[source])
+        elif source in other_positions:
+            sources.append(other_positions[source])
+        else:
+            return None
+    worker_shard = retrievalShard()
+    worker_shard.__dict__.update(shard.__dict__)
+    worker_shard.tokens = []
+    worker_shard.positions = np.arange(n)
+    worker_shard.inputs = shard.inputs.copy()
+    worker_shard.edge_sources = np.array(sources, dtype=int)
+    worker_shard.num_sources = n + len(state.other_positions) + len(state.recipient_RB_positions)
+    # done.
+    return worker_shard
+
+# function to start a local worker process for each shard and load its shard. Returns False if a shard cannot run on its own (see make_worker_shard()).
+def start_workers(state, index):
+    worker_shards = [make_worker_shard(shard, state, index) for shard in state.shards]
+    if any(worker_shard is None for worker_shard in worker_shards):
+        return False
+    state.num_inputs = len(state.semantics) + 5
+    state.shared_values = RawArray('d', state.num_inputs + len(state.other_positions) + len(state.recipient_RB_positions))
+    state.values = np.frombuffer(state.shared_values)
+    for shard, worker_shard in zip(state.shards, worker_shards):
+        # number the shard's analogs from 0 for the worker.
+        analog_ids, token_analogs = np.unique(index.analog_ids[shard.positions], return_inverse=True)
+        connection, worker_connection = Pipe()
+        process = Process(target=run_worker, args=(worker_connection, state.shared_values))
+        process.daemon = True
+        process.start()
+        connection.send(('load', worker_shard, state.num_inputs, token_analogs, len(analog_ids), state.act[shard.positions], index.max_acts[shard.positions].copy()))
+        connection.recv()
+        state.workers.append((process, connection, analog_ids))
+    # done.
+    return True
+
+# function to run one retrieval step on worker processes, making the shards and starting the workers if they have not been made yet. If bias_retrieval_analogs, the per-analog totals are written to the retrieval index (index.total_acts); otherwise the workers keep the max act of each token. The acts of the memory tokens stay in the workers until finish_retrieval_shards(). Returns the memory and False if the step must run on the token objects instead (as sharded_retrieval_step()).
+def process_retrieval_step(memory, num_processes, asDORA, gamma, delta, HebbBias, lateral_input_level, bias_retrieval_analogs):
+    state = get_retrieval_shards(memory, 0, 0, num_processes, asDORA, lateral_input_level)
+    if state is None or not gather_pooled_terms(memory, state):
+        return memory, False
+    index = memory.retrieval_index
+    num_tokens = len(index.tokens)
+    num_semantics = len(state.semantics)
+    # write the step inputs to shared memory, and start every worker on the step before waiting for any of them.
+    state.values[:num_semantics] = state.semantic_act
+    state.values[num_semantics:num_semantics+4] = state.pools
+    state.values[num_semantics+4] = state.pooled_RB_td
+    state.values[state.num_inputs:state.num_inputs+len(state.other_positions)] = state.act[state.other_positions]
+    state.values[state.num_inputs+len(state.other_positions):] = state.source_act[num_tokens+state.recipient_RB_positions]
+    for process, connection, analog_ids in state.workers:
+        connection.send(('step', gamma, delta, HebbBias, not bias_retrieval_analogs, None))
+    # reduce the per-analog totals (the last analog id collects the tokens with no analog, and is dropped).
+    total_acts = np.zeros(index.num_analogs+1)
+    for process, connection, analog_ids in state.workers:
+        total_acts[analog_ids] += connection.recv()[1]
+    if bias_retrieval_analogs:
+        index.total_acts = total_acts[:index.num_analogs]
+    # done.
+    return memory, True
+
+# function to write the inputs of the memory tokens back to the tokens and shut down the thread pool, if the current retrieval ran on shards. If the shards ran on worker processes, their acts (and max acts) are collected from the workers first, and the workers are stopped.
+def finish_retrieval_shards(memory):
+    index = memory.retrieval_index
+    if index is not None and index.shards:
+        state = index.shards
+        for process, connection, analog_ids in state.workers:
+            connection.send(('finish',))
+        for shard, (process, connection, analog_ids) in zip(state.shards, state.workers):
+            act, shard.inputs, shard.net_input, max_act = connection.recv()[1:]
+            for token, token_act in zip(shard.tokens, act.tolist()):
+                token.act = token_act
+            index.max_acts[shard.positions] = max_act
+            connection.send(('close',))
+            process.join()
+        for shard in state.shards:
+            inputs = shard.inputs.tolist()
+            net_input = shard.net_input.tolist()
+            for i, token in enumerate(shard.tokens):
+                token.td_input, token.bu_input, token.lateral_input, token.map_input = inputs[TD][i], inputs[BU][i], inputs[LATERAL][i], inputs[MAP][i]
+                token.net_input = net_input[i]
+        if state.pool is not None:
+            state.pool.close()
+        index.shards = None
+    # done.
+    return memory
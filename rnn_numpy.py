@@ -0,0 +1,155 @@
+import numpy as np
+from utils import *
+floatX = 'float32'
+
+# Holds a parameter array, with the get_value/set_value interface of a Theano shared variable (so utils.save_model_parameters_theano and load_model_parameters_theano work on RNNNumpy models)
+class NumpyShared:
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = np.asarray(value, dtype=floatX)
+
+    def get_value(self):
+        return self.value.copy()
+
+    def set_value(self, value):
+        self.value = np.asarray(value, dtype=floatX)
+
+# The tanh-RNN of RNNTheano in plain NumPy: no graph compilation, so scripts that load a model start at once, and it runs wherever NumPy does.
+# Every function takes one sentence ([time, dim]) or a batch of sentences of the same length ([batch, time, dim]).
+class RNNNumpy:
+
+    def __init__(self, input_dim, word_dim, hidden_dim=100, bptt_truncate=5):
+        # input_dim: input dimension
+        # word_dim: output dimension (clases or vocabulary)
+        # hidden_dim: hidden dimension
+
+        # Assign instance variables
+        self.input_dim = input_dim
+        self.word_dim = word_dim
+        self.hidden_dim = hidden_dim
+        self.bptt_truncate = bptt_truncate
+        # Randomly initialize the network parameters
+        U = np.random.uniform(-np.sqrt(1./input_dim), np.sqrt(1./input_dim), (hidden_dim, input_dim))
+        V = np.random.uniform(-np.sqrt(1./hidden_dim), np.sqrt(1./hidden_dim), (word_dim, hidden_dim))
+        W = np.random.uniform(-np.sqrt(1./hidden_dim), np.sqrt(1./hidden_dim), (hidden_dim, hidden_dim))
+        self.U = NumpyShared('U', U)
+        self.V = NumpyShared('V', V)
+        self.W = NumpyShared('W', W)
+
+    def forward_propagation(self, x, params=None):
+        # returns [o, s]: the outputs (softmax over word_dim) and hidden states at each time step
+        # params: the [U, V, W] to use (the model's by default)
+        x = np.asarray(x, dtype=floatX)
+        single = x.ndim == 2
+        if single:
+            x = x[np.newaxis]
+        U, V, W = self.U.value, self.V.value, self.W.value
+        if params is not None:
+            U, V, W = params
+        num_sentences, num_steps = x.shape[0], x.shape[1]
+        o = np.zeros((num_sentences, num_steps, V.shape[0]), dtype=floatX)
+        s = np.zeros((num_sentences, num_steps, W.shape[0]), dtype=floatX)
+        s_t = np.zeros((num_sentences, W.shape[0]), dtype=floatX)
+        # the input part of every step at once, then the recurrence over time
+        x_U = x.dot(U.T)
+        for t in range(num_steps):
+            s_t = np.tanh(x_U[:, t] + s_t.dot(W.T))
+            z_t = s_t.dot(V.T)
+            o_t = np.exp(z_t - z_t.max(axis=1)[:, np.newaxis])
+            o[:, t] = o_t / o_t.sum(axis=1)[:, np.newaxis]
+            s[:, t] = s_t
+        if single:
+            return [o[0], s[0]]
+        return [o, s]
+
+    def forward_propagation_batch(self, x_batch):
+        return self.forward_propagation(x_batch)
+
+    def predict(self, x):
+        o, s = self.forward_propagation(x)
+        return np.argmax(o, axis=-1)
+
+    def ce_error(self, x, y):
+        o, s = self.forward_propagation(x)
+        return -np.sum(np.asarray(y, dtype=floatX) * np.log(o))
+
+    def ce_error_batch(self, x_batch, y_batch):
+        return self.ce_error(x_batch, y_batch)
+
+    def totaccuracy(self, x, y):
+        return np.sum(self.predict(x) == np.argmax(y, axis=-1))
+
+    def evaluate_batch(self, x_batch, y_batch, params=None):
+        # the loss and the accuracy of a batch from one forward pass
+        o, s = self.forward_propagation(x_batch, params)
+        return [-np.sum(np.asarray(y_batch, dtype=floatX) * np.log(o)), np.sum(np.argmax(o, axis=-1) == np.argmax(y_batch, axis=-1))]
+
+    def bptt(self, x, y):
+        # returns [dU, dV, dW], the gradients of ce_error (summed over the batch). As with Theano's truncate_gradient, only the last bptt_truncate time steps are backpropagated through (all of them if bptt_truncate <= 0)
+        x = np.asarray(x, dtype=floatX)
+        y = np.asarray(y, dtype=floatX)
+        if x.ndim == 2:
+            x, y = x[np.newaxis], y[np.newaxis]
+        U, V, W = self.U.value, self.V.value, self.W.value
+        o, s = self.forward_propagation(x)
+        num_steps = x.shape[1]
+        first_step = 0
+        if self.bptt_truncate > 0:
+            first_step = max(num_steps - self.bptt_truncate, 0)
+        dU = np.zeros(U.shape, dtype=floatX)
+        dV = np.zeros(V.shape, dtype=floatX)
+        dW = np.zeros(W.shape, dtype=floatX)
+        # gradient of the error with respect to the softmax inputs
+        delta_o = o * y.sum(axis=2)[:, :, np.newaxis] - y
+        ds_next = np.zeros((x.shape[0], W.shape[0]), dtype=floatX)
+        for t in range(num_steps - 1, first_step - 1, -1):
+            dV += delta_o[:, t].T.dot(s[:, t])
+            ds_t = delta_o[:, t].dot(V) + ds_next
+            da_t = ds_t * (1 - s[:, t] ** 2)
+            dU += da_t.T.dot(x[:, t])
+            if t > 0:
+                dW += da_t.T.dot(s[:, t - 1])
+            ds_next = da_t.dot(W)
+        return [dU, dV, dW]
+
+    def sgd_step(self, x, y, learning_rate):
+        # for a batch, the step uses the mean gradient over the batch (as RNNTheano.sgd_step_batch)
+        dU, dV, dW = self.bptt(x, y)
+        if np.ndim(x) == 3:
+            learning_rate = learning_rate / float(len(x))
+        self.U.set_value(self.U.value - learning_rate * dU)
+        self.V.set_value(self.V.value - learning_rate * dV)
+        self.W.set_value(self.W.value - learning_rate * dW)
+
+    def sgd_step_batch(self, x_batch, y_batch, learning_rate):
+        self.sgd_step(x_batch, y_batch, learning_rate)
+
+    def get_parameters(self):
+        # a copy of [U, V, W] (e.g. to evaluate against while training goes on)
+        return [self.U.get_value(), self.V.get_value(), self.W.get_value()]
+
+    def calculate_loss_and_accuracy(self, X, Y, params=None):
+        # the loss per word and the number of words predicted correctly, in one pass: one call for a [N, T, D] dataset, or one per sentence for sentences of different lengths
+        # params: the [U, V, W] to evaluate (the model's by default)
+        if np.ndim(X) == 3:
+            total_loss, accuracy = self.evaluate_batch(X, Y, params)
+        else:
+            total_loss, accuracy = 0.0, 0
+            for x,y in zip(X,Y):
+                error, correct = self.evaluate_batch(x, y, params)
+                total_loss += error
+                accuracy += correct
+        num_words = np.sum([len(y) for y in Y])
+        return total_loss/float(num_words), accuracy
+
+    def calculate_total_loss(self, X, Y):
+        num_words = np.sum([len(y) for y in Y])
+        return self.calculate_loss_and_accuracy(X, Y)[0] * num_words
+
+    def calculate_loss(self, X, Y):
+        # Divide calculate_loss by the number of words
+        return self.calculate_loss_and_accuracy(X, Y)[0]
+
+    def calculate_accuracy(self, X, Y):
+        return self.calculate_loss_and_accuracy(X, Y)[1]
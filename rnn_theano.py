@@ -1,20 +1,40 @@
+import os
+import sys
+import hashlib
+import threading
+import cPickle
 import numpy as np
 import theano as theano
 import theano.tensor as T
 from utils import *
 theano.config.floatX = 'float32'
+
+# The compile cache (see RNNTheano.__compile__) is kept next to this file, wherever the script using it is run from. Its key includes a hash of this file's source, so functions compiled from an older version of the graph code are never loaded (if the source cannot be read, nothing is cached)
+module_path = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+default_compile_cache = os.path.join(os.path.dirname(module_path), 'rnn_theano_cache')
+try:
+    source_hash = hashlib.sha1(open(module_path, 'rb').read()).hexdigest()
+except IOError:
+    source_hash = None
+
 class RNNTheano:
-    
-    def __init__(self, input_dim, word_dim, hidden_dim=100, bptt_truncate=5):
+
+    # The Theano functions, each compiled on first use (see __getattr__), so a script only pays for the functions it calls (e.g. forward passes only, without the gradient graph)
+    function_names = ['forward_propagation', 'predict', 'ce_error', 'bptt', 'totaccuracy', 'sgd_step',
+                      'forward_propagation_batch', 'ce_error_batch', 'evaluate_batch', 'sgd_step_batch']
+
+    def __init__(self, input_dim, word_dim, hidden_dim=100, bptt_truncate=5, compile_cache=default_compile_cache):
         # input_dim: input dimension
         # word_dim: output dimension (clases or vocabulary)
         # hidden_dim: hidden dimension
-        
+        # compile_cache: directory the compiled functions are kept in, so later runs reuse them (None to always compile)
+
         # Assign instance variables
         self.input_dim = input_dim
         self.word_dim = word_dim
         self.hidden_dim = hidden_dim
         self.bptt_truncate = bptt_truncate
+        self.compile_cache = compile_cache
         # Randomly initialize the network parameters
         U = np.random.uniform(-np.sqrt(1./input_dim), np.sqrt(1./input_dim), (hidden_dim, input_dim))
         V = np.random.uniform(-np.sqrt(1./hidden_dim), np.sqrt(1./hidden_dim), (word_dim, hidden_dim))
@@ -22,60 +42,178 @@ class RNNTheano:
         # Theano: Created shared variables
         self.U = theano.shared(name='U', value=U.astype(theano.config.floatX))
         self.V = theano.shared(name='V', value=V.astype(theano.config.floatX))
-        self.W = theano.shared(name='W', value=W.astype(theano.config.floatX))      
-        # We store the Theano graph here
+        self.W = theano.shared(name='W', value=W.astype(theano.config.floatX))
+        # We store the Theano graph here (built a part at a time, as the functions that need it are compiled)
         self.theano = {}
-        self.__theano_build__()
-    
-    def __theano_build__(self):
-        U, V, W = self.U, self.V, self.W
-        x = T.matrix('x')
-        y = T.matrix('y')
-        def forward_prop_step(x_t, s_t_prev, U, V, W):
-            s_t = T.tanh(U.dot(x_t) + W.dot(s_t_prev)) # modified for compatibility with a vector input instead of a index
-            o_t = T.nnet.softmax(V.dot(s_t))
-            return [o_t[0], s_t]
-            # this is the loop for fordward calculation of outputs for words throuh the the sentence array x (each sentence has multiple vectors representing words...)
-        [o,s], updates = theano.scan(
-            forward_prop_step,
-            sequences=x,
-            outputs_info=[None, dict(initial=T.zeros(self.hidden_dim))],
-            non_sequences=[U, V, W],
-            truncate_gradient=self.bptt_truncate,
-            strict=True)
-        
-        prediction = T.argmax(o, axis=1)
-        true_class = T.argmax(y, axis=1)
-        o_error = T.sum(T.nnet.categorical_crossentropy(o, y))
-        accuracy = T.sum(T.eq(prediction, true_class))
-        
-        # Gradients
-        dU = T.grad(o_error, U)
-        dV = T.grad(o_error, V)
-        dW = T.grad(o_error, W)
-        
-        # Assign functions
-        self.forward_propagation = theano.function([x], [o, s])
-        self.predict = theano.function([x], prediction)
-        self.ce_error = theano.function([x, y], o_error)
-        self.bptt = theano.function([x, y], [dU, dV, dW])
-        self.totaccuracy = theano.function([x, y], accuracy)
-        
-        # SGD
+        # held while a function is compiled: the graph parts are shared between functions, and Theano cannot optimize them from two threads at once
+        self.compile_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # compile a Theano function the first time it is used
+        if name in RNNTheano.function_names:
+            with self.compile_lock:
+                # another thread may have compiled it while this one waited
+                if name not in self.__dict__:
+                    setattr(self, name, self.__compile__(name))
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __theano_build__(self, part):
+        # builds a part of the graph: 'single' (one [time, dim] sentence), 'batch' ([batch, time, dim] mini-batches), or their gradients ('single_grad', 'batch_grad')
+        # U, V and W are inputs of the graph rather than the shared variables, so the compiled functions can be pickled to the compile cache on their own (a pickled function would get its own copies of the shared variables); the sgd steps, which are not cached, are given the shared variables for them
+        if part in self.theano:
+            return self.theano[part]
+        graph = {}
+        if part == 'single':
+            U, V, W = T.matrix('U'), T.matrix('V'), T.matrix('W')
+            x = T.matrix('x')
+            y = T.matrix('y')
+            def forward_prop_step(x_t, s_t_prev, U, V, W):
+                s_t = T.tanh(U.dot(x_t) + W.dot(s_t_prev)) # modified for compatibility with a vector input instead of a index
+                o_t = T.nnet.softmax(V.dot(s_t))
+                return [o_t[0], s_t]
+                # this is the loop for fordward calculation of outputs for words throuh the the sentence array x (each sentence has multiple vectors representing words...)
+            [o,s], updates = theano.scan(
+                forward_prop_step,
+                sequences=x,
+                outputs_info=[None, dict(initial=T.zeros((U.shape[0],)))],
+                non_sequences=[U, V, W],
+                truncate_gradient=self.bptt_truncate,
+                strict=True)
+            graph = dict(U=U, V=V, W=W, x=x, y=y, o=o, s=s)
+            graph['prediction'] = T.argmax(o, axis=1)
+            graph['o_error'] = T.sum(T.nnet.categorical_crossentropy(o, y))
+            graph['accuracy'] = T.sum(T.eq(graph['prediction'], T.argmax(y, axis=1)))
+        elif part == 'batch':
+            # Mini-batches: all sentences in a condition have the same length, so a batch is a [batch, time, dim] tensor. Scan over time with the batch as the first axis of each step.
+            U, V, W = T.matrix('U'), T.matrix('V'), T.matrix('W')
+            x_batch = T.tensor3('x_batch')
+            y_batch = T.tensor3('y_batch')
+            def forward_prop_step_batch(x_t, s_t_prev, U, V, W):
+                s_t = T.tanh(x_t.dot(U.T) + s_t_prev.dot(W.T))
+                o_t = T.nnet.softmax(s_t.dot(V.T))
+                return [o_t, s_t]
+            [o_batch, s_batch], updates = theano.scan(
+                forward_prop_step_batch,
+                sequences=x_batch.dimshuffle(1, 0, 2),
+                outputs_info=[None, dict(initial=T.zeros((x_batch.shape[0], U.shape[0])))],
+                non_sequences=[U, V, W],
+                truncate_gradient=self.bptt_truncate,
+                strict=True)
+            # back to [batch, time, dim]
+            o_batch = o_batch.dimshuffle(1, 0, 2)
+            s_batch = s_batch.dimshuffle(1, 0, 2)
+            graph = dict(U=U, V=V, W=W, x=x_batch, y=y_batch, o=o_batch, s=s_batch)
+            graph['o_error'] = T.sum(T.nnet.categorical_crossentropy(o_batch.reshape((-1, o_batch.shape[2])), y_batch.reshape((-1, y_batch.shape[2]))))
+            graph['accuracy'] = T.sum(T.eq(T.argmax(o_batch, axis=2), T.argmax(y_batch, axis=2)))
+        elif part == 'single_grad':
+            graph = self.__theano_build__('single')
+            # Gradients
+            graph['dU'], graph['dV'], graph['dW'] = T.grad(graph['o_error'], [graph['U'], graph['V'], graph['W']])
+        elif part == 'batch_grad':
+            graph = self.__theano_build__('batch')
+            # the step uses the mean gradient over the batch, so the learning rate means the same as for one-sentence steps
+            graph['dU'], graph['dV'], graph['dW'] = T.grad(graph['o_error'] / graph['x'].shape[0], [graph['U'], graph['V'], graph['W']])
+        self.theano[part] = graph
+        return graph
+
+    def __compile_function__(self, name):
+        # compiles the Theano function behind name (inputs ending with U, V and W, except for the sgd steps, which update the shared variables in place)
         learning_rate = T.scalar('learning_rate')
-        self.sgd_step = theano.function([x,y,learning_rate], [], 
-                      updates=[(self.U, self.U - learning_rate * dU),
-                              (self.V, self.V - learning_rate * dV),
-                              (self.W, self.W - learning_rate * dW)], allow_input_downcast=True)
-    
+        if name in ['forward_propagation', 'predict', 'ce_error', 'totaccuracy']:
+            g = self.__theano_build__('single')
+        elif name == 'bptt' or name == 'sgd_step':
+            g = self.__theano_build__('single_grad')
+        elif name in ['forward_propagation_batch', 'ce_error_batch', 'evaluate_batch']:
+            g = self.__theano_build__('batch')
+        else:
+            g = self.__theano_build__('batch_grad')
+        params = [g['U'], g['V'], g['W']]
+        if name in ['forward_propagation', 'forward_propagation_batch']:
+            return theano.function([g['x']] + params, [g['o'], g['s']])
+        if name == 'predict':
+            return theano.function([g['x']] + params, g['prediction'])
+        if name in ['ce_error', 'ce_error_batch']:
+            return theano.function([g['x'], g['y']] + params, g['o_error'])
+        if name == 'totaccuracy':
+            return theano.function([g['x'], g['y']] + params, g['accuracy'])
+        if name == 'evaluate_batch':
+            # the loss and the accuracy of a batch from one forward pass
+            return theano.function([g['x'], g['y']] + params, [g['o_error'], g['accuracy']], allow_input_downcast=True)
+        if name == 'bptt':
+            return theano.function([g['x'], g['y']] + params, [g['dU'], g['dV'], g['dW']])
+        # SGD: the graph's U, V and W are given the shared variables, which are updated in place (so the parameters stay where Theano keeps them, e.g. on the GPU, rather than being copied in and out on every step)
+        return theano.function([g['x'], g['y'], learning_rate], [],
+                      updates=[(self.U, self.U - learning_rate * g['dU']),
+                               (self.V, self.V - learning_rate * g['dV']),
+                               (self.W, self.W - learning_rate * g['dW'])],
+                      givens={g['U']: self.U, g['V']: self.V, g['W']: self.W}, allow_input_downcast=True)
+
+    def __cache_path__(self, name):
+        # the compile cache file for name, keyed by the source of this file, and the parameter shapes, dtype, truncation and Theano version the function is compiled for
+        key = repr((name, source_hash, self.U.get_value(borrow=True).shape, self.V.get_value(borrow=True).shape, self.W.get_value(borrow=True).shape,
+                    theano.config.floatX, self.bptt_truncate, theano.__version__))
+        return os.path.join(self.compile_cache, '%s-%s.pkl' % (name, hashlib.sha1(key).hexdigest()))
+
+    def __compile__(self, name):
+        # gets the compiled function for name from the compile cache (compiling it and adding it to the cache if it is not there), and wraps it to use the model's parameters (or the [U, V, W] passed as params=)
+        # the sgd steps update the model's shared variables, and a pickled function would get its own copies of them, so they are compiled on every run and not cached
+        if name in ['sgd_step', 'sgd_step_batch']:
+            return self.__compile_function__(name)
+        function = None
+        use_cache = self.compile_cache is not None and source_hash is not None
+        if use_cache:
+            path = self.__cache_path__(name)
+            if os.path.exists(path):
+                try:
+                    function = cPickle.load(open(path, 'rb'))
+                except Exception:
+                    function = None
+        if function is None:
+            function = self.__compile_function__(name)
+            if use_cache:
+                try:
+                    if not os.path.isdir(self.compile_cache):
+                        os.makedirs(self.compile_cache)
+                    # pickling a scan graph recurses deeply
+                    sys.setrecursionlimit(max(sys.getrecursionlimit(), 50000))
+                    temporary_path = path + '.%d.tmp' % os.getpid()
+                    cPickle.dump(function, open(temporary_path, 'wb'), -1)
+                    os.rename(temporary_path, path)
+                except Exception as error:
+                    print "Could not add %s to the compile cache: %s" % (name, error)
+        def call(*inputs, **options):
+            params = options.get('params')
+            if params is None:
+                params = [self.U.get_value(borrow=True), self.V.get_value(borrow=True), self.W.get_value(borrow=True)]
+            return function(*(list(inputs) + list(params)))
+        return call
+
+    def get_parameters(self):
+        # a copy of [U, V, W] (e.g. to evaluate against while training goes on)
+        return [self.U.get_value(), self.V.get_value(), self.W.get_value()]
+
+    def calculate_loss_and_accuracy(self, X, Y, params=None):
+        # the loss per word and the number of words predicted correctly, in one pass: one call for a [N, T, D] dataset, or one per sentence for sentences of different lengths
+        # params: the [U, V, W] to evaluate (the model's by default)
+        if np.ndim(X) == 3:
+            total_loss, accuracy = self.evaluate_batch(X, Y, params=params)
+        else:
+            total_loss, accuracy = 0.0, 0
+            for x,y in zip(X,Y):
+                error, correct = self.evaluate_batch(np.asarray(x)[np.newaxis], np.asarray(y)[np.newaxis], params=params)
+                total_loss += error
+                accuracy += correct
+        num_words = np.sum([len(y) for y in Y])
+        return total_loss/float(num_words), accuracy
+
     def calculate_total_loss(self, X, Y):
-        return np.sum([self.ce_error(x,y) for x,y in zip(X,Y)])
-    
+        num_words = np.sum([len(y) for y in Y])
+        return self.calculate_loss_and_accuracy(X, Y)[0] * num_words
+
     def calculate_loss(self, X, Y):
         # Divide calculate_loss by the number of words
-        num_words = np.sum([len(y) for y in Y])
-        return self.calculate_total_loss(X,Y)/float(num_words)
-    
-    def calculate_accuracy(self, X, Y):
-        return np.sum([self.totaccuracy(x,y) for x,y in zip(X,Y)])
+        return self.calculate_loss_and_accuracy(X, Y)[0]
 
+    def calculate_accuracy(self, X, Y):
+        return self.calculate_loss_and_accuracy(X, Y)[1]
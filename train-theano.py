@@ -3,40 +3,102 @@
 import numpy as np
 import sys
 import time
+import threading
 import cPickle
 from datetime import datetime
 from utils import *
 from rnn_theano import RNNTheano
 
-def train_with_sgd(model, X_train, y_train, learning_rate=0.005, nepoch=1, evaluate_loss_after=5):
+# Report an evaluation (num_examples_seen, epoch, loss, accuracy), and halve the learning rate if the loss went up. Returns the learning rate.
+def report_evaluation(evaluation, losses, learning_rate):
+    num_examples_seen, epoch, loss, accuracy = evaluation
+    losses.append((num_examples_seen, loss))
+    time = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+    print "%s: Loss after num_examples_seen=%d epoch=%d: %f" % (time, num_examples_seen, epoch, loss)
+    # Adjust the learning rate if loss increases
+    if (len(losses) > 1 and losses[-1][1] > losses[-2][1]):
+        learning_rate = learning_rate * 0.5  
+        print "Setting learning rate to %f" % learning_rate
+    print "%s: Accuracy after num_examples_seen=%d epoch=%d: %f" % (time, num_examples_seen, epoch, accuracy)
+    sys.stdout.flush() # You want unbuffered output whenever you want to ensure that the output has been written before continuing.
+    return learning_rate
+
+# Wait for a background evaluation, and report it. An error the evaluation hit is raised here, on the training thread (with its traceback). Returns the learning rate.
+def join_evaluation(evaluation_thread, evaluations, errors, losses, learning_rate):
+    evaluation_thread.join()
+    if errors:
+        error = errors.pop(0)
+        raise error[0], error[1], error[2]
+    return report_evaluation(evaluations.pop(0), losses, learning_rate)
+
+def train_with_sgd(model, X_train, y_train, learning_rate=0.005, nepoch=1, evaluate_loss_after=5, batch_size=1, evaluate_in_background=False):
+    # batch_size > 1 takes each SGD step on a mini-batch of sentences (the mean gradient over the batch) rather than on one sentence; evaluate_loss_after=0 never evaluates
+    # The loss and accuracy are evaluated together, in one pass over the training data. evaluate_in_background evaluates on a thread, against a copy of the parameters, while training goes on; the results are reported (and the learning rate adjusted) when the next evaluation starts, or at the end
     # We keep track of the losses so we can plot them later
     losses = []
     num_examples_seen = 0
+    evaluation_thread = None
+    evaluations = []
+    errors = []
+    if evaluate_in_background and evaluate_loss_after > 0:
+        # compile the functions used on both threads here first, so the thread never compiles while the training loop does
+        getattr(model, 'evaluate_batch')
+        getattr(model, 'sgd_step_batch' if batch_size > 1 else 'sgd_step')
     for epoch in range(nepoch):
-        # Optionally evaluate the loss
-        if (epoch % evaluate_loss_after == 0):
-            loss = model.calculate_loss(X_train, y_train)
-            losses.append((num_examples_seen, loss))
-            time = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-            print "%s: Loss after num_examples_seen=%d epoch=%d: %f" % (time, num_examples_seen, epoch, loss)
-            # Adjust the learning rate if loss increases
-            if (len(losses) > 1 and losses[-1][1] > losses[-2][1]):
-                learning_rate = learning_rate * 0.5  
-                print "Setting learning rate to %f" % learning_rate
-            sys.stdout.flush() # You want unbuffered output whenever you want to ensure that the output has been written before continuing.
+        # Optionally evaluate the loss and accuracy
+        if (evaluate_loss_after > 0 and epoch % evaluate_loss_after == 0):
+            if evaluate_in_background:
+                if evaluation_thread is not None:
+                    learning_rate = join_evaluation(evaluation_thread, evaluations, errors, losses, learning_rate)
+                def evaluate(num_examples_seen=num_examples_seen, epoch=epoch, params=model.get_parameters()):
+                    try:
+                        evaluations.append((num_examples_seen, epoch) + model.calculate_loss_and_accuracy(X_train, y_train, params))
+                    except Exception:
+                        errors.append(sys.exc_info())
+                evaluation_thread = threading.Thread(target=evaluate)
+                evaluation_thread.daemon = True
+                evaluation_thread.start()
+            else:
+                loss, accuracy = model.calculate_loss_and_accuracy(X_train, y_train)
+                learning_rate = report_evaluation((num_examples_seen, epoch, loss, accuracy), losses, learning_rate)
             # ADDED! Saving model oarameters
             #save_model_parameters_theano("./data/rnn-theano-%d-%d-%s.npz" % (model.hidden_dim, model.word_dim, time), model)
-        # Optionally evaluate the accuracy
-        if (epoch % evaluate_loss_after == 0):
-            accuracy = model.calculate_accuracy(X_train, y_train)
-            time = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-            print "%s: Accuracy after num_examples_seen=%d epoch=%d: %f" % (time, num_examples_seen, epoch, accuracy)
 
         # For each training example (SGD step)...
-        for i in range(len(y_train)):
-            # One SGD step
-            model.sgd_step(X_train[i], y_train[i], learning_rate)
-            num_examples_seen += 1
+        if batch_size > 1:
+            # For each mini-batch (SGD step)...
+            for i in range(0, len(y_train), batch_size):
+                model.sgd_step_batch(X_train[i:i+batch_size], y_train[i:i+batch_size], learning_rate)
+                num_examples_seen += len(y_train[i:i+batch_size])
+        else:
+            for i in range(len(y_train)):
+                # One SGD step
+                model.sgd_step(X_train[i], y_train[i], learning_rate)
+                num_examples_seen += 1
+    if evaluation_thread is not None:
+        join_evaluation(evaluation_thread, evaluations, errors, losses, learning_rate)
+    return losses
+
+# Benchmark training speed (examples/second) against mini-batch size, on nepoch epochs for each batch size. The model's parameters are put back after each run.
+def benchmark_batch_sizes(model, X_train, y_train, batch_sizes=(1, 2, 5, 10, 20, 60), nepoch=5, learning_rate=0.01):
+    U, V, W = model.U.get_value(), model.V.get_value(), model.W.get_value()
+    results = []
+    for batch_size in batch_sizes:
+        # one step first, so compilation and warm-up are not timed
+        if batch_size > 1:
+            model.sgd_step_batch(X_train[:batch_size], y_train[:batch_size], learning_rate)
+        else:
+            model.sgd_step(X_train[0], y_train[0], learning_rate)
+        t1 = time.time()
+        train_with_sgd(model, X_train, y_train, learning_rate=learning_rate, nepoch=nepoch, evaluate_loss_after=0, batch_size=batch_size)
+        t2 = time.time()
+        examples_per_second = nepoch * len(y_train) / (t2 - t1)
+        results.append((batch_size, examples_per_second))
+        print "batch size %d: %.1f examples/second" % (batch_size, examples_per_second)
+        model.U.set_value(U)
+        model.V.set_value(V)
+        model.W.set_value(W)
+    return results
 
 # Create the training data
 x, y = cPickle.load(open('OnlyNPs_codeonly.cPickle', 'rb'))
@@ -50,6 +112,11 @@ model = RNNTheano(10, 333, hidden_dim = 30)
 #t2 = time.time()
 #print "SGD Step time: %f milliseconds" % ((t2 - t1) * 1000.)
 
+# Benchmark examples/second against mini-batch size instead of training (python train-theano.py benchmark)
+if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+    benchmark_batch_sizes(model, X_train, y_train)
+    sys.exit()
+
 # Train model for n epoches
 train_with_sgd(model, X_train, y_train, nepoch = 150, learning_rate = 0.01, evaluate_loss_after=1)
 